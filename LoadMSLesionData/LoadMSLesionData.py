@@ -1,13 +1,34 @@
+from __future__ import annotations
+import functools
 import logging
 import os
 from pathlib import Path
+import time
+from typing import TYPE_CHECKING, Optional
 import vtk
+import qt
 import slicer
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 from packages.utils.context_managers import TempDir, SetParameters, BlockMethod
-from packages.segmentation.segmentation import SegmentationDir, View, InvalidSegmentationDirError
-from packages.testing.test_segmentation_dir import SegmentationDirectoryTest
+from packages.utils.utils import MEBIBYTE
+from packages.segmentation.file_types import View, view_to_keys
+from packages.loading.navigation import NavigationScheduler
+from packages.profiling.profiler import PROFILER, profiled
+
+# Everything else is imported where it is first used, since this file is imported at every Slicer startup whether
+# or not the module is opened. packages.testing.test_startup checks the modules imported here and their cost.
+if TYPE_CHECKING:
+    from packages.batch.cohort_catalog import CatalogEntry, CatalogRefresh
+    from packages.batch.export import CohortExport, ExportConfig, PatientExport
+    from packages.batch.prewarm import CacheDirs, CohortReport
+    from packages.loading.cine import CineStats
+    from packages.loading.level_of_detail import LevelReport
+    from packages.segmentation.change_map import ChangeSummary
+    from packages.segmentation.segmentation import SegmentationDir
+    from packages.segmentation.validation import ValidationReport
+    from packages.statistics.lesion_statistics import LesionStatistics
+    from packages.statistics.lesion_tracking import LesionChange, LesionStatus
 #
 # LoadMSLesionData
 #
@@ -48,6 +69,15 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         VTKObservationMixin.__init__(self)  # needed for parameter node observation
         self.logic = None
         self.parameter_node = None
+        self.navigation_scheduler = None
+        # (index, label) of the last lesion jumped to with "Jump to Next Lesion".
+        self.tracked_lesion_position = None
+        # (view, index, RAS position) to jump the slice views to once that timepoint is loaded.
+        self.pending_jump = None
+        # Column the cohort catalog table is sorted by, and the folders of its rows.
+        self.catalog_order_by = "name"
+        self.catalog_descending = False
+        self.catalog_dir_paths = []
 
     def setup(self):
         """
@@ -67,6 +97,9 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         uiWidget.setMRMLScene(slicer.mrmlScene)
 
         self.logic = LoadMSLesionDataLogic()
+        self.navigation_scheduler = NavigationScheduler(
+            self.update_scene_from_parameter_node, on_running_changed=self.set_loading
+        )
 
         # Connections
 
@@ -81,6 +114,18 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.prevButton.connect("clicked(bool)", self.onPrevButton)
         self.ui.nextButton.connect("clicked(bool)", self.onNextButton)
         self.ui.btnCompare.connect("clicked(bool)", self.onCompareButton)
+        self.ui.btnChangeMap.connect("clicked(bool)", self.onChangeMapButton)
+        self.ui.btnComputeStatistics.connect("clicked(bool)", self.onComputeStatisticsButton)
+        self.ui.btnNextTrackedLesion.connect("clicked(bool)", self.onNextTrackedLesionButton)
+        self.ui.cmbLesionStatus.connect("currentIndexChanged(int)", self.onLesionStatusChanged)
+        self.ui.btnPlayCine.connect("toggled(bool)", self.onPlayCineButton)
+        self.ui.spnCineFps.connect("valueChanged(double)", self.logic.set_cine_fps)
+        self.ui.btnSideBySide.connect("toggled(bool)", self.onSideBySideButton)
+        self.ui.btnRefreshCatalog.connect("clicked(bool)", self.onRefreshCatalogButton)
+        self.ui.txtCatalogSearch.connect("textChanged(QString)", self.update_catalog_table)
+        self.ui.pthCatalogRoot.connect("currentPathChanged(QString)", self.update_catalog_table)
+        self.ui.tblCatalog.horizontalHeader().connect("sectionClicked(int)", self.onCatalogHeaderClicked)
+        self.ui.tblCatalog.connect("cellDoubleClicked(int, int)", self.onCatalogPatientDoubleClicked)
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
@@ -90,12 +135,18 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         Called when the application closes and the module widget is destroyed.
         """
         self.removeObservers()
+        if self.navigation_scheduler is not None:
+            self.navigation_scheduler.cancel()
+        self.pending_jump = None
+        if self.logic is not None:
+            self.logic.cleanup()
 
     def enter(self):
         """
         Called each time the user opens this module.
         """
-        pass
+        # The caches and worker pools are only created once the module is first used, not at Slicer startup.
+        self.logic.initialize()
         # Make sure parameter node exists and observed
         self.initializeParameterNode()
         # self.updateGUIFromParameterNode()
@@ -111,6 +162,8 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         """
         Called just before the scene is closed.
         """
+        # A load handling events between its stages stops at the next one instead of adding nodes to this scene.
+        self.navigation_scheduler.cancel()
         # Parameter node will be reset, do not use it anymore
         self.setParameterNode(None)
 
@@ -153,13 +206,26 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     def updateGUIFromParameterNode(self, caller=None, event=None):
         """
         This method is called whenever parameter node is changed.
-        The module GUI is updated to show the current state of the parameter node.
+        Loading and the GUI update are left to the navigation scheduler, so that a burst of changes only loads
+        the timepoint the parameter node ends up at.
         """
+        if self.parameter_node is None:
+            return
+        self.navigation_scheduler.request()
 
+    @profiled()
+    def update_scene_from_parameter_node(self):
+        """
+        Loads the current state of the parameter node, stopping early if it changes meanwhile, and updates the
+        module GUI to show it.
+        """
         if self.parameter_node is None:
             return
-        
-        self.logic.update_segmentation(self.parameter_node)
+
+        self.logic.update_segmentation(self.parameter_node, is_cancelled=self.navigation_scheduler.is_superseded)
+        if self.parameter_node is None or self.navigation_scheduler.pending:
+            # The scene was closed while loading, or the GUI will be updated once the newer target is loaded.
+            return
 
         # Make sure GUI changes do not call updateParameterNodeFromGUI (it could cause infinite loop)
         with BlockMethod(self, "updateParameterNodeFromGUI"):
@@ -168,6 +234,20 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
                 int(self.parameter_node.GetParameter("index"))
             )
             self.set_load_directory(self.parameter_node.GetParameter("intermediate_attempted_segmentation_dir_path"))
+        self.apply_pending_jump()
+
+    def apply_pending_jump(self) -> None:
+        """Jumps the slice views after loading, which would otherwise reset them when showing the new volume."""
+        if self.pending_jump is None:
+            return
+        view, index, position_ras = self.pending_jump
+        self.pending_jump = None
+        if (
+            self.logic.segmentation is not None
+            and View(int(self.parameter_node.GetParameter("view"))) == view
+            and int(self.parameter_node.GetParameter("index")) == index
+        ):
+            slicer.modules.markups.logic().JumpSlicesToLocation(*position_ras, True)
 
     def updateParameterNodeFromGUI(self, caller=None, event=None):
         """
@@ -181,8 +261,10 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
 
     def set_load_directory(self, dir_path: str):
-        if not os.path.isdir(dir_path):
-            self.ui.lblValidDirectoryPathWarning.setText("Please enter a valid directory path")
+        from packages.storage.storage import is_directory_location
+
+        if not is_directory_location(dir_path):
+            self.ui.lblValidDirectoryPathWarning.setText("Please enter a valid directory path or object store URL")
             self.ui.lblValidDirectoryPathWarning.setStyleSheet('color: red')
             self.ui.btnLoadDirectory.setEnabled(False)
             return
@@ -192,48 +274,235 @@ class LoadMSLesionDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.btnLoadDirectory.setEnabled(True)
 
 
+    def set_loading(self, loading: bool) -> None:
+        """
+        Disables the controls that change the scene while a load runs, as it handles user input between its stages.
+        Only navigation and loading another directory, which supersede the load, stay enabled.
+        """
+        for button in (
+            self.ui.btnComputeStatistics, self.ui.btnNextTrackedLesion, self.ui.btnPlayCine, self.ui.btnSideBySide
+        ):
+            button.setEnabled(not loading and self.logic.segmentation is not None)
+        self.ui.btnRefreshCatalog.setEnabled(not loading)
+
     def set_view_and_index(self, view: View, index: int) -> None:
-        if self.logic.segmentation is None:
+        self.set_loading(self.navigation_scheduler.running)
+        # Playback is stopped by the logic when another directory is loaded.
+        was_blocked = self.ui.btnPlayCine.blockSignals(True)
+        self.ui.btnPlayCine.checked = self.logic.cine_player is not None
+        self.ui.btnPlayCine.blockSignals(was_blocked)
+        self.ui.btnPlayCine.text = "Stop" if self.logic.cine_player is not None else "Play"
+        was_blocked = self.ui.btnSideBySide.blockSignals(True)
+        self.ui.btnSideBySide.checked = self.logic.is_side_by_side_shown()
+        self.ui.btnSideBySide.blockSignals(was_blocked)
+        self.ui.btnSideBySide.text = "Close Side by Side" if self.logic.is_side_by_side_shown() else "Show Side by Side"
+        self.ui.lblChangeSummary.setText("")
+        if self.logic.segmentation is None or self.logic.cine_player is not None or self.logic.is_side_by_side_shown():
             self.ui.btnCompare.text = "Compare with Previous Image"
             self.ui.nextButton.setEnabled(False)
             self.ui.prevButton.setEnabled(False)
             self.ui.btnCompare.setEnabled(False)
+            self.ui.btnChangeMap.setEnabled(False)
             return
         if view == View.STANDARD:
             self.ui.btnCompare.text = "Compare with Previous Image"
             self.ui.nextButton.setEnabled(self.logic.segmentation.index_is_valid_for_img(index + 1))
             self.ui.prevButton.setEnabled(self.logic.segmentation.index_is_valid_for_img(index - 1))
             self.ui.btnCompare.setEnabled(self.logic.segmentation.index_is_valid_for_sub_img(index - 1))
+            self.ui.btnChangeMap.setEnabled(self.logic.segmentation.index_is_valid_for_change_map(index - 1))
             return
-        if view == View.SUB:
+        if view in (View.SUB, View.CHANGE):
             self.ui.btnCompare.text = "Return to Standard View"
             self.ui.nextButton.setEnabled(False)
             self.ui.prevButton.setEnabled(False)
             self.ui.btnCompare.setEnabled(True)
-            return
+            self.ui.btnChangeMap.setEnabled(False)
+        if view == View.CHANGE and self.logic.segmentation.index_is_valid_for_change_map(index):
+            summary = self.logic.segmentation.get_change_summary(index)
+            self.ui.lblChangeSummary.setText(
+                f"New: {summary.new_voxels} voxels ({summary.new_ml:.2f} mL), "
+                f"resolved: {summary.resolved_voxels} voxels ({summary.resolved_ml:.2f} mL), "
+                f"persistent: {summary.persistent_voxels} voxels ({summary.persistent_ml:.2f} mL), "
+                f"net change: {summary.delta_voxels:+d} voxels ({summary.delta_ml:+.2f} mL)"
+            )
 
     def onBtnLoadDirectory(self):
         with SetParameters(self.parameter_node) as parameter_node:
             parameter_node.SetParameter("attempted_segmentation_dir_path", self.ui.pthLoadSegmentationDirectory.currentPath)
 
+    def target_view_and_index(self) -> tuple[View, int]:
+        # The latest target, which is ahead of self.logic.segmentation while a load is scheduled.
+        return View(int(self.parameter_node.GetParameter("view"))), int(self.parameter_node.GetParameter("index"))
+
     def onPrevButton(self):
-        self.parameter_node.SetParameter("index", str(self.logic.segmentation.index - 1))
+        view, index = self.target_view_and_index()
+        if view == View.STANDARD and self.logic.segmentation.index_is_valid_for_img(index - 1):
+            self.parameter_node.SetParameter("index", str(index - 1))
 
     def onNextButton(self):
-        self.parameter_node.SetParameter("index", str(self.logic.segmentation.index + 1))
+        view, index = self.target_view_and_index()
+        if view == View.STANDARD and self.logic.segmentation.index_is_valid_for_img(index + 1):
+            self.parameter_node.SetParameter("index", str(index + 1))
 
     def onCompareButton(self):
-        if self.logic.segmentation.view == View.STANDARD:
+        view, index = self.target_view_and_index()
+        if view == View.STANDARD and self.logic.segmentation.index_is_valid_for_sub_img(index - 1):
             with SetParameters(self.parameter_node) as parameter_node:
                 parameter_node.SetParameter("view", str(View.SUB.value))
-                parameter_node.SetParameter("index", str(self.logic.segmentation.index - 1))
+                parameter_node.SetParameter("index", str(index - 1))
             return
-        if self.logic.segmentation.view == View.SUB:
+        if view in (View.SUB, View.CHANGE):
             with SetParameters(self.parameter_node) as parameter_node:
                 parameter_node.SetParameter("view", str(View.STANDARD.value))
-                parameter_node.SetParameter("index", str(self.logic.segmentation.index + 1))
+                parameter_node.SetParameter("index", str(index + 1))
             return
 
+    def onChangeMapButton(self):
+        view, index = self.target_view_and_index()
+        if view == View.STANDARD and self.logic.segmentation.index_is_valid_for_change_map(index - 1):
+            with SetParameters(self.parameter_node) as parameter_node:
+                parameter_node.SetParameter("view", str(View.CHANGE.value))
+                parameter_node.SetParameter("index", str(index - 1))
+
+    def onComputeStatisticsButton(self):
+        with slicer.util.tryWithErrorDisplay("Failed to compute lesion statistics.", waitCursor=True):
+            self.set_statistics_table(self.logic.lesion_statistics())
+
+    def set_statistics_table(self, index_to_statistics: dict) -> None:
+        self.ui.tblLesionStatistics.setRowCount(len(index_to_statistics))
+        for row, (index, statistics) in enumerate(sorted(index_to_statistics.items())):
+            self.ui.tblLesionStatistics.setItem(row, 0, qt.QTableWidgetItem(str(index)))
+            self.ui.tblLesionStatistics.setItem(row, 1, qt.QTableWidgetItem(str(statistics.lesion_count)))
+            self.ui.tblLesionStatistics.setItem(row, 2, qt.QTableWidgetItem(f"{statistics.total_volume_ml:.3f}"))
+
+    def onPlayCineButton(self, checked):
+        if checked:
+            self.logic.start_cine(
+                self.ui.spnCineFps.value, self.ui.chkCineSegmentations.checked, on_frame=self.on_cine_frame
+            )
+        else:
+            self.logic.stop_cine()
+            self.ui.lblCineStatus.setText("")
+        self.set_view_and_index(*self.target_view_and_index())
+
+    def onSideBySideButton(self, checked):
+        if checked:
+            try:
+                indices = self.parse_timepoints(self.ui.txtSideBySideTimepoints.text)
+            except ValueError:
+                slicer.util.errorDisplay("Enter the timepoints to compare as numbers separated by commas, e.g. 0, 2, 4")
+                indices = []
+            else:
+                requested_indices, indices = indices, []
+                with slicer.util.tryWithErrorDisplay("Failed to show the timepoints side by side.", waitCursor=True):
+                    indices = self.logic.show_side_by_side(requested_indices)
+            self.ui.lblSideBySide.setText(
+                f"Showing images {', '.join(map(str, indices))}" if indices else "No images to show"
+            )
+        else:
+            self.logic.close_side_by_side()
+            self.ui.lblSideBySide.setText("")
+        self.set_view_and_index(*self.target_view_and_index())
+
+    def parse_timepoints(self, text: str):
+        """The comma separated indices in text, or None, for the default timepoints, if it is empty."""
+        if not text.strip():
+            return None
+        return [int(index) for index in text.split(",") if index.strip()]
+
+    def on_cine_frame(self, index):
+        stats = self.logic.cine_stats()
+        self.ui.lblCineStatus.setText(
+            f"Image {index}: {stats.achieved_fps:.1f} of {stats.target_fps:.1f} fps, "
+            f"{stats.frames_dropped} frames dropped"
+        )
+
+    def onRefreshCatalogButton(self):
+        root_dir = self.ui.pthCatalogRoot.currentPath
+        if not os.path.isdir(root_dir):
+            slicer.util.errorDisplay("Choose the directory that holds the patient folders")
+            return
+        with slicer.util.tryWithErrorDisplay("Failed to refresh the cohort catalog.", waitCursor=True):
+            self.ui.lblCatalog.setText(self.logic.refresh_catalog(root_dir).summary())
+        self.update_catalog_table()
+
+    def onCatalogHeaderClicked(self, column):
+        from packages.batch.cohort_catalog import SORT_COLUMNS
+
+        order_by = SORT_COLUMNS[column]
+        # Clicking the column the table is sorted by reverses the order.
+        self.catalog_descending = order_by == self.catalog_order_by and not self.catalog_descending
+        self.catalog_order_by = order_by
+        self.update_catalog_table()
+
+    def update_catalog_table(self, _=None):
+        from packages.batch.cohort_catalog import SORT_COLUMNS
+
+        root_dir = self.ui.pthCatalogRoot.currentPath
+        entries = self.logic.search_catalog(
+            root_dir if os.path.isdir(root_dir) else None,
+            self.ui.txtCatalogSearch.text,
+            self.catalog_order_by,
+            self.catalog_descending
+        )
+        self.catalog_dir_paths = [entry.dir_path for entry in entries]
+        table = self.ui.tblCatalog
+        table.setRowCount(len(entries))
+        for row, entry in enumerate(entries):
+            lesion_count = str(entry.lesion_count) if entry.lesion_count is not None else ""
+            lesion_volume = f"{entry.lesion_volume_ml:.3f}" if entry.lesion_volume_ml is not None else ""
+            cells = (
+                entry.name,
+                str(entry.timepoints),
+                f"{entry.sub_imgs}/{max(0, entry.timepoints - 1)}",
+                "Yes" if entry.valid else "No",
+                lesion_count,
+                lesion_volume,
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.modified_ns / 1e9)),
+            )
+            for column, text in enumerate(cells):
+                item = qt.QTableWidgetItem(text)
+                if entry.issues:
+                    item.setToolTip("\n".join(entry.issues))
+                table.setItem(row, column, item)
+        header = table.horizontalHeader()
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(
+            SORT_COLUMNS.index(self.catalog_order_by),
+            qt.Qt.DescendingOrder if self.catalog_descending else qt.Qt.AscendingOrder
+        )
+
+    def onCatalogPatientDoubleClicked(self, row, _column):
+        dir_path = self.catalog_dir_paths[row]
+        self.ui.pthLoadSegmentationDirectory.currentPath = dir_path
+        with SetParameters(self.parameter_node) as parameter_node:
+            parameter_node.SetParameter("attempted_segmentation_dir_path", dir_path)
+
+    def onLesionStatusChanged(self, _):
+        self.tracked_lesion_position = None
+        self.ui.lblTrackedLesion.setText("")
+
+    def onNextTrackedLesionButton(self):
+        from packages.statistics.lesion_tracking import LesionStatus
+
+        status = LesionStatus[self.ui.cmbLesionStatus.currentText.upper()]
+        with slicer.util.tryWithErrorDisplay("Failed to track lesions.", waitCursor=True):
+            change = self.logic.find_next_lesion_change(status, self.tracked_lesion_position)
+        if change is None:
+            self.ui.lblTrackedLesion.setText(f"No {status.name.lower()} lesions")
+            return
+        self.tracked_lesion_position = (change.index, change.label)
+        self.ui.lblTrackedLesion.setText(
+            f"Image {change.index}: {change.volume_ml:.3f} mL (previously {change.previous_volume_ml:.3f} mL)"
+        )
+        self.pending_jump = (View.STANDARD, change.index, change.centroid_ras)
+        with SetParameters(self.parameter_node) as parameter_node:
+            parameter_node.SetParameter("view", str(View.STANDARD.value))
+            parameter_node.SetParameter("index", str(change.index))
+        if not self.navigation_scheduler.pending:
+            # The timepoint is already shown, so nothing is loaded.
+            self.apply_pending_jump()
+
 
 #
 # LoadMSLesionDataLogic
@@ -249,12 +518,391 @@ class LoadMSLesionDataLogic(ScriptedLoadableModuleLogic):
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
     """
 
-    def __init__(self):
+    def __init__(
+        self, prefetch_radius=1, memory_budget_mb=2048, volume_cache_size_mb=10240, decode_workers=4,
+        object_store_cache_mb=10240, surface_detail_levels=None, interactive_triangle_budget=200_000,
+        subtraction_cache_size_mb=10240
+    ):
         """
         Called when the logic class is instantiated. Can be used for initializing member variables.
+        Pass volume_cache_size_mb=None to disable the on-disk cache of decoded volumes.
+        decode_workers threads decode files ahead of time, and the timepoints shown side by side concurrently.
+        Files of patient folders opened from an object store are cached locally, up to object_store_cache_mb.
+        Subtraction images computed for folders without img_sub_{k} files are cached up to subtraction_cache_size_mb.
+        Lesion surfaces are also built at each of surface_detail_levels, (fraction of triangles removed, smoothing
+        iterations) pairs that default to DEFAULT_DETAIL_LEVELS, which are shown while a 3D view is rotated if the
+        visible surfaces have more than interactive_triangle_budget triangles. Pass () to always show full detail.
+        The caches and worker pools are created by initialize(), when the module is first entered or used.
         """
         ScriptedLoadableModuleLogic.__init__(self)
+        self.prefetch_radius = prefetch_radius
+        self.memory_budget_mb = memory_budget_mb
+        self.volume_cache_size_mb = volume_cache_size_mb
+        self.decode_workers = decode_workers
+        self.object_store_cache_mb = object_store_cache_mb
+        self.surface_detail_levels = surface_detail_levels
+        self.interactive_triangle_budget = interactive_triangle_budget
+        self.subtraction_cache_size_mb = subtraction_cache_size_mb
+        # (endpoint, bucket) to the ObjectStoreStorage of the patient folders opened from it.
+        self.object_stores = {}
+        self.initialized = False
         self.segmentation = None
+        self.cine_player = None
+        # The one image and labelmap node that playback swaps every frame into.
+        self.cine_volume_node = None
+        self.cine_labelmap_node = None
+        # (segmentation, future) of the listing of an object store folder being made by on_directory_changed.
+        self.pending_listing = None
+
+    def initialize(self) -> None:
+        """Creates the caches, worker pools and directory watcher, unless they were already created."""
+        if self.initialized:
+            return
+        from packages.batch.cohort_catalog import CohortCatalog
+        from packages.cache.node_cache import NodeCache
+        from packages.cache.paths import default_cache_dir
+        from packages.cache.pyramid_cache import PyramidCache
+        from packages.cache.surface_cache import DEFAULT_DETAIL_LEVELS, DetailLevel, SurfaceBuilder
+        from packages.cache.volume_cache import VolumeCache
+        from packages.loading.compare_layout import CompareLayout
+        from packages.loading.level_of_detail import LevelOfDetail
+        from packages.loading.prefetch import Prefetcher
+        from packages.loading.progressive import ProgressiveLoader
+        from packages.segmentation.change_map import ChangeMaps
+        from packages.segmentation.dir_watcher import DirectoryWatcher
+        from packages.segmentation.subtraction import SubtractionImages
+        from packages.statistics.lesion_statistics import LesionStatisticsEngine
+        from packages.statistics.lesion_tracking import LesionTracker
+
+        with PROFILER.span("LoadMSLesionDataLogic.initialize"):
+            self.volume_cache = None
+            if self.volume_cache_size_mb is not None:
+                self.volume_cache = VolumeCache(
+                    default_cache_dir("volumes"), max_bytes=self.volume_cache_size_mb * MEBIBYTE
+                )
+            self.prefetcher = Prefetcher(radius=self.prefetch_radius, max_workers=self.decode_workers)
+            self.progressive_loader = ProgressiveLoader(PyramidCache(default_cache_dir("pyramids")))
+            self.subtraction_images = SubtractionImages(
+                cache_dir=default_cache_dir("subtractions"),
+                volume_cache=self.volume_cache,
+                max_bytes=self.subtraction_cache_size_mb * MEBIBYTE
+            )
+            self.change_maps = ChangeMaps(cache_dir=default_cache_dir("change_maps"))
+            self.node_cache = NodeCache(budget_bytes=self.memory_budget_mb * MEBIBYTE)
+            detail_levels = (
+                DEFAULT_DETAIL_LEVELS if self.surface_detail_levels is None
+                else tuple(DetailLevel(*detail_level) for detail_level in self.surface_detail_levels)
+            )
+            self.level_of_detail = (
+                LevelOfDetail(detail_levels, self.interactive_triangle_budget) if detail_levels else None
+            )
+            self.surface_builder = SurfaceBuilder(
+                cache_dir=default_cache_dir("surfaces"), level_of_detail=self.level_of_detail
+            )
+            self.statistics_engine = LesionStatisticsEngine(cache_dir=default_cache_dir("statistics"))
+            self.lesion_tracker = LesionTracker(self.statistics_engine)
+            self.dir_watcher = DirectoryWatcher(self.on_directory_changed)
+            self.listing_timer = qt.QTimer()
+            self.listing_timer.setSingleShot(True)
+            self.listing_timer.setInterval(50)
+            self.listing_timer.connect("timeout()", self.apply_listing)
+            self.compare_layout = CompareLayout()
+            self.catalog = CohortCatalog(default_cache_dir("catalog") / "catalog.sqlite", self.statistics_engine)
+        self.initialized = True
+
+    def cleanup(self):
+        if not self.initialized:
+            return
+        self.stop_cine()
+        self.close_side_by_side()
+        self.prefetcher.shutdown()
+        self.progressive_loader.shutdown()
+        self.surface_builder.shutdown()
+        if self.level_of_detail is not None:
+            self.level_of_detail.shutdown()
+        self.node_cache.close()
+        self.dir_watcher.unwatch()
+        self.listing_timer.stop()
+        self.pending_listing = None
+        self.catalog.close()
+        for storage in self.object_stores.values():
+            storage.shutdown()
+
+    def set_prefetch_radius(self, radius: int) -> None:
+        self.initialize()
+        self.prefetcher.radius = radius
+
+    def set_progressive(self, enabled: bool) -> None:
+        """Shows a downsampled preview of timepoints that are not loaded yet, when one is cached, before the full resolution."""
+        self.initialize()
+        self.progressive_loader.enabled = enabled
+
+    def set_memory_budget(self, memory_budget_mb: int) -> None:
+        self.initialize()
+        self.node_cache.budget_bytes = memory_budget_mb * MEBIBYTE
+        self.node_cache.evict(protected_keys=self.current_keys())
+
+    def current_keys(self) -> tuple:
+        if self.segmentation is None or self.segmentation.index is None:
+            return ()
+        return view_to_keys(self.segmentation.view, self.segmentation.index)
+
+    def cache_stats(self) -> dict:
+        """
+        Memory used by loaded nodes, the memory budget, node cache hit/miss counters, and the compression ratio of
+        the labelmaps decoded ahead of time for the loaded directory (None until one was).
+        """
+        self.initialize()
+        stats = self.node_cache.stats()
+        stats["labelmap_compression_ratio"] = (
+            self.segmentation.labelmap_compression.ratio if self.segmentation is not None else None
+        )
+        # Requests, bytes received and bytes cached for a directory opened from an object store.
+        stats["storage"] = self.segmentation.storage.stats() if self.segmentation is not None else {}
+        stats["surface_levels"] = [vars(level_report) for level_report in self.surface_detail_report()]
+        return stats
+
+    def surface_detail_report(self) -> list[LevelReport]:
+        """Triangles and memory of the lesion surfaces of the loaded timepoints at each level of detail, full first."""
+        self.initialize()
+        if self.level_of_detail is None:
+            return []
+        return self.level_of_detail.report()
+
+    def get_cache_dirs(self) -> CacheDirs:
+        from packages.batch.prewarm import CacheDirs
+
+        self.initialize()
+        cache_dirs = CacheDirs()
+        if self.volume_cache is not None:
+            cache_dirs.volumes = str(self.volume_cache.cache_dir)
+            cache_dirs.volumes_max_bytes = self.volume_cache.max_bytes
+        if self.surface_builder.surface_cache is not None:
+            cache_dirs.surfaces = str(self.surface_builder.surface_cache.cache_dir)
+            cache_dirs.surface_detail_levels = self.surface_builder.detail_levels
+        if self.statistics_engine.cache_dir is not None:
+            cache_dirs.statistics = str(self.statistics_engine.cache_dir)
+        cache_dirs.pyramids = str(self.progressive_loader.pyramid_cache.cache_dir)
+        if self.subtraction_images.cache_dir is not None:
+            cache_dirs.subtractions = str(self.subtraction_images.cache_dir)
+            cache_dirs.subtractions_max_bytes = self.subtraction_images.max_bytes
+        return cache_dirs
+
+    def lesion_statistics(self) -> dict[int, LesionStatistics]:
+        """Lesion count, total volume and per-lesion volume and centroid for every timepoint of the loaded directory."""
+        if self.segmentation is None:
+            return {}
+        index_to_statistics = self.statistics_engine.get_for_segmentation_dir(self.segmentation)
+        last_statistics = index_to_statistics[max(index_to_statistics)]
+        self.catalog.set_lesion_summary(
+            self.segmentation.dir_path, last_statistics.lesion_count, last_statistics.total_volume_ml
+        )
+        return index_to_statistics
+
+    def lesion_changes(self) -> dict[int, list[LesionChange]]:
+        """New, enlarging, shrinking, stable and resolved lesions from img_{index - 1} to img_{index}, by index."""
+        if self.segmentation is None:
+            return {}
+        return self.lesion_tracker.track(self.segmentation)
+
+    def lesion_change_summaries(self) -> dict[int, ChangeSummary]:
+        """
+        New, resolved and persistent lesion voxels and volumes from img_{index} to img_{index + 1}, by index, from
+        the cached change maps when they were computed before.
+        """
+        if self.segmentation is None:
+            return {}
+        return self.segmentation.change_summaries()
+
+    def find_next_lesion_change(self, status: LesionStatus, after=None):
+        if self.segmentation is None:
+            return None
+        return self.lesion_tracker.find_next(self.segmentation, status, after)
+
+    def prewarm_cohort(self, root_dir: str, max_workers=None) -> CohortReport:
+        """
+        Validates every patient folder in root_dir and fills the module's caches for it, in parallel worker
+        processes. Does not need the GUI, so it can be scheduled with e.g.
+        Slicer --no-main-window --python-code "slicer.util.getModuleLogic('LoadMSLesionData').prewarm_cohort('/data'); exit()"
+        """
+        from packages.batch.prewarm import prewarm_cohort
+
+        return prewarm_cohort(root_dir, self.get_cache_dirs(), max_workers=max_workers)
+
+    def export_cohort(self, root_dir: str, out_dir: str, config: Optional[ExportConfig] = None,
+                      max_workers=None) -> CohortExport:
+        """
+        Exports slice snapshots and 3D renders of every timepoint and subtraction image of each patient folder in
+        root_dir, with a report.html and report.json per patient, to out_dir/<patient>, in parallel worker processes.
+        Rendering is offscreen, so it can be run overnight with e.g.
+        Slicer --no-main-window --python-code "slicer.util.getModuleLogic('LoadMSLesionData').export_cohort('/data', '/export'); exit()"
+        """
+        from packages.batch.export import export_cohort
+
+        return export_cohort(root_dir, out_dir, self.get_cache_dirs(), config, max_workers=max_workers)
+
+    def export_patient(self, dir_path: str, out_dir: str, config: Optional[ExportConfig] = None) -> PatientExport:
+        """Exports one patient folder like export_cohort, in this process."""
+        from packages.batch.export import ExportConfig, export_patient
+
+        return export_patient(dir_path, out_dir, self.get_cache_dirs(), config if config is not None else ExportConfig())
+
+    def start_cine(self, fps=4.0, show_segmentations=True, buffer_size=8, on_frame=None) -> bool:
+        """
+        Plays the timepoints of the loaded directory in a loop at fps frames per second, from the one shown. Up to
+        buffer_size timepoints are decoded ahead in the background, and every frame is swapped into the same pair
+        of image and labelmap nodes. on_frame(index) is called after each frame is shown. Returns False if there
+        is nothing to play.
+        """
+        from packages.loading.cine import CinePlayer
+
+        self.stop_cine()
+        self.close_side_by_side()
+        if self.segmentation is None or not self.segmentation.frame_indices():
+            return False
+        # Playback shows segmentations through its labelmap node instead.
+        self.segmentation.hide_visible_segmentation_node()
+        self.cine_player = CinePlayer(
+            self.segmentation.frame_indices(),
+            functools.partial(self.segmentation.decode_frame, with_segmentation=show_segmentations),
+            functools.partial(self.show_cine_frame, on_frame=on_frame),
+            fps=fps,
+            buffer_size=buffer_size
+        )
+        self.cine_player.start(self.segmentation.index if self.segmentation.view == View.STANDARD else None)
+        return True
+
+    def show_cine_frame(self, index, frame, on_frame=None) -> None:
+        from packages.loading.nodes import create_volume_node, replace_volume_image
+        from packages.loading.sparse_labelmap import to_dense
+
+        volume, labelmap = frame
+        created = False
+        if self.cine_volume_node is None:
+            self.cine_volume_node = create_volume_node(volume, "cine")
+            created = True
+        else:
+            replace_volume_image(self.cine_volume_node, volume)
+        if labelmap is not None:
+            labelmap = to_dense(labelmap)
+            if self.cine_labelmap_node is None:
+                self.cine_labelmap_node = create_volume_node(labelmap, "cine_segmentation", "vtkMRMLLabelMapVolumeNode")
+                created = True
+            else:
+                replace_volume_image(self.cine_labelmap_node, labelmap)
+        if created:
+            selection_node = slicer.app.applicationLogic().GetSelectionNode()
+            selection_node.SetActiveVolumeID(self.cine_volume_node.GetID())
+            selection_node.SetActiveLabelVolumeID(
+                self.cine_labelmap_node.GetID() if self.cine_labelmap_node is not None else None
+            )
+            slicer.app.applicationLogic().PropagateVolumeSelection()
+        if on_frame is not None:
+            on_frame(index)
+
+    def set_cine_fps(self, fps: float) -> None:
+        if self.cine_player is not None:
+            self.cine_player.set_fps(fps)
+
+    def cine_stats(self) -> Optional[CineStats]:
+        """Frames shown and dropped, and the frame rate achieved, since playback started or None if it is stopped."""
+        if self.cine_player is None:
+            return None
+        return self.cine_player.stats()
+
+    def stop_cine(self) -> None:
+        """Stops playback, removes its nodes and shows the timepoint that was shown before again."""
+        if self.cine_player is None:
+            return
+        self.cine_player.shutdown()
+        self.cine_player = None
+        for node in (self.cine_volume_node, self.cine_labelmap_node):
+            if node is not None:
+                slicer.mrmlScene.RemoveNode(node)
+        self.cine_volume_node = None
+        self.cine_labelmap_node = None
+        slicer.app.applicationLogic().GetSelectionNode().SetActiveLabelVolumeID(None)
+        self.reload_current_index()
+
+    def show_side_by_side(self, indices=None, max_views=4) -> list[int]:
+        """
+        Shows the timepoints img_{index} of indices, by default the last max_views, side by side in linked slice
+        views, and returns the indices shown. The timepoints that are not loaded yet are loaded concurrently.
+        """
+        self.stop_cine()
+        self.close_side_by_side()
+        if self.segmentation is None:
+            return []
+        if indices is None:
+            indices = self.segmentation.frame_indices()[-max_views:]
+        indices = [index for index in indices if self.segmentation.index_is_valid_for_img(index)][:max_views]
+        if not indices:
+            return []
+        self.segmentation.hide_visible_segmentation_node()
+        self.compare_layout.show(self.segmentation.load_indices(indices))
+        return indices
+
+    def close_side_by_side(self) -> None:
+        """Restores the previous layout and shows the timepoint that was shown before again."""
+        if not self.is_side_by_side_shown():
+            return
+        self.compare_layout.close()
+        self.reload_current_index()
+
+    def is_side_by_side_shown(self) -> bool:
+        return self.initialized and self.compare_layout.is_shown
+
+    def reload_current_index(self) -> None:
+        if self.segmentation is not None and self.segmentation.index is not None:
+            self.segmentation.load_index(self.segmentation.view, self.segmentation.index)
+
+    def validate_directory(self, dir_path=None) -> ValidationReport:
+        """
+        Checks that the images and segmentations of dir_path, by default the loaded directory, match each other
+        and the previous timepoint in shape, spacing, orientation and origin, reading only file headers.
+        """
+        from packages.segmentation.validation import validate_cohort
+
+        if dir_path is None:
+            if self.segmentation is None:
+                raise ValueError("No directory is loaded")
+            return self.segmentation.validate_headers()
+        return validate_cohort([dir_path])[0]
+
+    def validate_cohort(self, root_dir: str, max_workers=16) -> list[ValidationReport]:
+        """validate_directory for every patient folder in root_dir, reading only file headers, in parallel."""
+        from packages.batch.prewarm import find_patient_dirs
+        from packages.segmentation.validation import validate_cohort
+
+        return validate_cohort(find_patient_dirs(root_dir), max_workers=max_workers)
+
+    def refresh_catalog(self, root_dir: str, max_workers=8) -> CatalogRefresh:
+        """
+        Adds the patient folders in root_dir to the cohort catalog, and rescans the ones that changed since, in
+        parallel, reading only file headers.
+        """
+        self.initialize()
+        return self.catalog.refresh(root_dir, max_workers=max_workers)
+
+    def search_catalog(self, root_dir=None, text="", order_by="name", descending=False) -> list[CatalogEntry]:
+        """The catalogued patients of root_dir, or of every cohort, whose folder name contains text."""
+        self.initialize()
+        return self.catalog.search(root_dir, text, order_by, descending)
+
+    def set_profiling_enabled(self, enabled: bool) -> None:
+        """
+        Records timing spans of the loading hot path, including background decodes, from now on.
+        Profiling can also be enabled from startup by setting the LOADMSLESIONDATA_PROFILE=1 environment variable.
+        """
+        if enabled:
+            PROFILER.enable()
+        else:
+            PROFILER.disable()
+
+    def export_profile(self, trace_path: str) -> str:
+        """Writes the recorded spans to trace_path as Chrome trace-event JSON, and returns a per-span summary."""
+        PROFILER.export_chrome_trace(trace_path)
+        return PROFILER.format_summary()
 
     def set_default_params(self, parameter_node, override=False):
         """
@@ -285,14 +933,23 @@ class LoadMSLesionDataLogic(ScriptedLoadableModuleLogic):
             if override or not parameter_node.GetParameter(param):
                 parameter_node.SetParameter(param, value)
 
-    def update_segmentation(self, parameter_node):
+    @profiled()
+    def update_segmentation(self, parameter_node, is_cancelled=None):
+        """
+        Loads the directory, view and index of the parameter node. is_cancelled is checked between loading stages,
+        and loading stops early once it returns True.
+        """
+        from packages.segmentation.segmentation import InvalidSegmentationDirError
+        from packages.storage.storage import is_directory_location
+
+        self.initialize()
         def compare_seg_dir_and_attempted_seg_dir():
             seg_dir_path = parameter_node.GetParameter("segmentation_dir_path")
             attempted_seg_dir_path = parameter_node.GetParameter("attempted_segmentation_dir_path")
 
             if seg_dir_path == attempted_seg_dir_path:
                 return
-            if not os.path.isdir(attempted_seg_dir_path):
+            if not is_directory_location(attempted_seg_dir_path):
                 return
             with SetParameters(parameter_node) as param_node:
                 param_node.SetParameter("segmentation_dir_path", attempted_seg_dir_path)
@@ -303,18 +960,22 @@ class LoadMSLesionDataLogic(ScriptedLoadableModuleLogic):
             if self.segmentation is None:
                 return parameter_node.GetParameter("segmentation_dir_path") != "none"
 
-            return not self.segmentation.dir_path == parameter_node.GetParameter("segmentation_dir_path")
+            return not self.segmentation.location == parameter_node.GetParameter("segmentation_dir_path")
 
         def update_seg_dir():
             if not seg_dir_modified():
                 return
+            self.stop_cine()
+            self.close_side_by_side()
             if self.segmentation is not None:
                 self.segmentation.unload()
+            self.prefetcher.reset()
             try:
-                self.segmentation = SegmentationDir(parameter_node.GetParameter("segmentation_dir_path"))
-            except InvalidSegmentationDirError as e:
+                self.segmentation = self.create_segmentation_dir(parameter_node.GetParameter("segmentation_dir_path"))
+            except (InvalidSegmentationDirError, OSError, ValueError) as e:
                 logging.warn(str(e))
                 self.segmentation = None
+                self.dir_watcher.unwatch()
                 with SetParameters(parameter_node) as param_node:
                     self.set_segmentation_default_params(param_node, override=True)
                     param_node.SetParameter("attempted_segmentation_dir_path", "none")
@@ -322,20 +983,137 @@ class LoadMSLesionDataLogic(ScriptedLoadableModuleLogic):
         compare_seg_dir_and_attempted_seg_dir()
         update_seg_dir()
         
-        if self.segmentation is not None:
-            self.segmentation.load_index(
-                View(int(parameter_node.GetParameter("view"))),
-                int(parameter_node.GetParameter("index"))
+        view, index = View(int(parameter_node.GetParameter("view"))), int(parameter_node.GetParameter("index"))
+        if self.segmentation is not None and self.segmentation.index_is_valid(view, index):
+            self.load_index(view, index, is_cancelled)
+
+    @profiled()
+    def create_segmentation_dir(self, dir_path) -> SegmentationDir:
+        from packages.segmentation.segmentation import SegmentationDir
+
+        self.initialize()
+        storage, dir_path = self.open_storage(dir_path)
+        # Patients in the cohort catalog are opened from their stored path table and validation results.
+        dir_index = self.catalog.directory_index(dir_path) if storage.is_local else None
+        segmentation = SegmentationDir(
+            dir_path,
+            prefetcher=self.prefetcher,
+            node_cache=self.node_cache,
+            surface_builder=self.surface_builder,
+            volume_cache=self.volume_cache,
+            subtraction_images=self.subtraction_images,
+            progressive_loader=self.progressive_loader,
+            dir_index=dir_index,
+            storage=storage,
+            change_maps=self.change_maps
+        )
+        self.watch(segmentation)
+        if dir_index is not None:
+            issues = self.catalog.get(dir_path).issues
+        else:
+            issues = [issue.message for issue in segmentation.validate_headers().issues]
+        for issue in issues:
+            logging.warning(f"{segmentation.dir_path}: {issue}")
+        return segmentation
+
+    def open_storage(self, location: str):
+        """
+        The storage of the patient folder at location, a local path or an object store URL, and the local path
+        that SegmentationDir reads it from.
+        """
+        from packages.cache.paths import default_cache_dir
+        from packages.storage.object_store import ObjectStoreStorage, parse_object_store_url
+        from packages.storage.storage import LocalStorage, is_object_store_url
+
+        if not is_object_store_url(location):
+            return LocalStorage(), location
+        endpoint, bucket, _ = parse_object_store_url(location)
+        storage = self.object_stores.get((endpoint, bucket))
+        if storage is None:
+            storage = ObjectStoreStorage(
+                endpoint,
+                bucket,
+                default_cache_dir("object_store"),
+                max_bytes=self.object_store_cache_mb * MEBIBYTE,
+                max_workers=2 * self.decode_workers
             )
+            self.object_stores[(endpoint, bucket)] = storage
+        return storage, storage.local_dir(location)
 
-    def load_index(self, view: View, index: int) -> None:
-        self.segmentation.load_index(view, index)
+    def watch(self, segmentation: SegmentationDir) -> None:
+        # The local copies of files in an object store are written by fetching them, so only their listing is polled.
+        file_paths = segmentation.dir_index.all_paths() if segmentation.storage.is_local else ()
+        self.dir_watcher.watch(segmentation.dir_path, file_paths)
 
+    def on_directory_changed(self) -> None:
+        """
+        Applies files added, removed or rewritten in the loaded directory, e.g. new timepoints written by a pipeline,
+        without reloading anything else, and has the GUI updated through the parameter node.
+        """
+        if self.segmentation is None:
+            return
+        if not self.segmentation.storage.is_local:
+            # Listing an object store is an HTTP request, so it is not made on the main thread.
+            if self.pending_listing is None:
+                self.pending_listing = (
+                    self.segmentation, self.segmentation.storage.executor.submit(self.segmentation.dir_index.list_files)
+                )
+                self.listing_timer.start()
+            return
+        self.rescan()
+
+    def apply_listing(self) -> None:
+        segmentation, future = self.pending_listing
+        if not future.done():
+            self.listing_timer.start()
+            return
+        self.pending_listing = None
+        # Dropped if another directory was loaded meanwhile.
+        if segmentation is not self.segmentation or future.cancelled():
+            return
+        try:
+            listing = future.result()
+        except OSError as e:
+            logging.warning(f"Could not rescan {segmentation.dir_path}: {e}")
+            return
+        self.rescan(listing)
+
+    def rescan(self, listing: Optional[tuple[dict, dict]] = None) -> None:
+        try:
+            changes = self.segmentation.rescan(listing)
+        except OSError as e:
+            logging.warning(f"Could not rescan {self.segmentation.dir_path}: {e}")
+            return
+        if not changes:
+            return
+        self.watch(self.segmentation)
+
+        parameter_node = self.getParameterNode()
+        view, index = View(int(parameter_node.GetParameter("view"))), int(parameter_node.GetParameter("index"))
+        with SetParameters(parameter_node) as param_node:
+            if not self.segmentation.index_is_valid(view, index):
+                param_node.SetParameter("view", str(View.STANDARD.value))
+                param_node.SetParameter("index", "0")
+            # Changed so that observers reload the current timepoint if its files changed, and update the GUI.
+            revision = int(param_node.GetParameter("directory_revision") or "0")
+            param_node.SetParameter("directory_revision", str(revision + 1))
+
+    @profiled()
+    def load_index(self, view: View, index: int, is_cancelled=None) -> None:
+        if not self.segmentation.load_index(view, index, is_cancelled):
+            # Superseded by a newer target, which will prefetch around itself.
+            return
+        with PROFILER.span("Prefetcher.prefetch_around"):
+            self.prefetcher.prefetch_around(self.segmentation, view, index)
+
+    @profiled()
     def load_dir(self, dir_path) -> None:
+        self.initialize()
         if self.segmentation is not None:
             self.segmentation.unload()
+        self.prefetcher.reset()
 
-        self.segmentation = SegmentationDir(dir_path)
+        self.segmentation = self.create_segmentation_dir(dir_path)
         self.load_index(View.STANDARD, 0)
 
 
@@ -361,7 +1139,56 @@ class LoadMSLesionDataTest(ScriptedLoadableModuleTest):
         self.delayDisplay("Starting the test")
         logging.disable(logging.CRITICAL)
         self.setUp()
+        # Imported here so that test code is not loaded at Slicer startup.
+        from packages.testing.test_segmentation_dir import SegmentationDirectoryTest
+        from packages.testing.test_dir_index import DirectoryIndexTest
+        from packages.testing.test_lesion_statistics import LesionStatisticsTest
+        from packages.testing.test_lesion_tracking import LesionTrackingTest
+        from packages.testing.test_subtraction import SubtractionImagesTest
+        from packages.testing.test_profiler import ProfilerTest
+        from packages.testing.test_benchmark import BenchmarkTest
+        from packages.testing.test_navigation import NavigationSchedulerTest
+        from packages.testing.test_node_cache import NodeCacheTest
+        from packages.testing.test_pyramid import PyramidTest
+        from packages.testing.test_sparse_labelmap import SparseLabelmapTest
+        from packages.testing.test_cine import CinePlayerTest
+        from packages.testing.test_compare_layout import CompareLayoutTest
+        from packages.testing.test_validation import ValidationTest
+        from packages.testing.test_startup import StartupTest
+        from packages.testing.test_catalog import CatalogTest
+        from packages.testing.test_storage import StorageTest
+        from packages.testing.test_level_of_detail import LevelOfDetailTest
+        from packages.testing.test_export import ExportTest
+        from packages.testing.test_change_map import ChangeMapTest
+        from packages.testing.test_volume_cache import VolumeCacheTest
+        from packages.testing.test_prefetch import PrefetchTest
+        from packages.testing.test_prewarm import PrewarmTest
+        from packages.testing.test_surface_cache import SurfaceCacheTest
+
         with TempDir(Path(__file__).parent.parent / "temp_test_assets") as temp_dir_path:
             SegmentationDirectoryTest(temp_dir_path).runTest()
+            DirectoryIndexTest(temp_dir_path).runTest()
+            LesionStatisticsTest(temp_dir_path).runTest()
+            LesionTrackingTest(temp_dir_path).runTest()
+            SubtractionImagesTest(temp_dir_path).runTest()
+            ProfilerTest(temp_dir_path).runTest()
+            BenchmarkTest(temp_dir_path).runTest()
+            NavigationSchedulerTest(temp_dir_path).runTest()
+            NodeCacheTest(temp_dir_path).runTest()
+            PyramidTest(temp_dir_path).runTest()
+            SparseLabelmapTest(temp_dir_path).runTest()
+            CinePlayerTest(temp_dir_path).runTest()
+            CompareLayoutTest(temp_dir_path).runTest()
+            ValidationTest(temp_dir_path).runTest()
+            StartupTest(temp_dir_path).runTest()
+            CatalogTest(temp_dir_path).runTest()
+            StorageTest(temp_dir_path).runTest()
+            LevelOfDetailTest(temp_dir_path).runTest()
+            ExportTest(temp_dir_path).runTest()
+            ChangeMapTest(temp_dir_path).runTest()
+            VolumeCacheTest(temp_dir_path).runTest()
+            PrefetchTest(temp_dir_path).runTest()
+            PrewarmTest(temp_dir_path).runTest()
+            SurfaceCacheTest(temp_dir_path).runTest()
         logging.disable(logging.NOTSET)
         self.delayDisplay('Test passed')
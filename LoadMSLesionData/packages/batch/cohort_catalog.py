@@ -0,0 +1,319 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import time
+from typing import Optional
+from packages.segmentation.dir_index import DirectoryIndex
+from packages.segmentation.file_types import FileType
+
+# Bumped whenever the tables change, which drops a catalog written by an older version so that it is rebuilt.
+CATALOG_VERSION = 1
+# Columns the catalog can be sorted by. Used in ORDER BY, so only these names are accepted.
+SORT_COLUMNS = ("name", "timepoints", "sub_imgs", "valid", "lesion_count", "lesion_volume_ml", "modified_ns")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    dir_path TEXT PRIMARY KEY,
+    root_dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dir_mtime_ns INTEGER NOT NULL,
+    timepoints INTEGER NOT NULL,
+    sub_imgs INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    issues TEXT NOT NULL,
+    lesion_count INTEGER,
+    lesion_volume_ml REAL,
+    modified_ns INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patients_root_dir ON patients (root_dir);
+CREATE TABLE IF NOT EXISTS files (
+    dir_path TEXT NOT NULL REFERENCES patients (dir_path) ON DELETE CASCADE,
+    file_type TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (dir_path, file_type, file_index)
+);
+"""
+
+
+@dataclass
+class CatalogEntry:
+    dir_path: str
+    name: str
+    timepoints: int
+    # Timepoint pairs with an img_sub file; the others are computed when they are first shown, if they can be.
+    sub_imgs: int
+    valid: bool
+    issues: list[str] = field(default_factory=list)
+    # Lesion count and volume of the last timepoint, if its statistics were computed before, else None.
+    lesion_count: Optional[int] = None
+    lesion_volume_ml: Optional[float] = None
+    # Latest modification time of the folder and its files.
+    modified_ns: int = 0
+
+    @property
+    def has_all_sub_imgs(self) -> bool:
+        return self.sub_imgs >= self.timepoints - 1
+
+
+@dataclass
+class PatientScan:
+    entry: CatalogEntry
+    dir_mtime_ns: int
+    # (FileType, index, path, size, mtime_ns) of every file of the folder.
+    files: list[tuple] = field(default_factory=list)
+
+
+@dataclass
+class CatalogRefresh:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Catalog refreshed in {self.seconds:.1f} s: {self.added} added, {self.updated} updated, "
+            f"{self.removed} removed, {self.unchanged} unchanged"
+        )
+
+
+def is_unchanged(dir_path: str, dir_mtime_ns: int, path_to_stat: dict) -> bool:
+    """
+    Whether a folder and its files still have the modification time and sizes stored for them. Adding or removing a
+    file changes the folder's modification time, and rewriting one changes its own, so nothing else is read.
+    """
+    try:
+        if os.stat(dir_path).st_mtime_ns != dir_mtime_ns:
+            return False
+        for path, (size, mtime_ns) in path_to_stat.items():
+            stat = os.stat(path)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                return False
+    except OSError:
+        return False
+    return True
+
+
+def scan_patient(dir_path: str, statistics_engine=None) -> PatientScan:
+    """Indexes and validates one patient folder, reading only file headers. Runs on a worker thread."""
+    # Imported here, since it imports slicer.
+    from packages.segmentation.segmentation import InvalidSegmentationDirError, SegmentationDir
+
+    name = Path(dir_path).name
+    dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+    try:
+        segmentation_dir = SegmentationDir(dir_path)
+    except InvalidSegmentationDirError as e:
+        entry = CatalogEntry(dir_path, name, timepoints=0, sub_imgs=0, valid=False, issues=[str(e)])
+        return PatientScan(entry, dir_mtime_ns)
+
+    dir_index = segmentation_dir.dir_index
+    report = segmentation_dir.validate_headers(max_workers=1)
+    entry = CatalogEntry(
+        dir_path,
+        name,
+        timepoints=len(segmentation_dir.imgs_paths),
+        sub_imgs=len(dir_index.indices(FileType.SUB_IMG)),
+        valid=report.is_valid,
+        issues=[issue.message for issue in report.issues],
+        modified_ns=max([dir_mtime_ns] + [mtime_ns for _, mtime_ns in dir_index.stats.values()]),
+    )
+    if statistics_engine is not None:
+        last_index = max(segmentation_dir.imgs_segmentations_paths)
+        statistics = statistics_engine.get_cached(
+            segmentation_dir.imgs_segmentations_paths[last_index], segmentation_dir.storage
+        )
+        if statistics is not None:
+            entry.lesion_count = statistics.lesion_count
+            entry.lesion_volume_ml = statistics.total_volume_ml
+
+    scan = PatientScan(entry, dir_mtime_ns)
+    for file_type in FileType:
+        for index in dir_index.indices(file_type):
+            path = dir_index.get_path(file_type, index)
+            if path in dir_index.stats:
+                scan.files.append((file_type, index, path, *dir_index.stats[path]))
+    return scan
+
+
+class CohortCatalog:
+    """
+    SQLite index of the patient folders of one or more cohorts: their timepoint and sub image counts, validation
+    issues, file modification times, path tables and, once computed, lesion summaries. refresh() only rescans the
+    folders that changed, on a pool of threads. Opening a patient with directory_index() reuses the stored path
+    table instead of scanning the folder again.
+    Must be used from the thread that created it; only the scans run on other threads.
+    """
+
+    def __init__(self, db_path: str, statistics_engine=None) -> None:
+        self.db_path = Path(db_path)
+        self.statistics_engine = statistics_engine
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.db_path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        with self.connection:
+            if version != CATALOG_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS files")
+                self.connection.execute("DROP TABLE IF EXISTS patients")
+                self.connection.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            self.connection.executescript(SCHEMA)
+
+    def stored_stats(self, root_dir: str) -> dict[str, tuple[int, dict]]:
+        """dir_path -> (folder mtime, path -> (size, mtime)) of the folders stored for root_dir."""
+        dir_path_to_stats = {
+            row["dir_path"]: (row["dir_mtime_ns"], {})
+            for row in self.connection.execute("SELECT dir_path, dir_mtime_ns FROM patients WHERE root_dir = ?", (root_dir,))
+        }
+        rows = self.connection.execute(
+            "SELECT files.dir_path, path, size, mtime_ns FROM files "
+            "JOIN patients ON patients.dir_path = files.dir_path WHERE root_dir = ?",
+            (root_dir,)
+        )
+        for row in rows:
+            dir_path_to_stats[row["dir_path"]][1][row["path"]] = (row["size"], row["mtime_ns"])
+        return dir_path_to_stats
+
+    def refresh(self, root_dir: str, max_workers: int = 8) -> CatalogRefresh:
+        """
+        Adds the patient folders directly inside root_dir to the catalog, rescans the ones whose files changed
+        since they were stored, and removes the ones that no longer exist. Unchanged folders are only stat'ed.
+        """
+        from packages.batch.prewarm import find_patient_dirs
+
+        start = time.perf_counter()
+        root_dir = str(Path(root_dir))
+        refresh = CatalogRefresh()
+        dir_paths = find_patient_dirs(root_dir)
+        stored = self.stored_stats(root_dir)
+
+        def scan_if_changed(dir_path: str) -> Optional[PatientScan]:
+            if dir_path in stored and is_unchanged(dir_path, *stored[dir_path]):
+                return None
+            return scan_patient(dir_path, self.statistics_engine)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataCatalog") as executor:
+            futures = [(dir_path, executor.submit(scan_if_changed, dir_path)) for dir_path in dir_paths]
+            with self.connection:
+                for dir_path, future in futures:
+                    try:
+                        scan = future.result()
+                    except OSError as e:
+                        logging.warning(f"Could not scan {dir_path} for the catalog: {e}")
+                        continue
+                    if scan is None:
+                        refresh.unchanged += 1
+                        continue
+                    if dir_path in stored:
+                        refresh.updated += 1
+                    else:
+                        refresh.added += 1
+                    self.store(root_dir, scan)
+
+                removed = stored.keys() - set(dir_paths)
+                for dir_path in removed:
+                    self.connection.execute("DELETE FROM patients WHERE dir_path = ?", (dir_path,))
+                refresh.removed = len(removed)
+
+        refresh.seconds = time.perf_counter() - start
+        logging.info(refresh.summary())
+        return refresh
+
+    def store(self, root_dir: str, scan: PatientScan) -> None:
+        entry = scan.entry
+        self.connection.execute("DELETE FROM patients WHERE dir_path = ?", (entry.dir_path,))
+        self.connection.execute(
+            "INSERT INTO patients VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry.dir_path, root_dir, entry.name, scan.dir_mtime_ns, entry.timepoints, entry.sub_imgs,
+                int(entry.valid), json.dumps(entry.issues), entry.lesion_count, entry.lesion_volume_ml,
+                entry.modified_ns, time.time()
+            )
+        )
+        self.connection.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            [(entry.dir_path, file_type.name, index, path, size, mtime_ns) for file_type, index, path, size, mtime_ns in scan.files]
+        )
+
+    def set_lesion_summary(self, dir_path: str, lesion_count: int, lesion_volume_ml: float) -> None:
+        """Stores the lesion summary of a patient once its statistics are computed, e.g. when it is opened."""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE patients SET lesion_count = ?, lesion_volume_ml = ? WHERE dir_path = ?",
+                (lesion_count, lesion_volume_ml, str(Path(dir_path)))
+            )
+
+    @staticmethod
+    def row_to_entry(row) -> CatalogEntry:
+        return CatalogEntry(
+            dir_path=row["dir_path"],
+            name=row["name"],
+            timepoints=row["timepoints"],
+            sub_imgs=row["sub_imgs"],
+            valid=bool(row["valid"]),
+            issues=json.loads(row["issues"]),
+            lesion_count=row["lesion_count"],
+            lesion_volume_ml=row["lesion_volume_ml"],
+            modified_ns=row["modified_ns"],
+        )
+
+    def search(
+        self, root_dir: Optional[str] = None, text: str = "", order_by: str = "name", descending: bool = False
+    ) -> list[CatalogEntry]:
+        """The stored patients of root_dir, or of every cohort, whose folder name contains text, sorted by order_by."""
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort the catalog by {order_by}, only by one of {', '.join(SORT_COLUMNS)}")
+        escaped_text = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions, parameters = ["name LIKE ? ESCAPE '\\'"], [f"%{escaped_text}%"]
+        if root_dir is not None:
+            conditions.append("root_dir = ?")
+            parameters.append(str(Path(root_dir)))
+        # Patients without a value of order_by, e.g. without lesion statistics, go last in either direction.
+        rows = self.connection.execute(
+            f"SELECT * FROM patients WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {order_by} IS NULL, {order_by} {'DESC' if descending else 'ASC'}, name",
+            parameters
+        )
+        return [self.row_to_entry(row) for row in rows]
+
+    def get(self, dir_path: str) -> Optional[CatalogEntry]:
+        row = self.connection.execute("SELECT * FROM patients WHERE dir_path = ?", (str(Path(dir_path)),)).fetchone()
+        return self.row_to_entry(row) if row is not None else None
+
+    def directory_index(self, dir_path: str) -> Optional[DirectoryIndex]:
+        """
+        The stored DirectoryIndex of dir_path, without scanning it, or None if it is not in the catalog or files were
+        added or removed since it was stored. Files rewritten since are found by the next rescan.
+        """
+        dir_path = str(Path(dir_path))
+        row = self.connection.execute("SELECT dir_mtime_ns FROM patients WHERE dir_path = ?", (dir_path,)).fetchone()
+        try:
+            if row is None or os.stat(dir_path).st_mtime_ns != row["dir_mtime_ns"]:
+                return None
+        except OSError:
+            return None
+        paths = {file_type: {} for file_type in FileType}
+        stats = {}
+        rows = self.connection.execute(
+            "SELECT file_type, file_index, path, size, mtime_ns FROM files WHERE dir_path = ?", (dir_path,)
+        )
+        for row in rows:
+            paths[FileType[row["file_type"]]][row["file_index"]] = row["path"]
+            stats[row["path"]] = (row["size"], row["mtime_ns"])
+        return DirectoryIndex(dir_path, paths, stats)
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,425 @@
+"""
+Headless export of slice snapshots and 3D renders of every timepoint and subtraction image of patient folders, with a
+report per patient, for e.g. tumour boards. Images are rendered offscreen from decoded arrays, without an MRML scene,
+so that patients can be exported in parallel worker processes.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+import html
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Callable, Optional
+import numpy as np
+import SimpleITK as sitk
+from packages.batch.prewarm import CacheDirs, find_patient_dirs, run_patients
+from packages.cache.volume_cache import VolumeCache
+from packages.cache.surface_cache import SurfaceCache, build_surfaces, segmentation_from_labelmap
+from packages.loading.decode import DecodedVolume
+from packages.loading.sparse_labelmap import to_dense
+from packages.segmentation.file_types import View, view_to_filetypes
+from packages.segmentation.segmentation import SegmentationDir
+from packages.segmentation.subtraction import SubtractionImages
+from packages.statistics.lesion_statistics import LesionStatisticsEngine, compute_lesion_statistics
+from packages.statistics.lesion_tracking import LesionStatus, LesionTracker
+from packages.utils.utils import MEBIBYTE
+
+# RAS axis that each orientation cuts along, and the RAS directions of the image's columns and of up, as in Slicer.
+ORIENTATIONS = {
+    "axial": (2, (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0)),
+    "coronal": (1, (-1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    "sagittal": (0, (0.0, -1.0, 0.0), (0.0, 0.0, 1.0)),
+}
+# RAS direction the camera looks at the lesions from, and view up.
+CAMERA_DIRECTIONS = {
+    "anterior": ((0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+    "posterior": ((0.0, -1.0, 0.0), (0.0, 0.0, 1.0)),
+    "left": ((-1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    "right": ((1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+    "superior": ((0.0, 0.0, 1.0), (0.0, 1.0, 0.0)),
+    "inferior": ((0.0, 0.0, -1.0), (0.0, 1.0, 0.0)),
+}
+# Colors of labels that have none in their segmentation file.
+DEFAULT_LABEL_COLORS = (
+    (0.9, 0.2, 0.2), (0.2, 0.8, 0.2), (0.2, 0.4, 0.9), (0.9, 0.8, 0.2), (0.8, 0.3, 0.8), (0.2, 0.8, 0.8)
+)
+
+
+@dataclass
+class ExportConfig:
+    """
+    What is exported for each timepoint: slices at fractions slice_positions of the extent of the volume along each
+    of orientations, with the segmentation overlaid, and 3D renders of the lesion surfaces seen from each of
+    camera_directions (keys of CAMERA_DIRECTIONS). 3D renders need an OpenGL context, offscreen or on a display;
+    pass camera_directions=() where there is none.
+    """
+    views: tuple = (View.STANDARD, View.SUB)
+    orientations: tuple = ("axial", "coronal", "sagittal")
+    slice_positions: tuple = (0.5,)
+    camera_directions: tuple = ("anterior", "left", "superior")
+    render_size: tuple[int, int] = (512, 512)
+    overlay_opacity: float = 0.5
+    # Percentiles of the voxel values mapped to black and white.
+    window_percentiles: tuple[float, float] = (1.0, 99.0)
+
+
+@dataclass
+class FrameExport:
+    view: str
+    index: int
+    images: list[str] = field(default_factory=list)
+    lesion_count: int = 0
+    lesion_volume_ml: float = 0.0
+    # Lesion changes from the previous timepoint by LesionStatus name, for the timepoints of the standard view.
+    changes: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class PatientExport:
+    dir_path: str
+    out_dir: str
+    frames: list[FrameExport] = field(default_factory=list)
+    bytes_written: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class CohortExport:
+    results: list[PatientExport] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def failures(self) -> list[PatientExport]:
+        return [result for result in self.results if result.error is not None]
+
+    def summary(self) -> str:
+        images = sum(len(frame.images) for result in self.results for frame in result.frames)
+        megabytes = sum(result.bytes_written for result in self.results) / MEBIBYTE
+        return (
+            f"Exported {len(self.results) - len(self.failures)}/{len(self.results)} patients in {self.seconds:.1f} s "
+            f"({images} images, {megabytes:.1f} MiB)"
+        )
+
+
+def get_window(array: np.ndarray, percentiles: tuple[float, float]) -> tuple[float, float]:
+    low, high = np.percentile(array[::2, ::2, ::2], percentiles)
+    return float(low), float(high) if high > low else float(low) + 1.0
+
+
+def get_slice_axes(ijk_to_ras: np.ndarray, orientation: str) -> tuple[int, tuple, tuple]:
+    """
+    The array axis cut along for orientation, and for the columns and rows of the slice image: the array axis and
+    whether it is flipped. The nearest array axes are used, so oblique volumes are shown unresliced.
+    """
+    ras_axis, column_direction, up_direction = ORIENTATIONS[orientation]
+    # Column c of the direction matrix is the RAS direction of IJK axis c, i.e. of array axis 2 - c.
+    directions = ijk_to_ras[:3, :3] / np.linalg.norm(ijk_to_ras[:3, :3], axis=0)
+    array_axis_to_direction = {2 - ijk_axis: directions[:, ijk_axis] for ijk_axis in range(3)}
+    slice_axis = max(array_axis_to_direction, key=lambda axis: abs(array_axis_to_direction[axis][ras_axis]))
+    in_plane = [axis for axis in range(3) if axis != slice_axis]
+    column_axis = max(in_plane, key=lambda axis: abs(array_axis_to_direction[axis] @ column_direction))
+    row_axis = in_plane[0] if column_axis == in_plane[1] else in_plane[1]
+    # Rows go down the image, against the up direction.
+    return (
+        slice_axis,
+        (column_axis, array_axis_to_direction[column_axis] @ column_direction < 0),
+        (row_axis, array_axis_to_direction[row_axis] @ up_direction > 0),
+    )
+
+
+def extract_slice(array: np.ndarray, spacing: np.ndarray, slice_axis: int, position: float, column, row) -> np.ndarray:
+    """The (rows, columns) slice of array at the fraction position along slice_axis, resampled to square pixels."""
+    index = int(round(position * (array.shape[slice_axis] - 1)))
+    (column_axis, flip_columns), (row_axis, flip_rows) = column, row
+    image = np.take(array, index, axis=slice_axis)
+    # np.take drops slice_axis, so the remaining axes keep their order.
+    if row_axis > column_axis:
+        image = image.T
+    if flip_rows:
+        image = image[::-1]
+    if flip_columns:
+        image = image[:, ::-1]
+
+    # Array axis a has the spacing of IJK axis 2 - a.
+    row_spacing, column_spacing = spacing[2 - row_axis], spacing[2 - column_axis]
+    pixel_spacing = min(row_spacing, column_spacing)
+    rows = np.minimum(
+        (np.arange(int(round(image.shape[0] * row_spacing / pixel_spacing))) * pixel_spacing / row_spacing).astype(int),
+        image.shape[0] - 1
+    )
+    columns = np.minimum(
+        (np.arange(int(round(image.shape[1] * column_spacing / pixel_spacing))) * pixel_spacing / column_spacing).astype(int),
+        image.shape[1] - 1
+    )
+    return image[np.ix_(rows, columns)]
+
+
+def label_colors(labelmap: DecodedVolume) -> dict[int, tuple]:
+    label_value_to_color = {
+        segment.label_value: segment.color for segment in labelmap.segments if segment.color is not None
+    }
+    for position, label_value in enumerate(int(value) for value in np.unique(labelmap.array) if value != 0):
+        label_value_to_color.setdefault(label_value, DEFAULT_LABEL_COLORS[position % len(DEFAULT_LABEL_COLORS)])
+    return label_value_to_color
+
+
+def compose_slice(image: np.ndarray, labels: Optional[np.ndarray], window: tuple[float, float],
+                  label_value_to_color: dict, opacity: float) -> np.ndarray:
+    """RGB uint8 image of a slice, with labels overlaid in their colors at opacity."""
+    low, high = window
+    gray = np.clip((image.astype(np.float32) - low) / (high - low), 0.0, 1.0)
+    rgb = np.repeat(gray[..., None], 3, axis=2)
+    if labels is not None:
+        for label_value, color in label_value_to_color.items():
+            mask = labels == label_value
+            rgb[mask] = (1.0 - opacity) * rgb[mask] + opacity * np.asarray(color, dtype=np.float32)
+    return (rgb * 255.0 + 0.5).astype(np.uint8)
+
+
+def write_png(rgb: np.ndarray, path: Path) -> None:
+    sitk.WriteImage(sitk.GetImageFromArray(rgb, isVector=True), str(path))
+
+
+def render_surfaces(segment_id_to_surface: dict, segment_id_to_color: dict, camera_direction: str,
+                    size: tuple[int, int], path: Path) -> None:
+    """Renders closed surfaces offscreen, seen from camera_direction, to a PNG file."""
+    # Imported here so that slice snapshots can be exported where VTK rendering is not available.
+    import vtk
+
+    renderer = vtk.vtkRenderer()
+    renderer.SetBackground(0.0, 0.0, 0.0)
+    for segment_id, surface in segment_id_to_surface.items():
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(surface)
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        actor.GetProperty().SetColor(*segment_id_to_color[segment_id])
+        renderer.AddActor(actor)
+
+    direction, view_up = CAMERA_DIRECTIONS[camera_direction]
+    camera = renderer.GetActiveCamera()
+    camera.SetFocalPoint(0.0, 0.0, 0.0)
+    camera.SetPosition(*direction)
+    camera.SetViewUp(*view_up)
+    renderer.ResetCamera()
+
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(*size)
+    render_window.AddRenderer(renderer)
+    render_window.Render()
+    window_to_image = vtk.vtkWindowToImageFilter()
+    window_to_image.SetInput(render_window)
+    window_to_image.ReadFrontBufferOff()
+    window_to_image.Update()
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(str(path))
+    writer.SetInputConnection(window_to_image.GetOutputPort())
+    writer.Write()
+    render_window.Finalize()
+
+
+class PatientExporter:
+    """
+    Exports one patient folder. The next frame is decoded on a worker thread while the current one is rendered.
+    """
+
+    def __init__(self, dir_path: str, out_dir: str, cache_dirs: CacheDirs, config: ExportConfig) -> None:
+        self.dir_path = dir_path
+        self.out_dir = Path(out_dir)
+        self.cache_dirs = cache_dirs
+        self.config = config
+        # Created by export, so that a folder that is not a patient folder is reported in the result.
+        self.segmentation_dir = None
+        self.surface_cache = SurfaceCache(cache_dirs.surfaces) if cache_dirs.surfaces else None
+        self.result = PatientExport(str(dir_path), str(self.out_dir))
+
+    def create_segmentation_dir(self) -> SegmentationDir:
+        cache_dirs = self.cache_dirs
+        volume_cache = VolumeCache(cache_dirs.volumes, cache_dirs.volumes_max_bytes) if cache_dirs.volumes else None
+        return SegmentationDir(
+            self.dir_path,
+            volume_cache=volume_cache,
+            subtraction_images=SubtractionImages(
+                cache_dir=cache_dirs.subtractions,
+                volume_cache=volume_cache,
+                max_bytes=cache_dirs.subtractions_max_bytes
+            )
+        )
+
+    def frames(self) -> list[tuple[View, int]]:
+        return [
+            (view, index)
+            for view in self.config.views
+            for index in sorted(
+                self.segmentation_dir.imgs_paths if view == View.STANDARD else self.segmentation_dir.sub_imgs_paths
+            )
+            if self.segmentation_dir.index_is_valid(view, index)
+        ]
+
+    def decode(self, frame: tuple[View, int]) -> tuple[DecodedVolume, DecodedVolume, str]:
+        view, index = frame
+        volume_type, segmentation_type = view_to_filetypes(view)
+        segmentation_path = self.segmentation_dir.get_path(segmentation_type, index)
+        volume = self.segmentation_dir.decode_file(
+            (volume_type, index), self.segmentation_dir.get_path(volume_type, index)
+        )
+        labelmap = to_dense(self.segmentation_dir.decode_file((segmentation_type, index), segmentation_path))
+        return volume, labelmap, segmentation_path
+
+    def export(self) -> PatientExport:
+        start = time.perf_counter()
+        try:
+            self.segmentation_dir = self.create_segmentation_dir()
+            os.makedirs(self.out_dir, exist_ok=True)
+            frames = self.frames()
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="LoadMSLesionDataExport") as decoder:
+                future = decoder.submit(self.decode, frames[0]) if frames else None
+                for position, frame in enumerate(frames):
+                    decoded = future.result()
+                    if position + 1 < len(frames):
+                        future = decoder.submit(self.decode, frames[position + 1])
+                    self.result.frames.append(self.export_frame(frame, *decoded))
+            self.add_changes()
+            self.write_report()
+        except Exception as e:
+            self.result.error = f"{type(e).__name__}: {e}"
+        self.result.seconds = time.perf_counter() - start
+        return self.result
+
+    def export_frame(self, frame: tuple[View, int], volume: DecodedVolume, labelmap: DecodedVolume,
+                     segmentation_path: str) -> FrameExport:
+        view, index = frame
+        prefix = f"{'img' if view == View.STANDARD else 'img_sub'}_{index}"
+        frame_export = FrameExport(view.name, index)
+        statistics = compute_lesion_statistics(labelmap)
+        frame_export.lesion_count = statistics.lesion_count
+        frame_export.lesion_volume_ml = statistics.total_volume_ml
+
+        window = get_window(volume.array, self.config.window_percentiles)
+        label_value_to_color = label_colors(labelmap)
+        # Labelmaps on a different grid than their image are not overlaid on the slices.
+        overlay = labelmap.array.shape == volume.array.shape and np.allclose(
+            labelmap.ijk_to_ras, volume.ijk_to_ras, atol=1e-3
+        )
+        for orientation in self.config.orientations:
+            slice_axis, column, row = get_slice_axes(volume.ijk_to_ras, orientation)
+            for position in self.config.slice_positions:
+                image = extract_slice(volume.array, volume.spacing, slice_axis, position, column, row)
+                labels = (
+                    extract_slice(labelmap.array, volume.spacing, slice_axis, position, column, row) if overlay
+                    else None
+                )
+                rgb = compose_slice(image, labels, window, label_value_to_color, self.config.overlay_opacity)
+                self.write_image(frame_export, f"{prefix}_{orientation}_{round(position * 100)}.png", rgb)
+
+        if self.config.camera_directions and statistics.lesion_count:
+            segmentation = segmentation_from_labelmap(labelmap)
+            segment_id_to_surfaces = build_surfaces(
+                segmentation, segmentation_path, self.surface_cache, self.cache_dirs.surface_detail_levels
+            )
+            segment_id_to_color = {
+                segment_id: label_value_to_color.get(segmentation.GetSegment(segment_id).GetLabelValue(), (1.0, 1.0, 1.0))
+                for segment_id in segment_id_to_surfaces
+            }
+            segment_id_to_surface = {segment_id: surfaces[0] for segment_id, surfaces in segment_id_to_surfaces.items()}
+            for camera_direction in self.config.camera_directions:
+                file_name = f"{prefix}_3d_{camera_direction}.png"
+                render_surfaces(
+                    segment_id_to_surface, segment_id_to_color, camera_direction, self.config.render_size,
+                    self.out_dir / file_name
+                )
+                self.add_image(frame_export, file_name)
+        return frame_export
+
+    def write_image(self, frame_export: FrameExport, file_name: str, rgb: np.ndarray) -> None:
+        write_png(rgb, self.out_dir / file_name)
+        self.add_image(frame_export, file_name)
+
+    def add_image(self, frame_export: FrameExport, file_name: str) -> None:
+        frame_export.images.append(file_name)
+        self.result.bytes_written += os.path.getsize(self.out_dir / file_name)
+
+    def add_changes(self) -> None:
+        if View.STANDARD not in self.config.views:
+            return
+        tracker = LesionTracker(LesionStatisticsEngine(self.cache_dirs.statistics))
+        index_to_changes = tracker.track(self.segmentation_dir)
+        for frame_export in self.result.frames:
+            if frame_export.view != View.STANDARD.name or frame_export.index not in index_to_changes:
+                continue
+            for status in LesionStatus:
+                frame_export.changes[status.name] = sum(
+                    change.status == status for change in index_to_changes[frame_export.index]
+                )
+
+    def write_report(self) -> None:
+        with open(self.out_dir / "report.json", "w") as f:
+            json.dump(asdict(self.result), f, indent=2)
+        with open(self.out_dir / "report.html", "w") as f:
+            f.write(format_report_html(self.result))
+
+
+def format_report_html(result: PatientExport) -> str:
+    name = html.escape(Path(result.dir_path).name)
+    sections = []
+    for frame in result.frames:
+        title = f"{'Timepoint' if frame.view == View.STANDARD.name else 'Subtraction'} {frame.index}"
+        changes = ", ".join(f"{count} {status.lower()}" for status, count in frame.changes.items() if count)
+        images = "".join(
+            f'<img src="{html.escape(image)}" title="{html.escape(image)}" height="256">' for image in frame.images
+        )
+        sections.append(
+            f"<h2>{title}</h2><p>{frame.lesion_count} lesions, {frame.lesion_volume_ml:.2f} ml"
+            f"{f' ({changes})' if changes else ''}</p><div>{images}</div>"
+        )
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{name}</title></head>"
+        f"<body><h1>{name}</h1>{''.join(sections)}</body></html>"
+    )
+
+
+def export_patient(dir_path: str, out_dir: str, cache_dirs: CacheDirs, config: ExportConfig) -> PatientExport:
+    """Exports one patient folder to out_dir. Runs in a worker process, or in Slicer."""
+    return PatientExporter(dir_path, out_dir, cache_dirs, config).export()
+
+
+def log_progress(done: int, total: int, result: PatientExport) -> None:
+    if result.error is not None:
+        logging.warning(f"[{done}/{total}] {result.dir_path} failed: {result.error}")
+        return
+    images = sum(len(frame.images) for frame in result.frames)
+    logging.info(f"[{done}/{total}] {result.dir_path}: {images} images in {result.seconds:.1f} s")
+
+
+def export_cohort(
+    root_dir: str,
+    out_dir: str,
+    cache_dirs: CacheDirs,
+    config: Optional[ExportConfig] = None,
+    max_workers: Optional[int] = None,
+    progress_callback: Callable[[int, int, PatientExport], None] = log_progress,
+) -> CohortExport:
+    """
+    Exports every patient folder directly inside root_dir to a folder of the same name in out_dir, in parallel
+    worker processes. Does not need the Slicer GUI.
+    """
+    config = config if config is not None else ExportConfig()
+    report = CohortExport()
+    start = time.perf_counter()
+    report.results = run_patients(
+        export_patient,
+        [
+            (dir_path, str(Path(out_dir) / Path(dir_path).name), cache_dirs, config)
+            for dir_path in find_patient_dirs(root_dir)
+        ],
+        lambda job, error: PatientExport(job[0], job[1], error=error),
+        progress_callback,
+        max_workers,
+    )
+    report.seconds = time.perf_counter() - start
+    logging.info(report.summary())
+    return report
@@ -0,0 +1,212 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import logging
+import multiprocessing
+import multiprocessing.spawn
+import os
+from pathlib import Path
+import shutil
+import sys
+import time
+from typing import Callable, Optional
+from packages.cache.surface_cache import (
+    SurfaceCache, build_surfaces, register_closed_surface_conversion_rule, segmentation_from_labelmap
+)
+from packages.cache.pyramid_cache import PyramidCache
+from packages.cache.volume_cache import VolumeCache
+from packages.loading.decode import read_labelmap, read_volume
+from packages.segmentation.file_types import FileType
+from packages.segmentation.segmentation import SegmentationDir
+from packages.segmentation.subtraction import SubtractionImages
+from packages.statistics.lesion_statistics import LesionStatisticsEngine
+from packages.utils.utils import MEBIBYTE
+
+
+@dataclass
+class CacheDirs:
+    """Locations of the module's on-disk caches, resolved by the parent process since workers have no slicer.app."""
+    volumes: Optional[str] = None
+    volumes_max_bytes: int = 10 * 1024 * MEBIBYTE
+    surfaces: Optional[str] = None
+    statistics: Optional[str] = None
+    pyramids: Optional[str] = None
+    subtractions: Optional[str] = None
+    subtractions_max_bytes: int = 10 * 1024 * MEBIBYTE
+    # DetailLevels the surfaces are built at, which are part of the keys of the surface cache.
+    surface_detail_levels: tuple = ()
+
+
+@dataclass
+class PatientResult:
+    dir_path: str
+    timepoints: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class CohortReport:
+    results: list[PatientResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def failures(self) -> list[PatientResult]:
+        return [result for result in self.results if result.error is not None]
+
+    @property
+    def patients_per_second(self) -> float:
+        return len(self.results) / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return sum(result.bytes_read for result in self.results) / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"Prewarmed {len(self.results) - len(self.failures)}/{len(self.results)} patients in {self.seconds:.1f} s "
+            f"({self.patients_per_second:.2f} patients/s, {self.bytes_per_second / MEBIBYTE:.1f} MiB/s)"
+        )
+
+
+def find_patient_dirs(root_dir: str) -> list[str]:
+    return sorted(str(path) for path in Path(root_dir).iterdir() if path.is_dir())
+
+
+def get_worker_executable() -> str:
+    # Inside Slicer, sys.executable is the application itself, which cannot run multiprocessing workers.
+    python_slicer = shutil.which("PythonSlicer", path=os.path.dirname(sys.executable))
+    return python_slicer or sys.executable
+
+
+def init_worker() -> None:
+    register_closed_surface_conversion_rule()
+
+
+@contextmanager
+def worker_pool(max_workers: Optional[int] = None, initializer=init_worker):
+    """
+    A pool of spawned worker processes. The executable that multiprocessing spawns is process-wide, so it is only
+    set to get_worker_executable() while the pool exists.
+    """
+    context = multiprocessing.get_context("spawn")
+    previous_executable = multiprocessing.spawn.get_executable()
+    context.set_executable(get_worker_executable())
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=initializer) as executor:
+            yield executor
+    finally:
+        multiprocessing.spawn.set_executable(previous_executable)
+
+
+def run_patients(
+    function: Callable,
+    jobs: list[tuple],
+    failed_result: Callable[[tuple, str], object],
+    progress_callback: Callable[[int, int, object], None],
+    max_workers: Optional[int] = None,
+    initializer=init_worker,
+) -> list:
+    """
+    Runs function(*job) for every job in worker processes, and returns the results in the order they finished.
+    A job whose worker raises, or crashes and breaks the pool (e.g. in native code), gets failed_result(job, error).
+    """
+    results = []
+    with worker_pool(max_workers, initializer) as executor:
+        future_to_job = {executor.submit(function, *job): job for job in jobs}
+        for done, future in enumerate(as_completed(future_to_job), start=1):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = failed_result(future_to_job[future], f"{type(e).__name__}: {e}")
+            results.append(result)
+            progress_callback(done, len(jobs), result)
+    return results
+
+
+def prewarm_patient(dir_path: str, cache_dirs: CacheDirs) -> PatientResult:
+    """
+    Validates one patient folder and fills the caches for every file in it, and for the subtraction images
+    computed for folders without img_sub_{k} files. Runs in a worker process.
+    """
+    result = PatientResult(dir_path)
+    start = time.perf_counter()
+    try:
+        volume_cache = VolumeCache(cache_dirs.volumes, cache_dirs.volumes_max_bytes) if cache_dirs.volumes else None
+        subtraction_images = SubtractionImages(
+            cache_dir=cache_dirs.subtractions, volume_cache=volume_cache, max_bytes=cache_dirs.subtractions_max_bytes
+        ) if cache_dirs.subtractions else None
+        segmentation_dir = SegmentationDir(dir_path, subtraction_images=subtraction_images)
+        surface_cache = SurfaceCache(cache_dirs.surfaces) if cache_dirs.surfaces else None
+        pyramid_cache = PyramidCache(cache_dirs.pyramids) if cache_dirs.pyramids else None
+
+        synthesized_indices = [
+            index for index in sorted(segmentation_dir.sub_imgs_paths)
+            if segmentation_dir.is_synthesized(FileType.SUB_IMG, index)
+        ]
+        volume_paths = list(segmentation_dir.imgs_paths.values()) + [
+            path for index, path in segmentation_dir.sub_imgs_paths.items() if index not in synthesized_indices
+        ]
+        # Synthesized subtraction images are shown with the segmentation of the next timepoint.
+        segmentation_paths = list(dict.fromkeys(
+            list(segmentation_dir.imgs_segmentations_paths.values())
+            + list(segmentation_dir.sub_imgs_segmentations_paths.values())
+        ))
+        if volume_cache is not None or pyramid_cache is not None:
+            for path in volume_paths:
+                decoded = volume_cache.read(path) if volume_cache is not None else read_volume(path)
+                if pyramid_cache is not None:
+                    pyramid_cache.save(path, decoded, labelmap=False)
+                result.bytes_read += os.path.getsize(path)
+        # After the volume cache is filled, which the subtraction images are computed from.
+        for index in synthesized_indices:
+            segmentation_dir.synthesize_sub_img(index)
+        if surface_cache is not None or pyramid_cache is not None:
+            for path in segmentation_paths:
+                decoded = read_labelmap(path)
+                if surface_cache is not None:
+                    build_surfaces(
+                        segmentation_from_labelmap(decoded), path, surface_cache, cache_dirs.surface_detail_levels
+                    )
+                if pyramid_cache is not None:
+                    pyramid_cache.save(path, decoded, labelmap=True)
+                result.bytes_read += os.path.getsize(path)
+        if cache_dirs.statistics:
+            LesionStatisticsEngine(cache_dirs.statistics).get_for_segmentation_dir(segmentation_dir, max_workers=1)
+        result.timepoints = len(segmentation_dir.imgs_paths)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def log_progress(done: int, total: int, result: PatientResult) -> None:
+    if result.error is not None:
+        logging.warning(f"[{done}/{total}] {result.dir_path} failed: {result.error}")
+        return
+    logging.info(f"[{done}/{total}] {result.dir_path}: {result.timepoints} timepoints in {result.seconds:.1f} s")
+
+
+def prewarm_cohort(
+    root_dir: str,
+    cache_dirs: CacheDirs,
+    max_workers: Optional[int] = None,
+    progress_callback: Callable[[int, int, PatientResult], None] = log_progress,
+) -> CohortReport:
+    """
+    Fills the caches for every patient folder directly inside root_dir, in parallel worker processes.
+    Does not need the Slicer GUI.
+    """
+    report = CohortReport()
+    start = time.perf_counter()
+    report.results = run_patients(
+        prewarm_patient,
+        [(dir_path, cache_dirs) for dir_path in find_patient_dirs(root_dir)],
+        lambda job, error: PatientResult(job[0], error=error),
+        progress_callback,
+        max_workers,
+    )
+    report.seconds = time.perf_counter() - start
+    logging.info(report.summary())
+    return report
@@ -0,0 +1,232 @@
+"""
+Benchmarks of directory scanning, loading and navigation on synthetic patient folders. Run from the
+LoadMSLesionData directory, in Slicer's Python or, with a stand-in for the slicer module, in plain Python:
+
+    python -m packages.benchmark.benchmarks --out results.json
+    python -m packages.benchmark.benchmarks --out new.json --compare results.json
+"""
+import argparse
+from dataclasses import asdict, dataclass, field
+import datetime
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+RESULTS_VERSION = 1
+MILLISECONDS_PER_SECOND = 1000.0
+
+
+@dataclass
+class BenchmarkConfig:
+    patient: SyntheticPatientConfig = field(default_factory=SyntheticPatientConfig)
+    scan_repeats: int = 10
+    navigation_repeats: int = 3
+    prefetch: bool = False
+
+
+@dataclass
+class TimingStats:
+    count: int
+    min_ms: float
+    median_ms: float
+    mean_ms: float
+    p95_ms: float
+    max_ms: float
+
+    @classmethod
+    def from_seconds(cls, seconds: list[float]) -> "TimingStats":
+        milliseconds = np.array(seconds) * MILLISECONDS_PER_SECOND
+        return cls(
+            count=len(milliseconds),
+            min_ms=float(milliseconds.min()),
+            median_ms=float(np.median(milliseconds)),
+            mean_ms=float(milliseconds.mean()),
+            p95_ms=float(np.percentile(milliseconds, 95)),
+            max_ms=float(milliseconds.max()),
+        )
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.name_to_seconds = {}
+
+    def time(self, name: str, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.name_to_seconds.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def stats(self) -> dict[str, TimingStats]:
+        return {name: TimingStats.from_seconds(seconds) for name, seconds in self.name_to_seconds.items()}
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def navigate(segmentation_dir, timings: Timings, timepoints: int) -> None:
+    """Next from the first to the last timepoint, comparing with the previous image at each, then back with prev."""
+    from packages.segmentation.segmentation import View
+
+    timings.time("load_first", segmentation_dir.load_index, View.STANDARD, 0)
+    for index in range(1, timepoints):
+        timings.time("next", segmentation_dir.load_index, View.STANDARD, index)
+        if segmentation_dir.index_is_valid_for_sub_img(index - 1):
+            timings.time("compare", segmentation_dir.load_index, View.SUB, index - 1)
+            timings.time("return_from_compare", segmentation_dir.load_index, View.STANDARD, index)
+    for index in range(timepoints - 2, -1, -1):
+        timings.time("prev", segmentation_dir.load_index, View.STANDARD, index)
+
+
+def run_benchmarks(config: Optional[BenchmarkConfig] = None, work_dir: Optional[str] = None) -> dict:
+    config = config if config is not None else BenchmarkConfig()
+    from packages.benchmark.slicer_standin import install_slicer_standin
+    slicer_standin = install_slicer_standin()
+    from packages.segmentation.segmentation import SegmentationDir, View
+    from packages.cache.node_cache import NodeCache
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir_path:
+        start = time.perf_counter()
+        patient_dir = make_synthetic_patient(Path(temp_dir_path) / "patient", config.patient)
+        logging.info(f"Generated synthetic patient in {time.perf_counter() - start:.1f} s")
+
+        timings = Timings()
+        for _ in range(config.scan_repeats):
+            timings.time("scan", SegmentationDir, str(patient_dir))
+
+        # Every index loaded into an empty scene.
+        segmentation_dir = SegmentationDir(str(patient_dir), node_cache=NodeCache())
+        for index in range(config.patient.timepoints):
+            segmentation_dir.unload()
+            timings.time("load_index_cold", segmentation_dir.load_index, View.STANDARD, index)
+        segmentation_dir.unload()
+
+        prefetcher = None
+        if config.prefetch and slicer_standin:
+            logging.warning("Prefetching needs Slicer to build nodes from decoded volumes, benchmarking without it")
+        elif config.prefetch:
+            from packages.loading.prefetch import Prefetcher
+            prefetcher = Prefetcher()
+        for _ in range(config.navigation_repeats):
+            segmentation_dir = SegmentationDir(str(patient_dir), prefetcher=prefetcher, node_cache=NodeCache())
+            navigate(segmentation_dir, timings, config.patient.timepoints)
+            segmentation_dir.unload()
+
+        # Allocation high-water mark of one navigation pass, measured separately since tracing slows Python down.
+        segmentation_dir = SegmentationDir(str(patient_dir), node_cache=NodeCache())
+        tracemalloc.start()
+        navigate(segmentation_dir, Timings(), config.patient.timepoints)
+        _, peak_traced_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        segmentation_dir.unload()
+        if prefetcher is not None:
+            prefetcher.shutdown()
+
+    return {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "slicer_standin": slicer_standin,
+        "config": asdict(config),
+        "timings": {name: asdict(stats) for name, stats in timings.stats().items()},
+        "memory": {"peak_rss_bytes": peak_rss_bytes(), "peak_traced_bytes": peak_traced_bytes},
+    }
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float = 0.1) -> list[tuple[str, float, float, float]]:
+    """(metric, baseline, current, ratio) for every median timing or memory figure more than tolerance worse."""
+    metric_to_values = {
+        f"{name}.median_ms": (stats["median_ms"], current["timings"][name]["median_ms"])
+        for name, stats in baseline["timings"].items()
+        if name in current["timings"]
+    }
+    for name, value in baseline["memory"].items():
+        if value and current["memory"].get(name):
+            metric_to_values[f"memory.{name}"] = (value, current["memory"][name])
+
+    regressions = []
+    for metric, (baseline_value, current_value) in metric_to_values.items():
+        ratio = current_value / baseline_value if baseline_value > 0 else float("inf")
+        if ratio > 1 + tolerance:
+            regressions.append((metric, baseline_value, current_value, ratio))
+    return regressions
+
+
+def format_results(results: dict) -> str:
+    lines = [f"{'operation':<24} {'count':>6} {'median ms':>10} {'p95 ms':>10} {'max ms':>10}"]
+    for name, stats in results["timings"].items():
+        lines.append(f"{name:<24} {stats['count']:>6} {stats['median_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['max_ms']:>10.2f}")
+    for name, value in results["memory"].items():
+        if value is not None:
+            lines.append(f"{name:<24} {value / 2 ** 20:>17.1f} MiB")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark LoadMSLesionData on synthetic patient folders.")
+    parser.add_argument("--out", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Baseline results JSON file to check for regressions against.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative slowdown before failing.")
+    parser.add_argument("--shape", type=int, nargs=3, default=SyntheticPatientConfig.shape, metavar=("K", "J", "I"))
+    parser.add_argument("--timepoints", type=int, default=SyntheticPatientConfig.timepoints)
+    parser.add_argument("--lesion-density", type=float, default=SyntheticPatientConfig.lesion_density)
+    parser.add_argument("--repeats", type=int, default=BenchmarkConfig.navigation_repeats)
+    parser.add_argument("--prefetch", action="store_true", help="Navigate with background prefetching.")
+    parser.add_argument("--seed", type=int, default=SyntheticPatientConfig.seed)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    config = BenchmarkConfig(
+        patient=SyntheticPatientConfig(
+            shape=tuple(args.shape), timepoints=args.timepoints, lesion_density=args.lesion_density, seed=args.seed
+        ),
+        navigation_repeats=args.repeats,
+        prefetch=args.prefetch,
+    )
+    results = run_benchmarks(config)
+    print(format_results(results))
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is None:
+        return 0
+    with open(args.compare) as f:
+        regressions = compare_results(json.load(f), results, args.tolerance)
+    for metric, baseline_value, current_value, ratio in regressions:
+        print(f"Regression in {metric}: {baseline_value:.2f} -> {current_value:.2f} ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
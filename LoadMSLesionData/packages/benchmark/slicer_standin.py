@@ -0,0 +1,202 @@
+"""
+Minimal stand-in for the parts of the slicer module that SegmentationDir uses, so that directory scanning, file
+decoding and the module's own bookkeeping can be benchmarked in a plain Python interpreter. Volumes are decoded
+with SimpleITK into stand-in nodes that only hold the voxel array: MRML, rendering and closed surface conversion
+are not emulated, so timings taken with the stand-in leave them out.
+"""
+import itertools
+import sys
+import tempfile
+import types
+import numpy as np
+from packages.loading.decode import read_labelmap, read_volume
+
+
+class StandInImageData:
+    def __init__(self, array: np.ndarray) -> None:
+        self.array = array
+
+    def GetActualMemorySize(self) -> int:
+        # In KiB, like vtkDataObject.
+        return (self.array.nbytes + 1023) // 1024
+
+
+class StandInNode:
+    class_name = "vtkMRMLNode"
+
+    def __init__(self, scene: "StandInScene", name: str) -> None:
+        self.scene = scene
+        self.name = name
+        self.node_id = f"{self.class_name}{next(scene.id_counter)}"
+        self.display_visibility = 1
+
+    def GetID(self) -> str:
+        return self.node_id
+
+    def GetName(self) -> str:
+        return self.name
+
+    def IsA(self, class_name: str) -> bool:
+        return class_name == self.class_name
+
+    def SetDisplayVisibility(self, visibility: int) -> None:
+        self.display_visibility = visibility
+
+
+class StandInVolumeNode(StandInNode):
+    class_name = "vtkMRMLScalarVolumeNode"
+
+    def __init__(self, scene: "StandInScene", name: str, array: np.ndarray) -> None:
+        super().__init__(scene, name)
+        self.image_data = StandInImageData(array)
+
+    def GetImageData(self) -> StandInImageData:
+        return self.image_data
+
+
+class StandInSegment:
+    def __init__(self, labelmap: StandInImageData) -> None:
+        self.labelmap = labelmap
+
+    def GetRepresentation(self, representation_name: str):
+        return self.labelmap if representation_name == "Binary labelmap" else None
+
+
+class StandInSegmentation:
+    def __init__(self, array: np.ndarray) -> None:
+        labelmap = StandInImageData(array)
+        self.segments = [StandInSegment(labelmap) for _ in np.unique(array[array > 0])]
+
+    def GetNumberOfSegments(self) -> int:
+        return len(self.segments)
+
+    def GetNthSegment(self, n: int) -> StandInSegment:
+        return self.segments[n]
+
+
+class StandInSegmentationNode(StandInNode):
+    class_name = "vtkMRMLSegmentationNode"
+
+    def __init__(self, scene: "StandInScene", name: str, array: np.ndarray) -> None:
+        super().__init__(scene, name)
+        self.segmentation = StandInSegmentation(array)
+
+    def GetSegmentation(self) -> StandInSegmentation:
+        return self.segmentation
+
+    def CreateClosedSurfaceRepresentation(self) -> None:
+        pass
+
+
+class StandInScene:
+    NodeRemovedEvent = 66001
+
+    def __init__(self) -> None:
+        self.id_counter = itertools.count(1)
+        self.id_to_node = {}
+        self.observer_tags = itertools.count(1)
+        self.tag_to_observer = {}
+
+    def AddObserver(self, event: int, callback) -> int:
+        tag = next(self.observer_tags)
+        self.tag_to_observer[tag] = (event, callback)
+        return tag
+
+    def RemoveObserver(self, tag: int) -> None:
+        self.tag_to_observer.pop(tag, None)
+
+    def invoke(self, event: int, node: StandInNode) -> None:
+        for observed_event, callback in list(self.tag_to_observer.values()):
+            if observed_event == event:
+                callback(self, event, node)
+
+    def AddNode(self, node: StandInNode) -> StandInNode:
+        self.id_to_node[node.GetID()] = node
+        return node
+
+    def GetNodeByID(self, node_id: str):
+        return self.id_to_node.get(node_id)
+
+    def RemoveNode(self, node: StandInNode) -> None:
+        if self.id_to_node.pop(node.GetID(), None) is not None:
+            self.invoke(self.NodeRemovedEvent, node)
+
+    def nodes_by_class(self, class_name: str) -> list:
+        return [node for node in self.id_to_node.values() if node.IsA(class_name)]
+
+    def GetNumberOfNodesByClass(self, class_name: str) -> int:
+        return len(self.nodes_by_class(class_name))
+
+    def GetNthNodeByClass(self, n: int, class_name: str):
+        return self.nodes_by_class(class_name)[n]
+
+    def Clear(self, _=0) -> None:
+        self.id_to_node.clear()
+
+
+class StandInSegmentationConverter:
+    @staticmethod
+    def GetSegmentationBinaryLabelmapRepresentationName() -> str:
+        return "Binary labelmap"
+
+    @staticmethod
+    def GetSegmentationClosedSurfaceRepresentationName() -> str:
+        return "Closed surface"
+
+
+def create_slicer_standin() -> types.ModuleType:
+    slicer = types.ModuleType("slicer")
+    slicer.mrmlScene = StandInScene()
+    slicer.vtkSegmentationConverter = StandInSegmentationConverter
+    slicer.vtkMRMLScene = StandInScene
+
+    def load_volume(path, properties=None):
+        name = (properties or {}).get("name", path)
+        return slicer.mrmlScene.AddNode(StandInVolumeNode(slicer.mrmlScene, name, read_volume(path).array))
+
+    def load_segmentation(path, properties=None):
+        name = (properties or {}).get("name", path)
+        return slicer.mrmlScene.AddNode(StandInSegmentationNode(slicer.mrmlScene, name, read_labelmap(path).array))
+
+    slicer.util = types.SimpleNamespace(loadVolume=load_volume, loadSegmentation=load_segmentation)
+
+    does_nothing = lambda *args, **kwargs: None
+    three_d_controller = types.SimpleNamespace(resetFocalPoint=does_nothing)
+    layout_manager = types.SimpleNamespace(
+        threeDWidget=lambda _: types.SimpleNamespace(threeDController=lambda: three_d_controller)
+    )
+    selection_node = types.SimpleNamespace(SetActiveVolumeID=does_nothing)
+    application_logic = types.SimpleNamespace(
+        GetSelectionNode=lambda: selection_node, PropagateVolumeSelection=does_nothing
+    )
+    slicer.app = types.SimpleNamespace(
+        cachePath=tempfile.mkdtemp(prefix="LoadMSLesionDataBenchmark"),
+        layoutManager=lambda: layout_manager,
+        applicationLogic=lambda: application_logic,
+    )
+    return slicer
+
+
+def install_slicer_standin() -> bool:
+    """
+    Makes `import slicer` return the stand-in when running outside Slicer. Returns whether it was installed.
+    vtk is only used when building nodes from prefetched data and to annotate scene observers, so outside Slicer
+    it may be missing too, in which case a near-empty module takes its place.
+    """
+    try:
+        import slicer
+        return False
+    except ImportError:
+        pass
+    sys.modules["slicer"] = create_slicer_standin()
+    try:
+        import vtk
+    except ImportError:
+        sys.modules["vtk"] = types.ModuleType("vtk")
+        sys.modules["vtk"].VTK_OBJECT = 13
+        sys.modules["vtk"].calldata_type = lambda _: lambda function: function
+        sys.modules["vtk.util"] = types.ModuleType("vtk.util")
+        sys.modules["vtk.util.numpy_support"] = types.ModuleType("vtk.util.numpy_support")
+        sys.modules["vtk"].util = sys.modules["vtk.util"]
+        sys.modules["vtk.util"].numpy_support = sys.modules["vtk.util.numpy_support"]
+    return True
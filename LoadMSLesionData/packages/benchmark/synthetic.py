@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import SimpleITK as sitk
+from packages.segmentation.file_types import FileType, file_type_to_name
+
+ML_PER_MM3 = 1 / 1000.0
+
+
+@dataclass
+class SyntheticPatientConfig:
+    # Volume shape in (k, j, i) order and voxel spacing in mm, in (i, j, k) order.
+    shape: tuple[int, int, int] = (64, 128, 128)
+    spacing: tuple[float, float, float] = (1.5, 1.5, 2.5)
+    timepoints: int = 4
+    # Expected number of lesions per 100 mL of brain at the first timepoint.
+    lesion_density: float = 2.0
+    # Expected number of new lesions, per 100 mL of brain, between consecutive timepoints.
+    new_lesion_density: float = 0.5
+    lesion_radius_mm: tuple[float, float] = (1.5, 6.0)
+    resolve_probability: float = 0.1
+    with_sub_imgs: bool = True
+    seed: int = 0
+
+
+@dataclass
+class SyntheticLesion:
+    centre_ijk: np.ndarray
+    radii_mm: np.ndarray
+
+
+def brain_mask(config: SyntheticPatientConfig) -> np.ndarray:
+    """Ellipsoid filling most of the field of view."""
+    k, j, i = np.ogrid[tuple(slice(0, n) for n in config.shape)]
+    n_k, n_j, n_i = config.shape
+    return (
+        ((i - n_i / 2) / (0.42 * n_i)) ** 2 + ((j - n_j / 2) / (0.45 * n_j)) ** 2 + ((k - n_k / 2) / (0.4 * n_k)) ** 2
+    ) <= 1
+
+
+def lesion_mask(config: SyntheticPatientConfig, lesions: list[SyntheticLesion]) -> np.ndarray:
+    mask = np.zeros(config.shape, dtype=bool)
+    spacing_kji = np.array(config.spacing[::-1])
+    for lesion in lesions:
+        radii_voxels = lesion.radii_mm[::-1] / spacing_kji
+        low = np.maximum(np.floor(lesion.centre_ijk[::-1] - radii_voxels).astype(int), 0)
+        high = np.minimum(np.ceil(lesion.centre_ijk[::-1] + radii_voxels).astype(int) + 1, config.shape)
+        if np.any(high <= low):
+            continue
+        k, j, i = np.ogrid[tuple(slice(lo, hi) for lo, hi in zip(low, high))]
+        centre_k, centre_j, centre_i = lesion.centre_ijk[::-1]
+        radius_k, radius_j, radius_i = radii_voxels
+        mask[low[0]:high[0], low[1]:high[1], low[2]:high[2]] |= (
+            ((k - centre_k) / radius_k) ** 2 + ((j - centre_j) / radius_j) ** 2 + ((i - centre_i) / radius_i) ** 2
+        ) <= 1
+    return mask
+
+
+def random_lesions(config: SyntheticPatientConfig, brain: np.ndarray, density: float, rng: np.random.Generator) -> list[SyntheticLesion]:
+    brain_ml = brain.sum() * np.prod(config.spacing) * ML_PER_MM3
+    brain_kji = np.argwhere(brain)
+    if len(brain_kji) == 0:
+        return []
+    count = rng.poisson(density * brain_ml / 100)
+    return [
+        SyntheticLesion(
+            centre_ijk=brain_kji[rng.integers(len(brain_kji))][::-1].astype(float),
+            radii_mm=rng.uniform(*config.lesion_radius_mm, size=3),
+        )
+        for _ in range(count)
+    ]
+
+
+def evolve_lesions(config: SyntheticPatientConfig, lesions: list[SyntheticLesion], brain: np.ndarray, rng: np.random.Generator) -> list[SyntheticLesion]:
+    """Lesions of the next timepoint: some resolve, the rest grow or shrink, and new ones appear."""
+    evolved = [
+        SyntheticLesion(lesion.centre_ijk, lesion.radii_mm * rng.uniform(0.8, 1.25))
+        for lesion in lesions
+        if rng.random() >= config.resolve_probability
+    ]
+    return evolved + random_lesions(config, brain, config.new_lesion_density, rng)
+
+
+def synthetic_image(config: SyntheticPatientConfig, brain: np.ndarray, lesions: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """FLAIR-like image: smooth brain intensity, hyperintense lesions and Rician-like noise, as int16."""
+    k, j, i = np.ogrid[tuple(slice(0, n) for n in config.shape)]
+    bias = 1 + 0.1 * np.sin(i / config.shape[2] * np.pi) * np.cos(j / config.shape[1] * np.pi) + 0.05 * k / config.shape[0]
+    image = np.where(brain, 600.0 * bias, 20.0)
+    image[lesions] *= 1.6
+    image += rng.normal(0, 15, config.shape)
+    return np.clip(np.abs(image), 0, np.iinfo(np.int16).max).astype(np.int16)
+
+
+def to_sitk_image(array: np.ndarray, config: SyntheticPatientConfig) -> sitk.Image:
+    image = sitk.GetImageFromArray(array)
+    image.SetSpacing(config.spacing)
+    return image
+
+
+def make_synthetic_patient(dir_path: str, config: Optional[SyntheticPatientConfig] = None) -> Path:
+    """
+    Writes a patient folder in the format read by SegmentationDir: img_{i}.nii.gz with a NRRD lesion labelmap
+    img_{i}_segmentation.nrrd for every timepoint, and optionally the subtraction images of consecutive timepoints.
+    """
+    config = config if config is not None else SyntheticPatientConfig()
+    dir_path = Path(dir_path)
+    os.makedirs(dir_path, exist_ok=True)
+    rng = np.random.default_rng(config.seed)
+    brain = brain_mask(config)
+
+    lesions = random_lesions(config, brain, config.lesion_density, rng)
+    previous_image = None
+    for index in range(config.timepoints):
+        if index > 0:
+            lesions = evolve_lesions(config, lesions, brain, rng)
+        lesions_mask = lesion_mask(config, lesions) & brain
+        image = synthetic_image(config, brain, lesions_mask, rng)
+        labelmap = lesions_mask.astype(np.uint8)
+        sitk.WriteImage(to_sitk_image(image, config), str(dir_path / file_type_to_name(FileType.IMG, index)))
+        sitk.WriteImage(
+            to_sitk_image(labelmap, config),
+            str(dir_path / file_type_to_name(FileType.IMG_SEGMENTATION, index)),
+            useCompression=True,
+        )
+        if config.with_sub_imgs and previous_image is not None:
+            sub_index = index - 1
+            sitk.WriteImage(
+                to_sitk_image(image.astype(np.float32) - previous_image, config),
+                str(dir_path / file_type_to_name(FileType.SUB_IMG, sub_index)),
+            )
+            sitk.WriteImage(
+                to_sitk_image(labelmap, config),
+                str(dir_path / file_type_to_name(FileType.SUB_IMG_SEGMENTATION, sub_index)),
+                useCompression=True,
+            )
+        previous_image = image
+    return dir_path
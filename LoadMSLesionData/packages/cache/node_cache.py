@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import logging
+from typing import Optional
+import slicer
+import vtk
+from packages.utils.utils import KIBIBYTE, MEBIBYTE
+
+
+def segmentation_representation_names() -> tuple[str, str]:
+    return (
+        slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName(),
+        slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName(),
+    )
+
+
+def node_nbytes(node) -> int:
+    """Memory held by a volume node's image data, or by all representations of a segmentation node."""
+    if node.IsA("vtkMRMLSegmentationNode"):
+        # Segments may share a single labelmap, so each data object is only counted once.
+        data_objects = set()
+        segmentation = node.GetSegmentation()
+        for i in range(segmentation.GetNumberOfSegments()):
+            segment = segmentation.GetNthSegment(i)
+            for representation_name in segmentation_representation_names():
+                representation = segment.GetRepresentation(representation_name)
+                if representation is not None:
+                    data_objects.add(representation)
+        return sum(data_object.GetActualMemorySize() for data_object in data_objects) * KIBIBYTE
+
+    image_data = node.GetImageData()
+    if image_data is None:
+        return 0
+    return image_data.GetActualMemorySize() * KIBIBYTE
+
+
+class NodeCache:
+    """
+    Least-recently-viewed cache of the MRML nodes created by a SegmentationDir, keyed by (FileType, index).
+    When the nodes in the scene use more memory than budget_bytes, the least recently viewed ones are removed
+    from the scene. Nodes removed from the scene by anything else are forgotten as soon as the scene's
+    NodeRemovedEvent is invoked for them.
+    """
+
+    def __init__(self, budget_bytes: int = 2048 * MEBIBYTE) -> None:
+        self.budget_bytes = budget_bytes
+        self.key_to_node_id = OrderedDict()
+        self.node_id_to_key = {}
+        self.scene_observer_tag = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[object]:
+        node = self.peek(key)
+        if node is None:
+            self.misses += 1
+            return None
+        self.key_to_node_id.move_to_end(key)
+        self.hits += 1
+        return node
+
+    def peek(self, key) -> Optional[object]:
+        """Returns the node without counting a hit or miss or marking it as viewed."""
+        node_id = self.key_to_node_id.get(key)
+        if node_id is None:
+            return None
+        node = slicer.mrmlScene.GetNodeByID(node_id)
+        if node is None:
+            # Removed from the scene while it was not observed, e.g. by a scene close.
+            self.forget(key)
+        return node
+
+    def __contains__(self, key) -> bool:
+        return self.peek(key) is not None
+
+    def put(self, key, node) -> None:
+        self.forget(key)
+        self.key_to_node_id[key] = node.GetID()
+        self.node_id_to_key[node.GetID()] = key
+        self.observe_scene()
+
+    def forget(self, key) -> None:
+        node_id = self.key_to_node_id.pop(key, None)
+        if node_id is not None:
+            self.node_id_to_key.pop(node_id, None)
+
+    def observe_scene(self) -> None:
+        if self.scene_observer_tag is None:
+            self.scene_observer_tag = slicer.mrmlScene.AddObserver(
+                slicer.vtkMRMLScene.NodeRemovedEvent, self.on_node_removed
+            )
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def on_node_removed(self, caller, event, node) -> None:
+        key = self.node_id_to_key.get(node.GetID())
+        if key is not None:
+            self.forget(key)
+
+    def close(self) -> None:
+        """Stops observing the scene. The nodes are left in the scene."""
+        if self.scene_observer_tag is not None:
+            slicer.mrmlScene.RemoveObserver(self.scene_observer_tag)
+            self.scene_observer_tag = None
+
+    def nodes(self):
+        for key in list(self.key_to_node_id):
+            node = self.peek(key)
+            if node is not None:
+                yield key, node
+
+    def usage_bytes(self) -> int:
+        # Recomputed every time since representations (e.g. closed surfaces) can be added after caching.
+        return sum(node_nbytes(node) for _, node in self.nodes())
+
+    def evict(self, protected_keys=()) -> None:
+        key_to_nbytes = {key: node_nbytes(node) for key, node in self.nodes()}
+        usage_bytes = sum(key_to_nbytes.values())
+        for key, nbytes in key_to_nbytes.items():
+            if usage_bytes <= self.budget_bytes:
+                break
+            if key in protected_keys:
+                continue
+            self.remove(key)
+            usage_bytes -= nbytes
+            logging.debug(f"Evicted {key} from the node cache, freeing {nbytes / MEBIBYTE:.1f} MiB")
+
+    def remove(self, key) -> None:
+        node_id = self.key_to_node_id.get(key)
+        if node_id is None:
+            return
+        self.forget(key)
+        node = slicer.mrmlScene.GetNodeByID(node_id)
+        if node is not None:
+            slicer.mrmlScene.RemoveNode(node)
+
+    def clear(self) -> None:
+        for key in list(self.key_to_node_id):
+            self.remove(key)
+
+    def stats(self) -> dict:
+        return {
+            "usage_bytes": self.usage_bytes(),
+            "budget_bytes": self.budget_bytes,
+            "nodes": len(self.key_to_node_id),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
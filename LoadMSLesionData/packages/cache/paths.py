@@ -0,0 +1,9 @@
+from pathlib import Path
+import slicer
+
+MODULE_CACHE_DIR_NAME = "LoadMSLesionData"
+
+
+def default_cache_dir(name: str) -> Path:
+    """Directory for one of the module's on-disk caches, inside the Slicer cache directory."""
+    return Path(slicer.app.cachePath) / MODULE_CACHE_DIR_NAME / name
@@ -0,0 +1,119 @@
+from dataclasses import asdict
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+import numpy as np
+from packages.loading.decode import DecodedVolume, SegmentInfo
+
+# Downsampling factors of the stored levels, along every axis.
+PYRAMID_FACTORS = (2, 4, 8)
+
+
+def block_factors(shape: tuple, factor: int) -> tuple:
+    # Axes shorter than factor, e.g. of thick-slice acquisitions, are reduced to a single voxel.
+    return tuple(max(1, min(factor, n)) for n in shape)
+
+
+def block_reduce(array: np.ndarray, factors: tuple, labelmap: bool) -> np.ndarray:
+    """
+    Reduces every factors-sized block of array to one voxel, in one vectorized pass: to its mean for images, and
+    to its maximum for labelmaps, so that lesions smaller than a block stay visible. Edge voxels are repeated to
+    fill partial blocks.
+    """
+    padding = [(0, (-n) % factor) for n, factor in zip(array.shape, factors)]
+    if any(after for _, after in padding):
+        array = np.pad(array, padding, mode="edge")
+    blocks_shape = []
+    for n, factor in zip(array.shape, factors):
+        blocks_shape += [n // factor, factor]
+    blocks = array.reshape(blocks_shape)
+    axes = (1, 3, 5)
+    if labelmap:
+        return blocks.max(axis=axes)
+    reduced = blocks.mean(axis=axes, dtype=np.float32)
+    if np.issubdtype(array.dtype, np.integer):
+        reduced = np.rint(reduced)
+    return reduced.astype(array.dtype)
+
+
+def downsample(decoded: DecodedVolume, factors: tuple, labelmap: bool) -> DecodedVolume:
+    factors_ijk = np.array(factors[::-1], dtype=float)
+    ijk_to_ras = decoded.ijk_to_ras.copy()
+    # Voxel (0, 0, 0) of the level is centred on the first block.
+    ijk_to_ras[:3, 3] = decoded.ijk_to_ras[:3, :3] @ ((factors_ijk - 1) / 2) + decoded.ijk_to_ras[:3, 3]
+    ijk_to_ras[:3, :3] = decoded.ijk_to_ras[:3, :3] * factors_ijk
+    return DecodedVolume(block_reduce(decoded.array, factors, labelmap), ijk_to_ras, decoded.segments)
+
+
+def build_pyramid(decoded: DecodedVolume, labelmap: bool) -> dict[int, DecodedVolume]:
+    """Levels by factor, each reduced from the previous one so that only the first pass reads every voxel."""
+    levels = {}
+    previous, previous_factor = decoded, 1
+    for factor in PYRAMID_FACTORS:
+        previous = downsample(previous, block_factors(previous.array.shape, factor // previous_factor), labelmap)
+        previous_factor = factor
+        levels[factor] = previous
+    return levels
+
+
+class PyramidCache:
+    """
+    Downsampled levels of images and labelmaps on disk, as .npy files with a JSON header holding each level's
+    geometry, keyed by the path, size and modification time of the source file. Safe to use from several threads.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = Path(cache_dir)
+
+    def get_key(self, source_path: str) -> Optional[str]:
+        try:
+            stat = os.stat(source_path)
+        except FileNotFoundError:
+            # E.g. a subtraction image that is computed rather than read.
+            return None
+        return hashlib.sha256(f"{os.path.abspath(source_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+
+    def has(self, source_path: str) -> bool:
+        key = self.get_key(source_path)
+        return key is not None and (self.cache_dir / f"{key}.json").exists()
+
+    def load(self, source_path: str, factor: int) -> Optional[DecodedVolume]:
+        key = self.get_key(source_path)
+        if key is None:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}.json") as f:
+                header = json.load(f)
+            level = header["levels"][str(factor)]
+            array = np.load(self.cache_dir / f"{key}_{factor}.npy")
+        except (OSError, KeyError, ValueError):
+            return None
+        segments = [SegmentInfo(**segment) for segment in header["segments"]]
+        return DecodedVolume(array, np.array(level["ijk_to_ras"]), segments)
+
+    def save(self, source_path: str, decoded: DecodedVolume, labelmap: bool) -> None:
+        """Builds and stores the pyramid of source_path, unless it is already stored."""
+        key = self.get_key(source_path)
+        if key is None or (self.cache_dir / f"{key}.json").exists():
+            return
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            levels = {}
+            for factor, level in build_pyramid(decoded, labelmap).items():
+                temp_path = self.cache_dir / f"{key}_{factor}.npy.{suffix}"
+                with open(temp_path, "wb") as f:
+                    np.save(f, level.array)
+                os.replace(temp_path, self.cache_dir / f"{key}_{factor}.npy")
+                levels[str(factor)] = {"ijk_to_ras": level.ijk_to_ras.tolist()}
+            # Written last, so that a pyramid is only used once all its levels are in place.
+            temp_path = self.cache_dir / f"{key}.json.{suffix}"
+            with open(temp_path, "w") as f:
+                json.dump({"levels": levels, "segments": [asdict(segment) for segment in decoded.segments]}, f)
+            os.replace(temp_path, self.cache_dir / f"{key}.json")
+        except OSError as e:
+            logging.warning(f"Could not cache the pyramid of {source_path}: {e}")
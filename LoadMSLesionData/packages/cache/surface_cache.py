@@ -0,0 +1,312 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import slicer
+import vtk
+from vtk.util import numpy_support
+from packages.loading.decode import DecodedVolume
+from packages.utils.utils import file_sha256
+
+POLL_INTERVAL_MS = 100
+
+# Parameters of the binary labelmap to closed surface conversion that change the resulting surfaces.
+# Getters missing from older Slicer versions are skipped.
+CONVERSION_PARAMETER_NAME_GETTERS = (
+    "GetDecimationFactorParameterName",
+    "GetSmoothingFactorParameterName",
+    "GetComputeSurfaceNormalsParameterName",
+    "GetJointSmoothingParameterName",
+    "GetConversionMethodParameterName",
+)
+
+# Surfaces of small lesions are decimated to no fewer triangles than this, or left as they are.
+MIN_LEVEL_TRIANGLES = 64
+
+
+@dataclass(frozen=True)
+class DetailLevel:
+    """A coarser level of detail of closed surfaces: the fraction of triangles removed, then smoothed."""
+    reduction: float
+    smoothing_iterations: int = 0
+
+
+DEFAULT_DETAIL_LEVELS = (DetailLevel(0.75, 10), DetailLevel(0.95, 20))
+
+
+def closed_surface_name() -> str:
+    return slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+
+
+def binary_labelmap_name() -> str:
+    return slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName()
+
+
+def get_conversion_parameters(segmentation) -> str:
+    rule_class = slicer.vtkBinaryLabelmapToClosedSurfaceConversionRule
+    parameter_names = [
+        getattr(rule_class, getter)() for getter in CONVERSION_PARAMETER_NAME_GETTERS if hasattr(rule_class, getter)
+    ]
+    return json.dumps({name: segmentation.GetConversionParameter(name) for name in parameter_names}, sort_keys=True)
+
+
+def register_closed_surface_conversion_rule() -> None:
+    """
+    The Segmentations module registers its conversion rules when Slicer starts. Processes that run without the
+    application (e.g. PythonSlicer workers) have to register the one they need themselves.
+    """
+    slicer.vtkSegmentationConverterFactory.GetInstance().RegisterConverterRule(
+        slicer.vtkBinaryLabelmapToClosedSurfaceConversionRule()
+    )
+
+
+def segmentation_from_labelmap(decoded: DecodedVolume):
+    """Builds a vtkSegmentation with one segment per label sharing a single labelmap, without an MRML scene."""
+    labelmap = slicer.vtkOrientedImageData()
+    labelmap.SetDimensions(*reversed(decoded.array.shape))
+    labelmap.GetPointData().SetScalars(numpy_support.numpy_to_vtk(decoded.array.reshape(-1), deep=True))
+    labelmap.SetImageToWorldMatrix(slicer.util.vtkMatrixFromArray(decoded.ijk_to_ras))
+
+    label_value_to_name = {segment_info.label_value: segment_info.name for segment_info in decoded.segments}
+    label_values = list(label_value_to_name) or [int(value) for value in np.unique(decoded.array) if value != 0]
+
+    segmentation = slicer.vtkSegmentation()
+    for label_value in label_values:
+        segment = slicer.vtkSegment()
+        segment.SetName(label_value_to_name.get(label_value, str(label_value)))
+        segment.SetLabelValue(label_value)
+        segment.AddRepresentation(binary_labelmap_name(), labelmap)
+        segmentation.AddSegment(segment)
+    return segmentation
+
+
+def detail_levels_key(detail_levels) -> str:
+    return json.dumps([asdict(detail_level) for detail_level in detail_levels])
+
+
+def count_triangles(surface) -> int:
+    return surface.GetNumberOfPolys()
+
+
+def decimate_surface(surface, detail_level: DetailLevel):
+    """A copy of surface with detail_level applied, or surface itself if it is too small to be decimated."""
+    triangles = count_triangles(surface)
+    reduction = min(detail_level.reduction, 1.0 - MIN_LEVEL_TRIANGLES / triangles) if triangles else 0.0
+    if reduction <= 0.0:
+        return surface
+
+    triangle_filter = vtk.vtkTriangleFilter()
+    triangle_filter.SetInputData(surface)
+    last_filter = vtk.vtkQuadricDecimation()
+    last_filter.SetInputConnection(triangle_filter.GetOutputPort())
+    last_filter.SetTargetReduction(reduction)
+    last_filter.VolumePreservationOn()
+    if detail_level.smoothing_iterations:
+        smoothing = vtk.vtkWindowedSincPolyDataFilter()
+        smoothing.SetInputConnection(last_filter.GetOutputPort())
+        smoothing.SetNumberOfIterations(detail_level.smoothing_iterations)
+        smoothing.SetPassBand(0.1)
+        smoothing.BoundarySmoothingOff()
+        smoothing.NonManifoldSmoothingOn()
+        smoothing.NormalizeCoordinatesOn()
+        last_filter = smoothing
+    if surface.GetPointData().GetNormals() is not None:
+        # Decimation drops the point data, so normals are computed again for the coarser surface.
+        normals = vtk.vtkPolyDataNormals()
+        normals.SetInputConnection(last_filter.GetOutputPort())
+        normals.ConsistencyOn()
+        normals.SplittingOff()
+        last_filter = normals
+    last_filter.Update()
+    decimated = vtk.vtkPolyData()
+    decimated.DeepCopy(last_filter.GetOutput())
+    return decimated
+
+
+def build_detail_levels(surface, detail_levels) -> list:
+    """surface followed by its decimated copy at each of detail_levels, from the finest to the coarsest."""
+    return [surface] + [decimate_surface(surface, detail_level) for detail_level in detail_levels]
+
+
+def get_surface_file_name(label_value: int, level: int) -> str:
+    return f"label_{label_value}.vtp" if level == 0 else f"label_{label_value}_level_{level}.vtp"
+
+
+class SurfaceCache:
+    """
+    Closed surfaces of segmentation files on disk, one directory per source file content, set of conversion
+    parameters and detail levels, holding a .vtp file per label value and level.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = Path(cache_dir)
+
+    def get_key(self, source_path: str, conversion_parameters: str, detail_levels=(), content_id=None) -> str:
+        """Keyed by the SHA-256 of source_path, or by content_id if given, e.g. for files in an object store."""
+        sha256 = hashlib.sha256((content_id if content_id is not None else file_sha256(source_path)).encode())
+        sha256.update(conversion_parameters.encode())
+        # Entries without detail levels keep the keys they had before levels were added.
+        if detail_levels:
+            sha256.update(detail_levels_key(detail_levels).encode())
+        return sha256.hexdigest()
+
+    def load(self, key: str) -> Optional[dict]:
+        """Label value -> surface at each level, the full surface first."""
+        entry_dir = self.cache_dir / key
+        try:
+            with open(entry_dir / "manifest.json") as f:
+                manifest = json.load(f)
+            label_values = manifest["label_values"]
+            levels = manifest.get("levels", 1)
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+        label_value_to_surfaces = {}
+        for label_value in label_values:
+            surfaces = []
+            for level in range(levels):
+                reader = vtk.vtkXMLPolyDataReader()
+                reader.SetFileName(str(entry_dir / get_surface_file_name(label_value, level)))
+                reader.Update()
+                if reader.GetErrorCode():
+                    return None
+                surfaces.append(reader.GetOutput())
+            label_value_to_surfaces[label_value] = surfaces
+        return label_value_to_surfaces
+
+    def save(self, key: str, label_value_to_surfaces: dict) -> None:
+        entry_dir = self.cache_dir / key
+        os.makedirs(entry_dir, exist_ok=True)
+        levels = 1
+        for label_value, surfaces in label_value_to_surfaces.items():
+            levels = len(surfaces)
+            for level, surface in enumerate(surfaces):
+                writer = vtk.vtkXMLPolyDataWriter()
+                writer.SetFileName(str(entry_dir / get_surface_file_name(label_value, level)))
+                writer.SetInputData(surface)
+                writer.Write()
+        # The manifest is written last so that a partially written entry is never loaded.
+        with open(entry_dir / "manifest.json", "w") as f:
+            json.dump({"label_values": list(label_value_to_surfaces), "levels": levels}, f)
+
+
+def build_surfaces(segmentation, source_path: str, surface_cache: Optional[SurfaceCache] = None,
+                   detail_levels=(), content_id: Optional[str] = None) -> dict:
+    """
+    Returns segment ID -> closed surface at each level for a vtkSegmentation that is not part of a scene: the full
+    surface, then its decimated copy at each of detail_levels. Uses surface_cache when it has them. Cache entries are
+    keyed by label value, so segmentations built from the same file in different ways (loaded by Slicer, or by
+    segmentation_from_labelmap) share them.
+    """
+    segment_ids = list(segmentation.GetSegmentIDs())
+    label_value_to_segment_id = {
+        segmentation.GetSegment(segment_id).GetLabelValue(): segment_id for segment_id in segment_ids
+    }
+    # Segments in separate layers can share label values, and cannot be told apart by them.
+    cacheable = surface_cache is not None and len(label_value_to_segment_id) == len(segment_ids)
+
+    if cacheable:
+        key = surface_cache.get_key(source_path, get_conversion_parameters(segmentation), detail_levels, content_id)
+        label_value_to_surfaces = surface_cache.load(key)
+        if label_value_to_surfaces is not None and set(label_value_to_surfaces) == set(label_value_to_segment_id):
+            return {
+                label_value_to_segment_id[label_value]: surfaces
+                for label_value, surfaces in label_value_to_surfaces.items()
+            }
+
+    if not segmentation.CreateRepresentation(closed_surface_name()):
+        raise RuntimeError(f"Closed surface conversion failed for {source_path}")
+    segment_id_to_surfaces = {
+        segment_id: build_detail_levels(
+            segmentation.GetSegment(segment_id).GetRepresentation(closed_surface_name()), detail_levels
+        )
+        for segment_id in segment_ids
+    }
+    if cacheable:
+        surface_cache.save(key, {
+            label_value: segment_id_to_surfaces[segment_id]
+            for label_value, segment_id in label_value_to_segment_id.items()
+        })
+    return segment_id_to_surfaces
+
+
+class SurfaceBuilder:
+    """
+    Builds the closed surface representation of segmentation nodes on a worker thread, so that the 2D
+    labelmap slices can be shown straight away, and reuses surfaces from a SurfaceCache when it has them.
+    request() and everything that touches nodes run on the main thread; finished surfaces are attached
+    to their nodes from a polling QTimer. With level_of_detail, the coarser levels of detail of the surfaces
+    are built along with them, and handed to it.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_workers: int = 1, level_of_detail=None) -> None:
+        # Imported here since the prewarm and export workers import this module in PythonSlicer, which has no Qt.
+        import qt
+        self.surface_cache = SurfaceCache(cache_dir) if cache_dir is not None else None
+        self.level_of_detail = level_of_detail
+        self.detail_levels = level_of_detail.detail_levels if level_of_detail is not None else ()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataSurfaces")
+        self.node_id_to_future = {}
+        self.timer = qt.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(POLL_INTERVAL_MS)
+        self.timer.connect("timeout()", self.poll)
+
+    def request(self, seg_node, source_path: str, content_id: Optional[str] = None) -> None:
+        # The worker gets its own copy, so that it never touches an object that is part of the scene.
+        segmentation = slicer.vtkSegmentation()
+        segmentation.DeepCopy(seg_node.GetSegmentation())
+        self.node_id_to_future[seg_node.GetID()] = self.executor.submit(
+            build_surfaces, segmentation, source_path, self.surface_cache, self.detail_levels, content_id
+        )
+        self.timer.start()
+
+    def poll(self) -> None:
+        for node_id, future in list(self.node_id_to_future.items()):
+            if not future.done():
+                continue
+            del self.node_id_to_future[node_id]
+            seg_node = slicer.mrmlScene.GetNodeByID(node_id)
+            if seg_node is None or future.cancelled():
+                continue
+            try:
+                segment_id_to_surfaces = future.result()
+            except Exception as e:
+                logging.warning(f"{e}, building the surface on the main thread")
+                seg_node.CreateClosedSurfaceRepresentation()
+                continue
+            self.apply(seg_node, segment_id_to_surfaces)
+
+        if self.node_id_to_future:
+            self.timer.start()
+
+    def apply(self, seg_node, segment_id_to_surfaces: dict) -> None:
+        segmentation = seg_node.GetSegmentation()
+        with slicer.util.NodeModify(seg_node):
+            for segment_id, surfaces in segment_id_to_surfaces.items():
+                segment = segmentation.GetSegment(segment_id)
+                if segment is not None:
+                    segment.AddRepresentation(closed_surface_name(), surfaces[0])
+            display_node = seg_node.GetDisplayNode()
+            if display_node is not None:
+                display_node.SetPreferredDisplayRepresentationName3D(closed_surface_name())
+        if self.level_of_detail is not None:
+            self.level_of_detail.add(seg_node, segment_id_to_surfaces)
+
+    def is_pending(self, seg_node) -> bool:
+        return seg_node.GetID() in self.node_id_to_future
+
+    def reset(self) -> None:
+        for future in self.node_id_to_future.values():
+            future.cancel()
+        self.node_id_to_future = {}
+        self.timer.stop()
+
+    def shutdown(self) -> None:
+        self.reset()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+import numpy as np
+from packages.loading.decode import DecodedVolume, read_volume
+from packages.utils.utils import MEBIBYTE, file_sha256
+
+
+class VolumeCache:
+    """
+    Decoded volumes on disk, stored once as uncompressed raw voxels (.raw) next to a small JSON header (.json)
+    with their geometry and the size, mtime and SHA-256 of the source file. Cached volumes are returned as
+    copy-on-write memory maps, so loading them costs page cache reads instead of gzip decompression.
+    The least recently used entries are removed once the cache grows past max_bytes.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 10 * 1024 * MEBIBYTE) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def get_entry_paths(self, source_path: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(os.path.abspath(source_path).encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.raw"
+
+    def read(self, source_path: str) -> DecodedVolume:
+        """Returns the cached volume, decoding and caching source_path first if needed."""
+        decoded = self.load(source_path)
+        if decoded is not None:
+            return decoded
+        decoded = read_volume(source_path)
+        try:
+            self.save(source_path, decoded)
+        except OSError as e:
+            logging.warning(f"Could not cache {source_path}: {e}")
+        return decoded
+
+    def load(self, source_path: str) -> Optional[DecodedVolume]:
+        header_path, raw_path = self.get_entry_paths(source_path)
+        try:
+            with open(header_path) as f:
+                header = json.load(f)
+            if not self.is_valid(source_path, header, header_path):
+                self.remove(header_path, raw_path)
+                return None
+            array = np.memmap(raw_path, dtype=np.dtype(header["dtype"]), mode="c", shape=tuple(header["shape"]))
+            # Marks the entry as recently used for eviction.
+            os.utime(raw_path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return DecodedVolume(array, np.array(header["ijk_to_ras"]))
+
+    def is_valid(self, source_path: str, header: dict, header_path: Path) -> bool:
+        stat = os.stat(source_path)
+        if stat.st_size != header["source_size"]:
+            return False
+        if stat.st_mtime_ns == header["source_mtime_ns"]:
+            return True
+        # Touched but possibly unchanged (e.g. copied with a new mtime): the content decides.
+        if file_sha256(source_path) != header["source_sha256"]:
+            return False
+        header["source_mtime_ns"] = stat.st_mtime_ns
+        self.write_header(header_path, header)
+        return True
+
+    def save(self, source_path: str, decoded: DecodedVolume) -> None:
+        header_path, raw_path = self.get_entry_paths(source_path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stat = os.stat(source_path)
+        array = np.ascontiguousarray(decoded.array)
+        header = {
+            "source_path": os.path.abspath(source_path),
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "source_sha256": file_sha256(source_path),
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "ijk_to_ras": decoded.ijk_to_ras.tolist(),
+        }
+        # Written to temporary files and renamed, so that other threads and processes never see a partial entry.
+        temp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        temp_raw_path = raw_path.with_name(raw_path.name + temp_suffix)
+        array.tofile(temp_raw_path)
+        os.replace(temp_raw_path, raw_path)
+        self.write_header(header_path, header)
+        self.evict()
+
+    def write_header(self, header_path: Path, header: dict) -> None:
+        temp_header_path = header_path.with_name(header_path.name + f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_header_path, "w") as f:
+            json.dump(header, f)
+        os.replace(temp_header_path, header_path)
+
+    def remove(self, header_path: Path, raw_path: Path) -> None:
+        for path in (header_path, raw_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def usage_bytes(self) -> int:
+        return sum(raw_path.stat().st_size for raw_path in self.cache_dir.glob("*.raw"))
+
+    def evict(self) -> None:
+        with self.lock:
+            entries = []
+            for raw_path in self.cache_dir.glob("*.raw"):
+                try:
+                    stat = raw_path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, raw_path))
+            usage_bytes = sum(size for _, size, _ in entries)
+            for _, size, raw_path in sorted(entries):
+                if usage_bytes <= self.max_bytes:
+                    break
+                self.remove(raw_path.with_suffix(".json"), raw_path)
+                usage_bytes -= size
@@ -0,0 +1,128 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import logging
+import math
+import time
+from typing import Callable, Optional
+import qt
+
+
+@dataclass
+class CineStats:
+    frames_shown: int
+    # Frame deadlines at the target frame rate that passed without a new frame, because decoding was behind.
+    frames_dropped: int
+    target_fps: float
+    achieved_fps: float
+
+
+class CinePlayer:
+    """
+    Plays frame_indices in a loop at a target frame rate. The next buffer_size frames are decoded ahead on worker
+    threads by decode_frame(index) into a bounded ring buffer, and show_frame(index, frame) is called on the main
+    thread from a QTimer. A frame that is not decoded by its deadline is not skipped: the current frame is held and
+    the missed deadline is counted as dropped. With no more frames than buffer_size, every frame is decoded once
+    and kept for the whole playback.
+    """
+
+    def __init__(
+        self,
+        frame_indices: list[int],
+        decode_frame: Callable,
+        show_frame: Callable,
+        fps: float = 4.0,
+        buffer_size: int = 8,
+        max_workers: int = 2,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        if not frame_indices:
+            raise ValueError("Cannot play a series without frames")
+        self.frame_indices = list(frame_indices)
+        self.decode_frame = decode_frame
+        self.show_frame = show_frame
+        self.buffer_size = max(1, buffer_size)
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataCine")
+        # Position in frame_indices to its decode, for the frames ahead of the current one.
+        self.position_to_future: dict[int, Future] = {}
+        self.position = -1
+        self.playing = False
+        self.frames_shown = 0
+        self.start_time = None
+        self.timer = qt.QTimer()
+        self.timer.connect("timeout()", self.on_tick)
+        self.fps = fps
+        self.set_fps(fps)
+
+    def set_fps(self, fps: float) -> None:
+        if fps <= 0:
+            raise ValueError(f"The frame rate must be positive, not {fps}")
+        if self.playing:
+            # Deadlines are counted from the start, so restart counting at the new rate.
+            self.start_time = self.clock()
+            self.frames_shown = 0
+        self.fps = fps
+        self.timer.setInterval(int(round(1000 / fps)))
+
+    def window(self) -> list[int]:
+        """Positions of the frames to hold decoded: the next buffer_size frames after the current one."""
+        frame_count = len(self.frame_indices)
+        return [(self.position + offset) % frame_count for offset in range(1, min(self.buffer_size, frame_count) + 1)]
+
+    def fill(self) -> None:
+        window = self.window()
+        for position in list(self.position_to_future):
+            if position not in window:
+                self.position_to_future.pop(position).cancel()
+        for position in window:
+            if position not in self.position_to_future:
+                self.position_to_future[position] = self.executor.submit(self.decode_frame, self.frame_indices[position])
+
+    def start(self, start_index: Optional[int] = None) -> None:
+        """Starts playing from start_index, or else from the first frame, once it is decoded."""
+        position = self.frame_indices.index(start_index) if start_index in self.frame_indices else 0
+        self.position = position - 1
+        self.fill()
+        self.playing = True
+        self.frames_shown = 0
+        self.start_time = self.clock()
+        self.timer.start()
+
+    def on_tick(self) -> None:
+        if not self.playing:
+            return
+        next_position = (self.position + 1) % len(self.frame_indices)
+        future = self.position_to_future.get(next_position)
+        if future is None or not future.done():
+            return
+        self.position = next_position
+        try:
+            frame = future.result()
+        except Exception as e:
+            logging.warning(f"Could not decode frame {self.frame_indices[next_position]} for playback: {e}")
+            frame = None
+        if frame is not None:
+            self.show_frame(self.frame_indices[next_position], frame)
+            self.frames_shown += 1
+        self.fill()
+
+    def stats(self) -> CineStats:
+        elapsed = self.clock() - self.start_time if self.start_time is not None else 0.0
+        deadlines = math.floor(elapsed * self.fps)
+        return CineStats(
+            frames_shown=self.frames_shown,
+            frames_dropped=max(0, deadlines - self.frames_shown),
+            target_fps=self.fps,
+            achieved_fps=self.frames_shown / elapsed if elapsed > 0 else 0.0,
+        )
+
+    def stop(self) -> None:
+        self.playing = False
+        self.timer.stop()
+        for future in self.position_to_future.values():
+            future.cancel()
+        self.position_to_future = {}
+
+    def shutdown(self) -> None:
+        self.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,135 @@
+import logging
+import numpy as np
+import slicer
+import vtk
+
+# Layout ids of the side by side layouts are COMPARE_LAYOUT_ID_BASE + the number of views, clear of Slicer's own.
+COMPARE_LAYOUT_ID_BASE = 1500
+MAX_COMPARE_VIEWS = 8
+
+
+def compare_view_name(position: int) -> str:
+    return f"MSLesionCompare{position}"
+
+
+def compare_layout_description(view_count: int, orientation: str = "Axial") -> str:
+    """Slicer layout XML of view_count slice views in a row, all in one view group so that they can be linked."""
+    items = "".join(
+        "<item>"
+        f'<view class="vtkMRMLSliceNode" singletontag="{compare_view_name(position)}">'
+        f'<property name="orientation" action="default">{orientation}</property>'
+        f'<property name="viewlabel" action="default">{position + 1}</property>'
+        '<property name="viewcolor" action="default">#808080</property>'
+        '<property name="viewgroup" action="default">1</property>'
+        "</view>"
+        "</item>"
+        for position in range(view_count)
+    )
+    return f'<layout type="horizontal">{items}</layout>'
+
+
+def grids_match(grids: list[tuple[tuple, np.ndarray]], atol: float = 1e-3) -> bool:
+    """Whether all (dimensions, IJK to RAS matrix) grids are the same, so voxels line up across them."""
+    dimensions, ijk_to_ras = grids[0]
+    return all(
+        tuple(other_dimensions) == tuple(dimensions) and np.allclose(other_ijk_to_ras, ijk_to_ras, atol=atol)
+        for other_dimensions, other_ijk_to_ras in grids[1:]
+    )
+
+
+def node_grid(volume_node) -> tuple[tuple, np.ndarray]:
+    ijk_to_ras = vtk.vtkMatrix4x4()
+    volume_node.GetIJKToRASMatrix(ijk_to_ras)
+    return tuple(volume_node.GetImageData().GetDimensions()), slicer.util.arrayFromVTKMatrix(ijk_to_ras)
+
+
+class CompareLayout:
+    """
+    Shows several timepoints side by side, one per slice view, in a layout whose views are linked, so that
+    scrolling, panning and zooming one moves them all. All volumes are shown through one shared display node,
+    so they share the lookup table and window/level. If the timepoints are on the same grid, the field of view
+    is computed once for the first view and copied to the others. Each segmentation is only shown in the view
+    of its timepoint. close() restores the previous layout and the nodes as they were.
+    All methods must be called from the main thread.
+    """
+
+    def __init__(self) -> None:
+        self.previous_layout = None
+        # Node id to the display node id it had before it was shown side by side.
+        self.volume_node_id_to_display_node_id = {}
+        self.segmentation_nodes = []
+        self.shared_grid = False
+
+    @property
+    def is_shown(self) -> bool:
+        return self.previous_layout is not None
+
+    def show(self, nodes: list[tuple]) -> None:
+        """Shows each (volume node, segmentation node) of nodes in its own view, left to right."""
+        if not 0 < len(nodes) <= MAX_COMPARE_VIEWS:
+            raise ValueError(f"Can show 1 to {MAX_COMPARE_VIEWS} timepoints side by side, not {len(nodes)}")
+        self.close()
+
+        layout_manager = slicer.app.layoutManager()
+        layout_node = layout_manager.layoutLogic().GetLayoutNode()
+        layout_id = COMPARE_LAYOUT_ID_BASE + len(nodes)
+        if not layout_node.IsLayoutDescription(layout_id):
+            layout_node.AddLayoutDescription(layout_id, compare_layout_description(len(nodes)))
+        self.previous_layout = layout_node.GetViewArrangement()
+        layout_manager.setLayout(layout_id)
+
+        volume_nodes = [volume_node for volume_node, _ in nodes]
+        self.share_display_node(volume_nodes)
+        self.shared_grid = grids_match([node_grid(volume_node) for volume_node in volume_nodes])
+        if not self.shared_grid:
+            logging.info("The timepoints shown side by side are on different grids, so each view is fitted separately")
+
+        first_slice_node = None
+        for position, (volume_node, segmentation_node) in enumerate(nodes):
+            slice_widget = layout_manager.sliceWidget(compare_view_name(position))
+            composite_node = slice_widget.mrmlSliceCompositeNode()
+            composite_node.SetBackgroundVolumeID(volume_node.GetID())
+            composite_node.SetForegroundVolumeID(None)
+            composite_node.SetLabelVolumeID(None)
+            composite_node.SetLinkedControl(True)
+
+            slice_node = slice_widget.mrmlSliceNode()
+            display_node = segmentation_node.GetDisplayNode()
+            display_node.SetViewNodeIDs([slice_node.GetID()])
+            segmentation_node.SetDisplayVisibility(1)
+            self.segmentation_nodes.append(segmentation_node)
+
+            if first_slice_node is None or not self.shared_grid:
+                slice_widget.sliceLogic().FitSliceToAll()
+                if first_slice_node is None:
+                    first_slice_node = slice_node
+                continue
+            with slicer.util.NodeModify(slice_node):
+                slice_node.GetSliceToRAS().DeepCopy(first_slice_node.GetSliceToRAS())
+                slice_node.SetFieldOfView(*first_slice_node.GetFieldOfView())
+                slice_node.UpdateMatrices()
+
+    def share_display_node(self, volume_nodes) -> None:
+        shared_display_node = volume_nodes[0].GetDisplayNode()
+        for volume_node in volume_nodes[1:]:
+            self.volume_node_id_to_display_node_id[volume_node.GetID()] = volume_node.GetDisplayNodeID()
+            volume_node.SetAndObserveDisplayNodeID(shared_display_node.GetID())
+
+    def close(self) -> None:
+        """Restores the previous layout. The segmentations that were shown are hidden."""
+        if not self.is_shown:
+            return
+        for node_id, display_node_id in self.volume_node_id_to_display_node_id.items():
+            volume_node = slicer.mrmlScene.GetNodeByID(node_id)
+            if volume_node is not None:
+                volume_node.SetAndObserveDisplayNodeID(display_node_id)
+        for segmentation_node in self.segmentation_nodes:
+            if segmentation_node.GetScene() is None:
+                # Removed from the scene meanwhile, e.g. evicted from the node cache.
+                continue
+            segmentation_node.GetDisplayNode().RemoveAllViewNodeIDs()
+            segmentation_node.SetDisplayVisibility(0)
+        slicer.app.layoutManager().setLayout(self.previous_layout)
+        self.previous_layout = None
+        self.volume_node_id_to_display_node_id = {}
+        self.segmentation_nodes = []
@@ -0,0 +1,83 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+import SimpleITK as sitk
+from packages.profiling.profiler import profiled
+
+# SimpleITK reports geometry in LPS, Slicer works in RAS.
+LPS_TO_RAS = np.diag([-1.0, -1.0, 1.0])
+
+
+@dataclass
+class SegmentInfo:
+    label_value: int
+    name: str
+    color: Optional[tuple[float, float, float]] = None
+
+
+@dataclass
+class DecodedVolume:
+    """
+    Voxels and geometry of a volume file, decoded without touching the MRML scene so that it can be done
+    on a worker thread. array is indexed (k, j, i), as returned by slicer.util.arrayFromVolume.
+    """
+    array: np.ndarray
+    ijk_to_ras: np.ndarray
+    segments: list[SegmentInfo] = field(default_factory=list)
+
+    @property
+    def nbytes(self) -> int:
+        return self.array.nbytes
+
+    @property
+    def spacing(self) -> np.ndarray:
+        return np.linalg.norm(self.ijk_to_ras[:3, :3], axis=0)
+
+
+def image_to_ijk_to_ras(image) -> np.ndarray:
+    """Geometry of an sitk.Image, or of an sitk.ImageFileReader after ReadImageInformation()."""
+    direction = np.array(image.GetDirection()).reshape(3, 3)
+    ijk_to_ras = np.eye(4)
+    ijk_to_ras[:3, :3] = LPS_TO_RAS @ direction @ np.diag(image.GetSpacing())
+    ijk_to_ras[:3, 3] = LPS_TO_RAS @ np.array(image.GetOrigin())
+    return ijk_to_ras
+
+
+def read_segments_info(image: sitk.Image) -> list[SegmentInfo]:
+    # Segmentation .nrrd files written by Slicer store one Segment{n}_* group of keys per segment.
+    keys = set(image.GetMetaDataKeys())
+    segments = []
+    for n in range(len(keys)):
+        if f"Segment{n}_LabelValue" not in keys:
+            break
+        color = None
+        if f"Segment{n}_Color" in keys:
+            color = tuple(float(c) for c in image.GetMetaData(f"Segment{n}_Color").split())
+        segments.append(SegmentInfo(
+            label_value=int(image.GetMetaData(f"Segment{n}_LabelValue")),
+            name=image.GetMetaData(f"Segment{n}_Name") if f"Segment{n}_Name" in keys else str(n),
+            color=color,
+        ))
+    return segments
+
+
+def read_volume_info(path: str) -> tuple[tuple, np.ndarray]:
+    """Array shape, in (k, j, i) order, and IJK to RAS matrix of a volume file, read from its header only."""
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(str(path))
+    reader.ReadImageInformation()
+    return tuple(reversed(reader.GetSize())), image_to_ijk_to_ras(reader)
+
+
+@profiled()
+def read_volume(path: str) -> DecodedVolume:
+    image = sitk.ReadImage(str(path))
+    return DecodedVolume(sitk.GetArrayFromImage(image), image_to_ijk_to_ras(image))
+
+
+@profiled()
+def read_labelmap(path: str) -> DecodedVolume:
+    image = sitk.ReadImage(str(path))
+    if image.GetNumberOfComponentsPerPixel() > 1:
+        raise ValueError(f"Segmentations with overlapping layers cannot be decoded as a labelmap: {path}")
+    return DecodedVolume(sitk.GetArrayFromImage(image), image_to_ijk_to_ras(image), read_segments_info(image))
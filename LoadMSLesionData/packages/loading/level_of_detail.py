@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+import qt
+import slicer
+from packages.cache.surface_cache import DEFAULT_DETAIL_LEVELS, closed_surface_name, count_triangles
+
+RESTORE_DELAY_MS = 300
+# Interactor events that start moving the camera of a 3D view, and that end it. Wheel steps do both.
+INTERACTION_START_EVENTS = ("LeftButtonPressEvent", "MiddleButtonPressEvent", "RightButtonPressEvent")
+INTERACTION_END_EVENTS = ("LeftButtonReleaseEvent", "MiddleButtonReleaseEvent", "RightButtonReleaseEvent")
+WHEEL_EVENTS = ("MouseWheelForwardEvent", "MouseWheelBackwardEvent")
+# Observed before the interactor style, which can abort events it handles.
+OBSERVER_PRIORITY = 10.0
+
+
+@dataclass
+class LevelReport:
+    level: int
+    reduction: float
+    triangles: int
+    memory_bytes: int
+
+
+class LevelOfDetail:
+    """
+    Switches the closed surfaces of segmentation nodes between their levels of detail. While the camera of a 3D view
+    is moved, the visible surfaces are shown at the finest level whose triangles, summed over all of them, fit in
+    interactive_triangle_budget. Full detail is restored once the camera has been still for restore_delay_ms.
+    Everything here runs on the main thread.
+    """
+
+    def __init__(self, detail_levels=DEFAULT_DETAIL_LEVELS, interactive_triangle_budget: int = 200_000,
+                 restore_delay_ms: int = RESTORE_DELAY_MS) -> None:
+        self.detail_levels = tuple(detail_levels)
+        self.interactive_triangle_budget = interactive_triangle_budget
+        # Node ID -> segment ID -> surface at each level, and the level that each node shows.
+        self.node_id_to_surfaces = {}
+        self.node_id_to_level = {}
+        self.interactor_to_tags = {}
+        self.timer = qt.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(restore_delay_ms)
+        self.timer.connect("timeout()", self.restore_full_detail)
+
+    def add(self, seg_node, segment_id_to_surfaces: dict) -> None:
+        """Tracks the levels of seg_node, which shows the finest one."""
+        self.prune()
+        self.node_id_to_surfaces[seg_node.GetID()] = segment_id_to_surfaces
+        self.node_id_to_level[seg_node.GetID()] = 0
+        self.observe_views()
+
+    def prune(self) -> None:
+        """Forgets the surfaces of nodes that were removed from the scene, e.g. evicted from the node cache."""
+        for node_id in list(self.node_id_to_surfaces):
+            seg_node = slicer.mrmlScene.GetNodeByID(node_id)
+            if seg_node is None or seg_node.GetScene() is None:
+                del self.node_id_to_surfaces[node_id]
+                del self.node_id_to_level[node_id]
+
+    def visible_node_ids(self) -> list[str]:
+        return [
+            node_id for node_id in self.node_id_to_surfaces
+            if slicer.mrmlScene.GetNodeByID(node_id).GetDisplayVisibility()
+        ]
+
+    def level_triangles(self, node_ids) -> list[int]:
+        """Triangles of the surfaces of node_ids at each level."""
+        triangles = [0] * (len(self.detail_levels) + 1)
+        for node_id in node_ids:
+            for surfaces in self.node_id_to_surfaces[node_id].values():
+                for level in range(len(triangles)):
+                    triangles[level] += count_triangles(surfaces[min(level, len(surfaces) - 1)])
+        return triangles
+
+    def choose_level(self) -> int:
+        """The finest level at which the visible surfaces fit in interactive_triangle_budget, else the coarsest."""
+        triangles = self.level_triangles(self.visible_node_ids())
+        for level, level_triangles in enumerate(triangles):
+            if level_triangles <= self.interactive_triangle_budget:
+                return level
+        return len(triangles) - 1
+
+    def set_level(self, node_id: str, level: int) -> None:
+        seg_node = slicer.mrmlScene.GetNodeByID(node_id)
+        segmentation = seg_node.GetSegmentation()
+        with slicer.util.NodeModify(seg_node):
+            for segment_id, surfaces in self.node_id_to_surfaces[node_id].items():
+                segment = segmentation.GetSegment(segment_id)
+                if segment is not None:
+                    segment.AddRepresentation(closed_surface_name(), surfaces[min(level, len(surfaces) - 1)])
+        self.node_id_to_level[node_id] = level
+
+    def on_interaction_started(self, caller=None, event=None) -> None:
+        self.timer.stop()
+        self.prune()
+        level = self.choose_level()
+        for node_id in self.visible_node_ids():
+            if self.node_id_to_level[node_id] != level:
+                self.set_level(node_id, level)
+
+    def on_interaction_ended(self, caller=None, event=None) -> None:
+        self.timer.start()
+
+    def on_wheel(self, caller=None, event=None) -> None:
+        self.on_interaction_started()
+        self.on_interaction_ended()
+
+    def restore_full_detail(self) -> None:
+        self.prune()
+        for node_id, level in list(self.node_id_to_level.items()):
+            if level != 0:
+                self.set_level(node_id, 0)
+
+    def observe_views(self) -> None:
+        """Observes the interactors of the 3D views of the layout that are not observed yet."""
+        layout_manager = slicer.app.layoutManager()
+        if layout_manager is None:
+            return
+        for view_index in range(layout_manager.threeDViewCount):
+            interactor = layout_manager.threeDWidget(view_index).threeDView().interactor()
+            if interactor in self.interactor_to_tags:
+                continue
+            callbacks = (
+                [(event, self.on_interaction_started) for event in INTERACTION_START_EVENTS]
+                + [(event, self.on_interaction_ended) for event in INTERACTION_END_EVENTS]
+                + [(event, self.on_wheel) for event in WHEEL_EVENTS]
+            )
+            self.interactor_to_tags[interactor] = [
+                interactor.AddObserver(event, callback, OBSERVER_PRIORITY) for event, callback in callbacks
+            ]
+
+    def report(self) -> list[LevelReport]:
+        """Triangles and memory of the surfaces of the loaded segmentation nodes at each level."""
+        self.prune()
+        triangles = self.level_triangles(self.node_id_to_surfaces)
+        memory_bytes = [0] * len(triangles)
+        for segment_id_to_surfaces in self.node_id_to_surfaces.values():
+            for surfaces in segment_id_to_surfaces.values():
+                for level in range(len(memory_bytes)):
+                    # Reported by VTK in KiB.
+                    memory_bytes[level] += surfaces[min(level, len(surfaces) - 1)].GetActualMemorySize() * 1024
+        reductions = [0.0] + [detail_level.reduction for detail_level in self.detail_levels]
+        return [
+            LevelReport(level, reductions[level], triangles[level], memory_bytes[level])
+            for level in range(len(triangles))
+        ]
+
+    def reset(self) -> None:
+        self.timer.stop()
+        self.node_id_to_surfaces = {}
+        self.node_id_to_level = {}
+
+    def shutdown(self) -> None:
+        self.reset()
+        for interactor, tags in self.interactor_to_tags.items():
+            for tag in tags:
+                interactor.RemoveObserver(tag)
+        self.interactor_to_tags = {}
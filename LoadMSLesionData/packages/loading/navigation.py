@@ -0,0 +1,68 @@
+import qt
+import slicer
+
+
+class NavigationScheduler:
+    """
+    Coalesces bursts of navigation requests, e.g. from clicking Next repeatedly, so that only the latest
+    target is loaded. request() only schedules load to run from the event loop. Requests made before it runs,
+    or while it runs (including those from parameter changes made by load itself), cause one more run
+    instead of one run each. A running load can call is_superseded() between its stages, which handles
+    pending user input and tells the load to stop early if a newer request came in or it was cancelled.
+    on_running_changed(running) is called when a run starts and ends, e.g. to disable the controls that must
+    not run inside a load while it handles user input.
+    All methods must be called from the main thread.
+    """
+
+    def __init__(self, load, delay_ms: int = 0, on_running_changed=None) -> None:
+        self.load = load
+        self.on_running_changed = on_running_changed
+        self.pending = False
+        self.running = False
+        self.cancelled = False
+        self.requests = 0
+        self.runs = 0
+        self.timer = qt.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.connect("timeout()", self.run)
+
+    def request(self) -> None:
+        self.requests += 1
+        self.pending = True
+        if not self.running:
+            self.timer.start()
+
+    def run(self) -> None:
+        # Re-entered when is_superseded() handles a timer event.
+        if self.running:
+            return
+        self.timer.stop()
+        self.running = True
+        if self.on_running_changed is not None:
+            self.on_running_changed(True)
+        try:
+            while self.pending:
+                self.pending = False
+                self.cancelled = False
+                self.runs += 1
+                self.load()
+        finally:
+            self.running = False
+            if self.on_running_changed is not None:
+                self.on_running_changed(False)
+
+    def is_superseded(self) -> bool:
+        slicer.app.processEvents()
+        return self.pending or self.cancelled
+
+    def flush(self) -> None:
+        """Runs a scheduled load now instead of from the event loop."""
+        if self.pending:
+            self.run()
+
+    def cancel(self) -> None:
+        """Drops a scheduled load, and stops a running one at its next is_superseded()."""
+        self.timer.stop()
+        self.pending = False
+        self.cancelled = self.running
@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+import gzip
+import struct
+import numpy as np
+
+NIFTI1_HEADER_BYTES = 348
+
+# NIfTI-1 datatype codes.
+NIFTI_DATATYPE_TO_DTYPE = {
+    2: np.uint8,
+    4: np.int16,
+    8: np.int32,
+    16: np.float32,
+    64: np.float64,
+    256: np.int8,
+    512: np.uint16,
+    768: np.uint32,
+    1024: np.int64,
+    1280: np.uint64,
+}
+
+
+@dataclass
+class NiftiHeader:
+    # Array shape in (k, j, i) order, matching SimpleITK and slicer.util.arrayFromVolume.
+    shape: tuple[int, int, int]
+    dtype: np.dtype
+    vox_offset: int
+    scl_slope: float
+    scl_inter: float
+
+
+def parse_nifti_header(raw: bytes) -> NiftiHeader:
+    """Parses the fields needed to read the voxels of a 3D, single component NIfTI-1 file."""
+    for endian in ("<", ">"):
+        if struct.unpack(f"{endian}i", raw[0:4])[0] == NIFTI1_HEADER_BYTES:
+            break
+    else:
+        raise ValueError("Not a NIfTI-1 header")
+
+    dim = struct.unpack(f"{endian}8h", raw[40:56])
+    if dim[0] < 3 or any(d > 1 for d in dim[4:dim[0] + 1]):
+        raise ValueError(f"Only 3D NIfTI images can be streamed, got dim {dim}")
+    datatype = struct.unpack(f"{endian}h", raw[70:72])[0]
+    if datatype not in NIFTI_DATATYPE_TO_DTYPE:
+        raise ValueError(f"Unsupported NIfTI datatype: {datatype}")
+    vox_offset = struct.unpack(f"{endian}f", raw[108:112])[0]
+    scl_slope, scl_inter = struct.unpack(f"{endian}2f", raw[112:120])
+
+    return NiftiHeader(
+        shape=(dim[3], dim[2], dim[1]),
+        dtype=np.dtype(NIFTI_DATATYPE_TO_DTYPE[datatype]).newbyteorder(endian),
+        vox_offset=int(vox_offset),
+        scl_slope=scl_slope,
+        scl_inter=scl_inter,
+    )
+
+
+def open_nifti(path: str):
+    return gzip.open(path, "rb") if str(path).endswith(".gz") else open(path, "rb")
+
+
+def read_nifti_header(path: str) -> NiftiHeader:
+    with open_nifti(path) as f:
+        return parse_nifti_header(f.read(NIFTI1_HEADER_BYTES))
+
+
+def iter_nifti_slabs(path: str, slab_slices: int):
+    """
+    Yields (k_start, slab) for consecutive slabs of at most slab_slices k-slices, decompressing the file once
+    from start to end, so that only one slab is held in memory at a time. Slabs are float32 with the
+    scl_slope/scl_inter scaling applied.
+    """
+    with open_nifti(path) as f:
+        header = parse_nifti_header(f.read(NIFTI1_HEADER_BYTES))
+        f.read(header.vox_offset - NIFTI1_HEADER_BYTES)
+        n_k, n_j, n_i = header.shape
+        for k_start in range(0, n_k, slab_slices):
+            n_slices = min(slab_slices, n_k - k_start)
+            count = n_slices * n_j * n_i
+            raw = f.read(count * header.dtype.itemsize)
+            slab = np.frombuffer(raw, dtype=header.dtype, count=count).astype(np.float32).reshape(n_slices, n_j, n_i)
+            # A zero slope means the voxel values are not scaled.
+            if header.scl_slope != 0.0 and (header.scl_slope != 1.0 or header.scl_inter != 0.0):
+                slab = slab * header.scl_slope + header.scl_inter
+            yield k_start, slab
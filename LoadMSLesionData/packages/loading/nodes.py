@@ -0,0 +1,76 @@
+import numpy as np
+import slicer
+import vtk
+from vtk.util import numpy_support
+from packages.loading.decode import DecodedVolume, SegmentInfo
+
+# Node creation must happen on the main thread; decoding (packages.loading.decode) does not.
+
+
+def set_image_data_from_array(volume_node, array: np.ndarray) -> None:
+    """
+    Wraps array in the node's image data without copying it, so an array backed by a memory map is paged in
+    on demand. The VTK array keeps a reference to array, so it stays alive as long as the image data.
+    """
+    array = np.ascontiguousarray(array)
+    image_data = vtk.vtkImageData()
+    image_data.SetDimensions(*reversed(array.shape))
+    vtk_array = numpy_support.numpy_to_vtk(array.reshape(-1), deep=False)
+    image_data.GetPointData().SetScalars(vtk_array)
+    volume_node.SetAndObserveImageData(image_data)
+
+
+def create_volume_node(decoded: DecodedVolume, name: str, class_name: str = "vtkMRMLScalarVolumeNode"):
+    volume_node = slicer.mrmlScene.AddNewNodeByClass(class_name, name)
+    set_image_data_from_array(volume_node, decoded.array)
+    volume_node.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(decoded.ijk_to_ras))
+    volume_node.CreateDefaultDisplayNodes()
+    return volume_node
+
+
+def replace_volume_image(volume_node, decoded: DecodedVolume) -> None:
+    """
+    Swaps decoded, e.g. the full resolution of a downsampled preview, into volume_node in place. The display node
+    is kept and automatic window/level is turned off, so that views and window/level stay as they are.
+    """
+    display_node = volume_node.GetDisplayNode()
+    # Labelmap volumes are shown through a color table rather than window/level.
+    if display_node is not None and display_node.IsA("vtkMRMLScalarVolumeDisplayNode"):
+        display_node.AutoWindowLevelOff()
+    with slicer.util.NodeModify(volume_node):
+        set_image_data_from_array(volume_node, decoded.array)
+        volume_node.SetIJKToRASMatrix(slicer.util.vtkMatrixFromArray(decoded.ijk_to_ras))
+
+
+def apply_segments_info(seg_node, segments_info: list[SegmentInfo]) -> None:
+    segmentation = seg_node.GetSegmentation()
+    label_value_to_segment = {}
+    for i in range(segmentation.GetNumberOfSegments()):
+        segment = segmentation.GetNthSegment(i)
+        label_value_to_segment[segment.GetLabelValue()] = segment
+
+    for segment_info in segments_info:
+        segment = label_value_to_segment.get(segment_info.label_value)
+        if segment is None:
+            continue
+        segment.SetName(segment_info.name)
+        if segment_info.color is not None:
+            segment.SetColor(*segment_info.color)
+
+
+def replace_segmentation_labelmap(seg_node, decoded: DecodedVolume) -> None:
+    """Replaces the segments of seg_node with those of the labelmap decoded, keeping the node and its display node."""
+    labelmap_node = create_volume_node(decoded, f"{seg_node.GetName()}_labelmap", "vtkMRMLLabelMapVolumeNode")
+    with slicer.util.NodeModify(seg_node):
+        seg_node.GetSegmentation().RemoveAllSegments()
+        seg_node.SetReferenceImageGeometryParameterFromVolumeNode(labelmap_node)
+        slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelmap_node, seg_node)
+    slicer.mrmlScene.RemoveNode(labelmap_node)
+    apply_segments_info(seg_node, decoded.segments)
+
+
+def create_segmentation_node(decoded: DecodedVolume, name: str):
+    seg_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode", name)
+    seg_node.CreateDefaultDisplayNodes()
+    replace_segmentation_labelmap(seg_node, decoded)
+    return seg_node
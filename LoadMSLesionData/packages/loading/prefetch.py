@@ -0,0 +1,104 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from typing import Optional
+from packages.loading.decode import DecodedVolume
+from packages.segmentation.file_types import FileType
+from packages.segmentation.segmentation import SegmentationDir, View
+
+
+class Prefetcher:
+    """
+    Decodes the files of neighbouring timepoints on a thread pool while the current timepoint is viewed,
+    so that only MRML node creation is left for the main thread when the user navigates to them.
+    All methods must be called from the main thread.
+    """
+
+    def __init__(self, radius: int = 1, max_workers: int = 2) -> None:
+        self.radius = radius
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataPrefetch")
+        self.path_to_future = {}
+
+    def get_targets(self, segmentation_dir: SegmentationDir, view: View, index: int) -> list[tuple[FileType, int]]:
+        """(FileType, index) pairs reachable from the current timepoint, nearest first."""
+        if view in (View.SUB, View.CHANGE):
+            # "Return to Standard View" goes to index + 1.
+            index = index + 1
+
+        targets = []
+        for distance in range(1, self.radius + 1):
+            for neighbour_index in (index + distance, index - distance):
+                if segmentation_dir.index_is_valid_for_img(neighbour_index):
+                    targets += [(FileType.IMG, neighbour_index), (FileType.IMG_SEGMENTATION, neighbour_index)]
+        if view == View.SUB:
+            targets = [(FileType.IMG, index), (FileType.IMG_SEGMENTATION, index)] + targets
+        elif view == View.CHANGE:
+            # img_{index} is shown already, under the change map.
+            targets = [(FileType.IMG_SEGMENTATION, index)] + targets
+        elif segmentation_dir.index_is_valid_for_sub_img(index - 1):
+            targets += [(FileType.SUB_IMG, index - 1), (FileType.SUB_IMG_SEGMENTATION, index - 1)]
+
+        return [target for target in targets if not segmentation_dir.node_exists(*target)]
+
+    def prefetch_around(self, segmentation_dir: SegmentationDir, view: View, index: int) -> None:
+        path_to_target = {
+            segmentation_dir.get_path(file_type, target_index): (file_type, target_index)
+            for file_type, target_index in self.get_targets(segmentation_dir, view, index)
+        }
+
+        # Work for timepoints that are no longer neighbours is stale. Decodes that already started cannot be
+        # interrupted, but their results are dropped as soon as they finish.
+        for path in list(self.path_to_future):
+            if path not in path_to_target:
+                self.path_to_future.pop(path).cancel()
+
+        self.prefetch(segmentation_dir, list(path_to_target.values()))
+
+    def prefetch(self, segmentation_dir: SegmentationDir, targets: list[tuple[FileType, int]]) -> None:
+        """Starts decoding the (FileType, index) targets that are not being decoded yet, in order."""
+        for file_type, target_index in targets:
+            path = segmentation_dir.get_path(file_type, target_index)
+            if path not in self.path_to_future:
+                self.path_to_future[path] = self.executor.submit(
+                    self.get_decoder(segmentation_dir, file_type, target_index), path
+                )
+
+    def get_decoder(self, segmentation_dir: SegmentationDir, file_type: FileType, index: int):
+        return lambda path: segmentation_dir.decode_file((file_type, index), path)
+
+    def take(self, path: str) -> Optional[DecodedVolume]:
+        """
+        Returns the decoded file if it was prefetched, waiting for it if it is still being decoded.
+        Returns None if it was never requested, so that the caller falls back to a synchronous load.
+        """
+        future = self.path_to_future.pop(path, None)
+        if future is None or future.cancel():
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            logging.warning(f"Prefetching {path} failed, loading it directly: {e}")
+            return None
+
+    def is_ready(self, path: str) -> bool:
+        future = self.path_to_future.get(path)
+        return future is not None and future.done()
+
+    def take_future(self, path: str) -> Optional[Future]:
+        """Hands over the decode of path, finished or not, e.g. to be applied once it finishes."""
+        return self.path_to_future.pop(path, None)
+
+    def discard(self, paths) -> None:
+        """Drops work on files that changed on disk, so that they are decoded again when next needed."""
+        for path in paths:
+            future = self.path_to_future.pop(path, None)
+            if future is not None:
+                future.cancel()
+
+    def reset(self) -> None:
+        for future in self.path_to_future.values():
+            future.cancel()
+        self.path_to_future = {}
+
+    def shutdown(self) -> None:
+        self.reset()
+        self.executor.shutdown(wait=False, cancel_futures=True)
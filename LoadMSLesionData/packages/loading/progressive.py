@@ -0,0 +1,73 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+from typing import Callable, Optional
+import qt
+import slicer
+from packages.cache.pyramid_cache import PyramidCache
+from packages.loading.decode import DecodedVolume
+
+POLL_INTERVAL_MS = 50
+
+
+class ProgressiveLoader:
+    """
+    Progressive display of timepoints: a downsampled level of a file, read from a PyramidCache in milliseconds,
+    is shown first, and the full resolution is swapped into the same node once it has been decoded on a worker
+    thread. request() and everything that touches nodes run on the main thread; finished decodes are applied
+    from a polling QTimer.
+    """
+
+    def __init__(self, pyramid_cache: PyramidCache, preview_factor: int = 4, max_workers: int = 1) -> None:
+        self.pyramid_cache = pyramid_cache
+        self.preview_factor = preview_factor
+        self.enabled = True
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataProgressive")
+        self.node_id_to_request = {}
+        self.timer = qt.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(POLL_INTERVAL_MS)
+        self.timer.connect("timeout()", self.poll)
+
+    def load_preview(self, path: str) -> Optional[DecodedVolume]:
+        if not self.enabled:
+            return None
+        return self.pyramid_cache.load(path, self.preview_factor)
+
+    def submit(self, decode: Callable[[], DecodedVolume]) -> Future:
+        return self.executor.submit(decode)
+
+    def request(self, node, future: Future, apply: Callable) -> None:
+        """Calls apply(node, decoded) on the main thread once future has decoded the full resolution."""
+        self.node_id_to_request[node.GetID()] = (future, apply)
+        self.timer.start()
+
+    def poll(self) -> None:
+        for node_id, (future, apply) in list(self.node_id_to_request.items()):
+            if not future.done():
+                continue
+            del self.node_id_to_request[node_id]
+            node = slicer.mrmlScene.GetNodeByID(node_id)
+            if node is None or future.cancelled():
+                continue
+            try:
+                decoded = future.result()
+            except Exception as e:
+                logging.warning(f"Could not load the full resolution of {node.GetName()}: {e}")
+                continue
+            apply(node, decoded)
+
+        if self.node_id_to_request:
+            self.timer.start()
+
+    def is_pending(self, node) -> bool:
+        return node.GetID() in self.node_id_to_request
+
+    def reset(self) -> None:
+        for future, _ in self.node_id_to_request.values():
+            future.cancel()
+        self.node_id_to_request = {}
+        self.timer.stop()
+
+    def shutdown(self) -> None:
+        self.reset()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+import threading
+from typing import Optional
+import numpy as np
+from packages.loading.decode import DecodedVolume, SegmentInfo
+
+
+def nonzero_bbox(array: np.ndarray) -> tuple[tuple, tuple]:
+    """(k, j, i) bounds of the non-zero voxels of array, max exclusive, or empty bounds at 0 if there are none."""
+    nonzero_per_axis = [np.flatnonzero(array.any(axis=axes)) for axes in ((1, 2), (0, 2), (0, 1))]
+    if len(nonzero_per_axis[0]) == 0:
+        return (0, 0, 0), (0, 0, 0)
+    return (
+        tuple(int(nonzero[0]) for nonzero in nonzero_per_axis),
+        tuple(int(nonzero[-1]) + 1 for nonzero in nonzero_per_axis),
+    )
+
+
+class SparseLabelmap:
+    """
+    Compact form of a decoded labelmap: the labelmap is cropped to the bounding box of its non-zero voxels, and
+    each label value in it is stored as a bit-packed mask. Lesion labelmaps are mostly background, so this is
+    usually orders of magnitude smaller than the dense array. Both directions are vectorized per label value.
+    """
+
+    def __init__(
+        self,
+        shape: tuple,
+        dtype: np.dtype,
+        bbox_min: tuple,
+        bbox_max: tuple,
+        label_values: np.ndarray,
+        packed_masks: list[np.ndarray],
+        ijk_to_ras: np.ndarray,
+        segments: list[SegmentInfo],
+    ) -> None:
+        self.shape = shape
+        self.dtype = dtype
+        # (k, j, i) bounds of the non-zero voxels, max exclusive.
+        self.bbox_min = bbox_min
+        self.bbox_max = bbox_max
+        self.label_values = label_values
+        self.packed_masks = packed_masks
+        self.ijk_to_ras = ijk_to_ras
+        self.segments = segments
+
+    @classmethod
+    def from_decoded(cls, decoded: DecodedVolume) -> "SparseLabelmap":
+        array = decoded.array
+        bbox_min, bbox_max = nonzero_bbox(array)
+        crop = array[tuple(slice(low, high) for low, high in zip(bbox_min, bbox_max))]
+        label_values = np.unique(crop)
+        label_values = label_values[label_values != 0]
+        packed_masks = [np.packbits(crop == label_value) for label_value in label_values]
+        return cls(
+            array.shape, array.dtype, bbox_min, bbox_max, label_values, packed_masks, decoded.ijk_to_ras, decoded.segments
+        )
+
+    @property
+    def crop_shape(self) -> tuple:
+        return tuple(high - low for low, high in zip(self.bbox_min, self.bbox_max))
+
+    def to_decoded(self) -> DecodedVolume:
+        array = np.zeros(self.shape, dtype=self.dtype)
+        crop = array[tuple(slice(low, high) for low, high in zip(self.bbox_min, self.bbox_max))]
+        crop_size = int(np.prod(self.crop_shape))
+        for label_value, packed_mask in zip(self.label_values, self.packed_masks):
+            mask = np.unpackbits(packed_mask, count=crop_size).view(bool).reshape(self.crop_shape)
+            crop[mask] = label_value
+        return DecodedVolume(array, self.ijk_to_ras, self.segments)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(packed_mask.nbytes for packed_mask in self.packed_masks) + self.label_values.nbytes
+
+    @property
+    def dense_nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def to_dense(decoded) -> Optional[DecodedVolume]:
+    """decoded as a DecodedVolume, expanding it if it is a SparseLabelmap."""
+    if isinstance(decoded, SparseLabelmap):
+        return decoded.to_decoded()
+    return decoded
+
+
+class CompressionStats:
+    """Running totals of labelmap sizes before and after compaction. Safe to use from several threads."""
+
+    def __init__(self) -> None:
+        self.dense_bytes = 0
+        self.compact_bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, sparse_labelmap: SparseLabelmap) -> None:
+        with self.lock:
+            self.dense_bytes += sparse_labelmap.dense_nbytes
+            self.compact_bytes += sparse_labelmap.nbytes
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """Dense size over compact size, or None before any labelmap was compacted."""
+        if self.compact_bytes == 0:
+            return None if self.dense_bytes == 0 else float("inf")
+        return self.dense_bytes / self.compact_bytes
@@ -0,0 +1,213 @@
+from dataclasses import dataclass
+import functools
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+# Set to 1 to record spans from the moment the module is imported, e.g. to profile Slicer startup.
+PROFILE_ENV_VAR = "LOADMSLESIONDATA_PROFILE"
+NANOSECONDS_PER_MICROSECOND = 1000
+NANOSECONDS_PER_MILLISECOND = 1000000
+
+
+@dataclass
+class SpanEvent:
+    name: str
+    thread_id: int
+    start_ns: int
+    duration_ns: int
+    # Duration minus that of the spans nested directly inside this one.
+    self_ns: int
+    args: Optional[dict] = None
+
+
+@dataclass
+class CounterEvent:
+    name: str
+    thread_id: int
+    time_ns: int
+    value: float
+
+
+@dataclass
+class SpanSummary:
+    name: str
+    count: int = 0
+    total_ns: int = 0
+    self_ns: int = 0
+    max_ns: int = 0
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.count if self.count else 0.0
+
+
+class Span:
+    def __init__(self, profiler: "Profiler", name: str, args: Optional[dict]) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start_ns = 0
+        self.child_ns = 0
+
+    def __enter__(self) -> "Span":
+        self.profiler.get_stack().append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        stack = self.profiler.get_stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_ns += duration_ns
+        self.profiler.record(SpanEvent(
+            self.name, threading.get_ident(), self.start_ns, duration_ns, duration_ns - self.child_ns, self.args
+        ))
+
+
+class NullSpan:
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """
+    Records nested, named timing spans and counters from any thread, and exports them as Chrome trace-event JSON
+    (open in chrome://tracing or https://ui.perfetto.dev) or as a per-span summary.
+    While disabled, spans and counters do nothing beyond checking the enabled flag.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.span_events = []
+        self.counter_events = []
+        self.counter_totals = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin_ns = time.perf_counter_ns()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        with self.lock:
+            self.span_events = []
+            self.counter_events = []
+            self.counter_totals = {}
+            self.origin_ns = time.perf_counter_ns()
+
+    def get_stack(self) -> list:
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args or None)
+
+    def record(self, event: SpanEvent) -> None:
+        with self.lock:
+            self.span_events.append(event)
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            total = self.counter_totals.get(name, 0) + value
+            self.counter_totals[name] = total
+            self.counter_events.append(CounterEvent(name, threading.get_ident(), time.perf_counter_ns(), total))
+
+    def summary(self) -> dict[str, SpanSummary]:
+        with self.lock:
+            events = list(self.span_events)
+        name_to_summary = {}
+        for event in events:
+            summary = name_to_summary.setdefault(event.name, SpanSummary(event.name))
+            summary.count += 1
+            summary.total_ns += event.duration_ns
+            summary.self_ns += event.self_ns
+            summary.max_ns = max(summary.max_ns, event.duration_ns)
+        return name_to_summary
+
+    def format_summary(self) -> str:
+        lines = [f"{'span':<48} {'count':>7} {'total ms':>10} {'self ms':>10} {'mean ms':>10} {'max ms':>10}"]
+        for summary in sorted(self.summary().values(), key=lambda summary: summary.total_ns, reverse=True):
+            lines.append(
+                f"{summary.name:<48} {summary.count:>7} "
+                f"{summary.total_ns / NANOSECONDS_PER_MILLISECOND:>10.2f} "
+                f"{summary.self_ns / NANOSECONDS_PER_MILLISECOND:>10.2f} "
+                f"{summary.mean_ns / NANOSECONDS_PER_MILLISECOND:>10.2f} "
+                f"{summary.max_ns / NANOSECONDS_PER_MILLISECOND:>10.2f}"
+            )
+        with self.lock:
+            counter_totals = dict(self.counter_totals)
+        for name, total in sorted(counter_totals.items()):
+            lines.append(f"{name:<48} {total:>7g}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        with self.lock:
+            span_events = list(self.span_events)
+            counter_events = list(self.counter_events)
+            origin_ns = self.origin_ns
+        pid = os.getpid()
+        trace_events = []
+        for event in span_events:
+            trace_event = {
+                "name": event.name,
+                "ph": "X",
+                "pid": pid,
+                "tid": event.thread_id,
+                "ts": (event.start_ns - origin_ns) / NANOSECONDS_PER_MICROSECOND,
+                "dur": event.duration_ns / NANOSECONDS_PER_MICROSECOND,
+            }
+            if event.args:
+                trace_event["args"] = {key: str(value) for key, value in event.args.items()}
+            trace_events.append(trace_event)
+        for event in counter_events:
+            trace_events.append({
+                "name": event.name,
+                "ph": "C",
+                "pid": pid,
+                "tid": event.thread_id,
+                "ts": (event.time_ns - origin_ns) / NANOSECONDS_PER_MICROSECOND,
+                "args": {"value": event.value},
+            })
+        trace_events.sort(key=lambda trace_event: trace_event["ts"])
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+PROFILER = Profiler(enabled=os.environ.get(PROFILE_ENV_VAR) == "1")
+
+
+def profiled(name: Optional[str] = None):
+    """Decorator recording every call of the function as a span of PROFILER, named after the function by default."""
+    def decorator(function):
+        span_name = name if name is not None else function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with Span(PROFILER, span_name, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+import zipfile
+import numpy as np
+from packages.loading.decode import DecodedVolume, SegmentInfo, read_labelmap
+from packages.loading.sparse_labelmap import SparseLabelmap, nonzero_bbox
+from packages.profiling.profiler import profiled
+from packages.statistics.lesion_statistics import MM3_PER_ML
+
+# Bump when the way change maps are computed changes, so that cached results are recomputed.
+CHANGE_MAP_VERSION = 1
+CHANGE_NEW = 1
+CHANGE_RESOLVED = 2
+CHANGE_PERSISTENT = 3
+CHANGE_SEGMENTS = [
+    SegmentInfo(CHANGE_NEW, "New", (0.9, 0.2, 0.2)),
+    SegmentInfo(CHANGE_RESOLVED, "Resolved", (0.2, 0.5, 0.95)),
+    SegmentInfo(CHANGE_PERSISTENT, "Persistent", (0.95, 0.85, 0.2)),
+]
+# Number of set bits of every byte value.
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+@dataclass
+class ChangeSummary:
+    """Voxels that are lesional only in the later segmentation (new), only in the earlier one (resolved), or in both."""
+    new_voxels: int
+    resolved_voxels: int
+    persistent_voxels: int
+    voxel_volume_ml: float
+
+    @property
+    def delta_voxels(self) -> int:
+        return self.new_voxels - self.resolved_voxels
+
+    @property
+    def new_ml(self) -> float:
+        return self.new_voxels * self.voxel_volume_ml
+
+    @property
+    def resolved_ml(self) -> float:
+        return self.resolved_voxels * self.voxel_volume_ml
+
+    @property
+    def persistent_ml(self) -> float:
+        return self.persistent_voxels * self.voxel_volume_ml
+
+    @property
+    def delta_ml(self) -> float:
+        return self.delta_voxels * self.voxel_volume_ml
+
+
+@dataclass
+class ChangeMap:
+    # Labelled CHANGE_NEW, CHANGE_RESOLVED and CHANGE_PERSISTENT, on the grid of the later segmentation.
+    labelmap: SparseLabelmap
+    summary: ChangeSummary
+
+
+def union_bbox(bboxes: list[tuple[tuple, tuple]]) -> tuple[tuple, tuple]:
+    bboxes = [(bbox_min, bbox_max) for bbox_min, bbox_max in bboxes if bbox_min != bbox_max]
+    if not bboxes:
+        return (0, 0, 0), (0, 0, 0)
+    return (
+        tuple(min(bbox_min[axis] for bbox_min, _ in bboxes) for axis in range(3)),
+        tuple(max(bbox_max[axis] for _, bbox_max in bboxes) for axis in range(3)),
+    )
+
+
+def compute_change_map(labelmap: DecodedVolume, next_labelmap: DecodedVolume) -> ChangeMap:
+    """
+    Change map between two segmentations on the same grid. Only the bounding box of the lesions of both is compared,
+    as bit-packed masks of the lesional voxels, 8 voxels per byte operation.
+    """
+    if labelmap.array.shape != next_labelmap.array.shape or not np.allclose(
+        labelmap.ijk_to_ras, next_labelmap.ijk_to_ras, atol=1e-3
+    ):
+        raise ValueError("Cannot compare segmentations on different grids")
+
+    bbox_min, bbox_max = union_bbox([nonzero_bbox(labelmap.array), nonzero_bbox(next_labelmap.array)])
+    crop = tuple(slice(low, high) for low, high in zip(bbox_min, bbox_max))
+    lesional = np.packbits(labelmap.array[crop] != 0)
+    next_lesional = np.packbits(next_labelmap.array[crop] != 0)
+    # The padding bits of both are 0, so they are set in none of the masks.
+    packed_masks = [next_lesional & ~lesional, lesional & ~next_lesional, lesional & next_lesional]
+    new_voxels, resolved_voxels, persistent_voxels = (
+        int(POPCOUNT[packed_mask].sum(dtype=np.int64)) for packed_mask in packed_masks
+    )
+
+    voxel_volume_ml = abs(np.linalg.det(next_labelmap.ijk_to_ras[:3, :3])) / MM3_PER_ML
+    return ChangeMap(
+        SparseLabelmap(
+            next_labelmap.array.shape,
+            np.dtype(np.uint8),
+            bbox_min,
+            bbox_max,
+            np.array([CHANGE_NEW, CHANGE_RESOLVED, CHANGE_PERSISTENT], dtype=np.uint8),
+            packed_masks,
+            next_labelmap.ijk_to_ras,
+            CHANGE_SEGMENTS,
+        ),
+        ChangeSummary(new_voxels, resolved_voxels, persistent_voxels, float(voxel_volume_ml)),
+    )
+
+
+class ChangeMaps:
+    """
+    Change maps between consecutive segmentations img_{k}_segmentation and img_{k + 1}_segmentation, computed on
+    demand and cached per pair until either file changes: the most recent in memory, and all of them in cache_dir
+    if given, where their summaries can be read without the masks. Safe to use from several threads.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_in_memory: int = 8) -> None:
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_in_memory = max_in_memory
+        self.key_to_change_map = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_key(self, segmentation_path: str, next_segmentation_path: str) -> str:
+        sha256 = hashlib.sha256(f"v{CHANGE_MAP_VERSION}|".encode())
+        for path in (segmentation_path, next_segmentation_path):
+            stat = os.stat(path)
+            sha256.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|".encode())
+        return sha256.hexdigest()
+
+    def get(self, segmentation_path: str, next_segmentation_path: str) -> ChangeMap:
+        key = self.get_key(segmentation_path, next_segmentation_path)
+        with self.lock:
+            if key in self.key_to_change_map:
+                self.key_to_change_map.move_to_end(key)
+                return self.key_to_change_map[key]
+
+        change_map = self.load(key)
+        if change_map is None:
+            change_map = self.compute(segmentation_path, next_segmentation_path, key)
+
+        with self.lock:
+            self.key_to_change_map[key] = change_map
+            while len(self.key_to_change_map) > self.max_in_memory:
+                self.key_to_change_map.popitem(last=False)
+        return change_map
+
+    def get_summary(self, segmentation_path: str, next_segmentation_path: str) -> ChangeSummary:
+        """The summary of the change map, read from the cache if it was computed before."""
+        key = self.get_key(segmentation_path, next_segmentation_path)
+        with self.lock:
+            change_map = self.key_to_change_map.get(key)
+        if change_map is not None:
+            return change_map.summary
+        summary = self.load_summary(key)
+        if summary is not None:
+            return summary
+        return self.get(segmentation_path, next_segmentation_path).summary
+
+    @profiled()
+    def compute(self, segmentation_path: str, next_segmentation_path: str, key: str) -> ChangeMap:
+        change_map = compute_change_map(read_labelmap(segmentation_path), read_labelmap(next_segmentation_path))
+        self.save(key, change_map)
+        return change_map
+
+    def save(self, key: str, change_map: ChangeMap) -> None:
+        if self.cache_dir is None:
+            return
+        labelmap, summary = change_map.labelmap, change_map.summary
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.cache_dir / f"{key}.npz.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                np.savez(
+                    f,
+                    counts=np.array([summary.new_voxels, summary.resolved_voxels, summary.persistent_voxels]),
+                    voxel_volume_ml=np.array(summary.voxel_volume_ml),
+                    shape=np.array(labelmap.shape),
+                    bbox_min=np.array(labelmap.bbox_min),
+                    bbox_max=np.array(labelmap.bbox_max),
+                    ijk_to_ras=labelmap.ijk_to_ras,
+                    new=labelmap.packed_masks[0],
+                    resolved=labelmap.packed_masks[1],
+                    persistent=labelmap.packed_masks[2],
+                )
+            os.replace(temp_path, self.cache_dir / f"{key}.npz")
+        except OSError as e:
+            logging.warning(f"Could not cache change map: {e}")
+
+    def load_summary(self, key: str) -> Optional[ChangeSummary]:
+        if self.cache_dir is None:
+            return None
+        try:
+            # Members of an .npz file are read when accessed, so the masks are not.
+            with np.load(self.cache_dir / f"{key}.npz") as cached:
+                counts = [int(count) for count in cached["counts"]]
+                return ChangeSummary(*counts, float(cached["voxel_volume_ml"]))
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def load(self, key: str) -> Optional[ChangeMap]:
+        if self.cache_dir is None:
+            return None
+        try:
+            with np.load(self.cache_dir / f"{key}.npz") as cached:
+                labelmap = SparseLabelmap(
+                    tuple(int(size) for size in cached["shape"]),
+                    np.dtype(np.uint8),
+                    tuple(int(bound) for bound in cached["bbox_min"]),
+                    tuple(int(bound) for bound in cached["bbox_max"]),
+                    np.array([CHANGE_NEW, CHANGE_RESOLVED, CHANGE_PERSISTENT], dtype=np.uint8),
+                    [cached["new"], cached["resolved"], cached["persistent"]],
+                    cached["ijk_to_ras"],
+                    CHANGE_SEGMENTS,
+                )
+                counts = [int(count) for count in cached["counts"]]
+                summary = ChangeSummary(*counts, float(cached["voxel_volume_ml"]))
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        return ChangeMap(labelmap, summary)
@@ -0,0 +1,139 @@
+from dataclasses import dataclass, field
+import errno
+import os
+import re
+from pathlib import Path
+from typing import Optional
+from packages.segmentation.file_types import DIRECTORY_FILE_TYPES, FileType, file_type_to_name
+from packages.storage.storage import LocalStorage
+
+INDEX_PLACEHOLDER = "INDEX"
+
+
+def file_type_to_pattern(file_type: FileType) -> re.Pattern:
+    name = file_type_to_name(file_type, INDEX_PLACEHOLDER)
+    return re.compile(re.escape(name).replace(INDEX_PLACEHOLDER, r"(0|[1-9][0-9]*)"))
+
+
+FILE_TYPE_TO_PATTERN = {file_type: file_type_to_pattern(file_type) for file_type in DIRECTORY_FILE_TYPES}
+
+
+@dataclass
+class DirectoryChanges:
+    added: list[tuple[FileType, int]] = field(default_factory=list)
+    removed: list[tuple[FileType, int]] = field(default_factory=list)
+    modified: list[tuple[FileType, int]] = field(default_factory=list)
+    # Paths of the removed and modified files, as they were before the changes.
+    stale_paths: set[str] = field(default_factory=set)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.modified)
+
+
+class DirectoryIndex:
+    """
+    Table of FileType -> index -> path, built from a single listing of a segmentation directory by its storage,
+    an os.scandir pass for local directories. Lookups never touch the storage again; call rescan() to refresh.
+    Pass paths and stats recorded by an earlier scan, e.g. by the cohort catalog, to build the table without scanning.
+    """
+
+    def __init__(
+        self, dir_path: str, paths: Optional[dict] = None, stats: Optional[dict] = None, storage=None
+    ) -> None:
+        self.dir_path = Path(dir_path)
+        self.storage = storage if storage is not None else LocalStorage()
+        self.paths = {file_type: {} for file_type in FileType}
+        # (size, mtime) of every indexed file, by path.
+        self.stats = {}
+        if paths is None:
+            self.scan()
+            return
+        for file_type, index_to_path in paths.items():
+            self.paths[file_type].update(index_to_path)
+        self.stats = dict(stats or {})
+
+    def list_files(self) -> tuple[dict, dict]:
+        """The path table and stats of the directory as listed now, without applying them. Safe from any thread."""
+        paths = {file_type: {} for file_type in FileType}
+        stats = {}
+        for entry in self.storage.list_dir(self.dir_path, accept=lambda name: self.parse_name(name) is not None):
+            file_type, index = self.parse_name(entry.name)
+            path = str(self.dir_path / entry.name)
+            paths[file_type][index] = path
+            stats[path] = (entry.size, entry.mtime_ns)
+        return paths, stats
+
+    def scan(self) -> None:
+        self.paths, self.stats = self.list_files()
+
+    def rescan(self, listing: Optional[tuple[dict, dict]] = None) -> DirectoryChanges:
+        """
+        Scans the directory again, or applies a listing returned by list_files(), and returns which indexed files
+        were added, removed or modified since.
+        """
+        previous_paths, previous_stats = self.paths, self.stats
+        self.paths, self.stats = listing if listing is not None else self.list_files()
+        changes = DirectoryChanges()
+        for file_type in FileType:
+            previous, current = previous_paths[file_type], self.paths[file_type]
+            for index in sorted(current.keys() - previous.keys()):
+                changes.added.append((file_type, index))
+            for index in sorted(previous.keys() - current.keys()):
+                changes.removed.append((file_type, index))
+                changes.stale_paths.add(previous[index])
+            for index in sorted(previous.keys() & current.keys()):
+                if previous_stats.get(previous[index]) != self.stats.get(current[index]):
+                    changes.modified.append((file_type, index))
+                    changes.stale_paths.add(previous[index])
+        return changes
+
+    def all_paths(self) -> list[str]:
+        return [path for paths in self.paths.values() for path in paths.values()]
+
+    @staticmethod
+    def parse_name(name: str) -> Optional[tuple[FileType, int]]:
+        for file_type, pattern in FILE_TYPE_TO_PATTERN.items():
+            match = pattern.fullmatch(name)
+            if match is not None:
+                return file_type, int(match.group(1))
+        return None
+
+    def has(self, file_type: FileType, index: int) -> bool:
+        return index in self.paths[file_type]
+
+    def get_path(self, file_type: FileType, index: int) -> str:
+        try:
+            return self.paths[file_type][index]
+        except KeyError:
+            path = self.dir_path / file_type_to_name(file_type, index)
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path)) from None
+
+    def indices(self, file_type: FileType) -> list[int]:
+        return sorted(self.paths[file_type])
+
+    def gaps(self, file_type: FileType) -> list[int]:
+        """Indices missing below the highest index present for file_type."""
+        indices = self.paths[file_type]
+        if not indices:
+            return []
+        return [i for i in range(max(indices)) if i not in indices]
+
+    def orphans(self) -> list[tuple[FileType, int]]:
+        """
+        Files without the counterpart they are meant to be viewed with: an image without its segmentation
+        (or vice versa), a sub image without both images it compares, or a sub segmentation without its sub image.
+        """
+        orphans = []
+        for index in self.paths[FileType.IMG]:
+            if not self.has(FileType.IMG_SEGMENTATION, index):
+                orphans.append((FileType.IMG, index))
+        for index in self.paths[FileType.IMG_SEGMENTATION]:
+            if not self.has(FileType.IMG, index):
+                orphans.append((FileType.IMG_SEGMENTATION, index))
+        for index in self.paths[FileType.SUB_IMG]:
+            if not (self.has(FileType.IMG, index) and self.has(FileType.IMG, index + 1)):
+                orphans.append((FileType.SUB_IMG, index))
+        for index in self.paths[FileType.SUB_IMG_SEGMENTATION]:
+            if not self.has(FileType.SUB_IMG, index):
+                orphans.append((FileType.SUB_IMG_SEGMENTATION, index))
+        return sorted(orphans, key=lambda orphan: (orphan[0].value, orphan[1]))
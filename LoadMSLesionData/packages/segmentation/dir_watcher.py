@@ -0,0 +1,43 @@
+import qt
+
+
+class DirectoryWatcher:
+    """
+    Calls on_change once a burst of changes to a watched directory or its files has settled for debounce_ms.
+    Changes are reported by QFileSystemWatcher, i.e. inotify, kqueue or ReadDirectoryChangesW depending on the
+    platform. on_change is also called every poll_interval_ms as a fallback for filesystems that do not report
+    changes, such as network shares, so it should be cheap when nothing changed.
+    All methods must be called from the main thread.
+    """
+
+    def __init__(self, on_change, debounce_ms: int = 500, poll_interval_ms: int = 5000) -> None:
+        self.on_change = on_change
+        self.watcher = qt.QFileSystemWatcher()
+        self.watcher.connect("directoryChanged(QString)", self.on_event)
+        self.watcher.connect("fileChanged(QString)", self.on_event)
+        self.debounce_timer = qt.QTimer()
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(debounce_ms)
+        self.debounce_timer.connect("timeout()", self.on_change)
+        self.poll_timer = qt.QTimer()
+        self.poll_timer.setInterval(poll_interval_ms)
+        self.poll_timer.connect("timeout()", self.on_change)
+
+    def watch(self, dir_path: str, file_paths=()) -> None:
+        """Watches dir_path for added and removed files, and file_paths for modifications, instead of what was watched."""
+        self.unwatch()
+        self.watcher.addPath(str(dir_path))
+        if file_paths:
+            self.watcher.addPaths([str(path) for path in file_paths])
+        self.poll_timer.start()
+
+    def on_event(self, _path) -> None:
+        # Restarted by every event, so files being written are only rescanned once they stop changing.
+        self.debounce_timer.start()
+
+    def unwatch(self) -> None:
+        watched_paths = list(self.watcher.directories()) + list(self.watcher.files())
+        if watched_paths:
+            self.watcher.removePaths(watched_paths)
+        self.debounce_timer.stop()
+        self.poll_timer.stop()
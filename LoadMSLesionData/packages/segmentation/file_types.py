@@ -5,6 +5,11 @@ class FileType(Enum):
     IMG_SEGMENTATION = auto()
     SUB_IMG = auto()
     SUB_IMG_SEGMENTATION = auto()
+    # Computed from img_{index}_segmentation and img_{index + 1}_segmentation, never a file of the directory.
+    CHANGE_MAP = auto()
+
+# The file types that are files of a segmentation directory.
+DIRECTORY_FILE_TYPES = (FileType.IMG, FileType.IMG_SEGMENTATION, FileType.SUB_IMG, FileType.SUB_IMG_SEGMENTATION)
 
 def file_type_to_name(file_type: FileType, index: int) -> str:
     if file_type == FileType.IMG:
@@ -15,7 +20,27 @@ def file_type_to_name(file_type: FileType, index: int) -> str:
         return f"img_sub_{index}.nii.gz"
     if file_type == FileType.SUB_IMG_SEGMENTATION:
         return f"img_sub_{index}_segmentation.nrrd"
+    if file_type == FileType.CHANGE_MAP:
+        return f"img_change_{index}"
     raise NotImplementedError(f"Unsupported enum value: {file_type}")
 
+class View(Enum):
+    STANDARD = 1
+    SUB = auto()
+    CHANGE = auto()
 
+def view_to_filetypes(view: View) -> tuple[FileType, FileType]:
+    if view == View.STANDARD:
+        return FileType.IMG, FileType.IMG_SEGMENTATION
+    if view == View.SUB:
+        return FileType.SUB_IMG, FileType.SUB_IMG_SEGMENTATION
+    if view == View.CHANGE:
+        return FileType.IMG, FileType.CHANGE_MAP
+    raise NotImplementedError(f"Unsupported enum value: {view}")
 
+def view_to_keys(view: View, index: int) -> tuple[tuple[FileType, int], tuple[FileType, int]]:
+    """(FileType, index) of the volume and segmentation shown at index in view."""
+    volume_filetype, segmentation_filetype = view_to_filetypes(view)
+    # The change map from img_{index} is shown over img_{index + 1}, where the new lesions are.
+    volume_index = index + 1 if view == View.CHANGE else index
+    return (volume_filetype, volume_index), (segmentation_filetype, index)
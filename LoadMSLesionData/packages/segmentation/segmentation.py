@@ -1,24 +1,22 @@
+import functools
 import itertools
-import errno
-import os
 from pathlib import Path
 import logging
-from packages.segmentation.file_types import FileType, file_type_to_name
+from typing import Optional
+import numpy as np
+from packages.segmentation.file_types import FileType, View, file_type_to_name, view_to_keys
+from packages.segmentation.change_map import ChangeMap, ChangeSummary
+from packages.segmentation.dir_index import DirectoryIndex, DirectoryChanges
+from packages.segmentation.validation import ValidationReport, validate_headers
+from packages.loading.nodes import (
+    create_volume_node, create_segmentation_node, replace_volume_image, replace_segmentation_labelmap
+)
+from packages.cache.node_cache import NodeCache
+from packages.loading.decode import DecodedVolume, read_labelmap, read_volume, read_volume_info
+from packages.loading.sparse_labelmap import CompressionStats, SparseLabelmap, to_dense
+from packages.profiling.profiler import PROFILER, profiled
+from packages.storage.storage import LocalStorage
 import slicer
-from slicer.util import MRMLNodeNotFoundException
-from enum import Enum, auto
-
-
-class View(Enum):
-    STANDARD = 1
-    SUB = auto()
-
-def view_to_filetypes(view: View) -> tuple[FileType, FileType]:
-    if view == View.STANDARD:
-        return FileType.IMG, FileType.IMG_SEGMENTATION
-    if view == View.SUB:
-        return FileType.SUB_IMG, FileType.SUB_IMG_SEGMENTATION
-    raise NotImplementedError(f"Unsupported enum value: {view}")
 
 
 class InvalidSegmentationDirError(ValueError):
@@ -27,11 +25,40 @@ class InvalidSegmentationDirError(ValueError):
 
 
 class SegmentationDir:
-    def __init__(self, dir_path: str) -> None:
+    def __init__(
+        self,
+        dir_path: str,
+        prefetcher=None,
+        node_cache=None,
+        surface_builder=None,
+        volume_cache=None,
+        subtraction_images=None,
+        progressive_loader=None,
+        dir_index=None,
+        storage=None,
+        change_maps=None
+    ) -> None:
         self._dir_path = Path(dir_path)
+        # Lists the directory and fetches its files before they are read. Paths are local paths whatever the storage.
+        self.storage = storage if storage is not None else LocalStorage()
+        self.prefetcher = prefetcher
+        self.progressive_loader = progressive_loader
+        self.volume_cache = volume_cache
+        self.subtraction_images = subtraction_images
+        # Indices whose sub image, or sub segmentation, is not a file of the directory (see add_synthesized_sub_img).
+        self.synthesized_sub_indices = set()
+        self.change_maps = change_maps
+        # Whether img_{index}_segmentation and img_{index + 1}_segmentation are on the same grid, by their paths.
+        self.change_map_grids_match = {}
+        self.surface_builder = surface_builder
+        self.node_cache = node_cache if node_cache is not None else NodeCache()
+        # Labelmaps decoded ahead of time are held as SparseLabelmaps until they are shown.
+        self.labelmap_compression = CompressionStats()
         try:
+            # A dir_index recorded earlier, e.g. by the cohort catalog, saves scanning the directory again.
+            self.dir_index = dir_index if dir_index is not None else DirectoryIndex(self._dir_path, storage=self.storage)
             self.validate()
-        except FileNotFoundError as e:
+        except (FileNotFoundError, NotADirectoryError) as e:
             raise InvalidSegmentationDirError(self._dir_path) from e
 
         self.imgs_paths = {}
@@ -42,16 +69,27 @@ class SegmentationDir:
 
         self.view = View.STANDARD
         self.index = None
+        # Key of the one segmentation node of this directory that is shown, so that switching hides only that node.
+        self.visible_segmentation_key = None
         
     def validate(self) -> None:
-        if not self._dir_path.exists():
-            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(self._dir_path))
-        if not (self._dir_path / self.get_path(FileType.IMG, 0)).exists():
-            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(self._dir_path / self.get_path(FileType.IMG, 0)))
-        if not (self._dir_path / self.get_path(FileType.IMG_SEGMENTATION, 0)).exists():
-            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(self._dir_path / self.get_path(FileType.IMG_SEGMENTATION, 0)))
-
-    def load_paths(self):
+        self.get_path(FileType.IMG, 0)
+        self.get_path(FileType.IMG_SEGMENTATION, 0)
+
+    @profiled()
+    def validate_headers(self, max_workers: int = 8) -> ValidationReport:
+        """
+        Checks that the images, segmentations and timepoints of the directory are on consistent grids, reading
+        only file headers. Unlike validate(), this finds mismatches before anything is decoded.
+        """
+        return validate_headers(self, max_workers)
+
+    @profiled()
+    def load_paths(self, strict: bool = True):
+        """
+        Fills the path tables from the directory index. With strict=False, e.g. while new timepoints are still being
+        written, the first incomplete timepoint ends the series instead of making the directory invalid.
+        """
         self.imgs_paths[0] = self.get_path(FileType.IMG, 0)
         self.imgs_segmentations_paths[0] = self.get_path(FileType.IMG_SEGMENTATION, 0)
         for img_index, sub_img_index in zip(itertools.count(1), itertools.count(0)):
@@ -62,7 +100,10 @@ class SegmentationDir:
                 img_path = self.get_path(FileType.IMG, img_index)
                 img_segmentation_path = self.get_path(FileType.IMG_SEGMENTATION, img_index)
             except FileNotFoundError as e:
-                raise InvalidSegmentationDirError(self._dir_path) from e
+                if strict:
+                    raise InvalidSegmentationDirError(self._dir_path) from e
+                logging.info(f"Timepoint {img_index} of {self._dir_path} is incomplete, ignoring it until it is complete")
+                break
             else:
                 self.imgs_paths[img_index] = img_path
                 self.imgs_segmentations_paths[img_index] = img_segmentation_path
@@ -71,12 +112,118 @@ class SegmentationDir:
                 self.sub_imgs_paths[sub_img_index] = self.get_path(FileType.SUB_IMG, sub_img_index)
                 self.sub_imgs_segmentations_paths[sub_img_index] = self.get_path(FileType.SUB_IMG_SEGMENTATION, sub_img_index)
             except FileNotFoundError as e:
-                logging.warning(e)
+                if self.subtraction_images is None or not self.add_synthesized_sub_img(sub_img_index):
+                    logging.warning(e)
+
+        for file_type, index in self.dir_index.orphans():
+            logging.warning(f"Orphaned file in {self._dir_path}: {file_type_to_name(file_type, index)}")
+        for file_type in (FileType.IMG, FileType.IMG_SEGMENTATION):
+            for index in self.dir_index.gaps(file_type):
+                logging.warning(f"Missing file in {self._dir_path}: {file_type_to_name(file_type, index)}")
+
+    def add_synthesized_sub_img(self, index) -> bool:
+        """
+        Makes img_sub_{index} available when it is missing, as img_{index + 1} - img_{index} computed when it is first
+        loaded, shown with img_sub_{index}_segmentation if it exists, or else with img_{index + 1}_segmentation.
+        Returns False if the two images cannot be subtracted.
+        """
+        if not self.dir_index.has(FileType.SUB_IMG, index):
+            shape, ijk_to_ras = read_volume_info(self.storage.fetch_header(self.imgs_paths[index]))
+            next_shape, next_ijk_to_ras = read_volume_info(self.storage.fetch_header(self.imgs_paths[index + 1]))
+            if shape != next_shape or not np.allclose(ijk_to_ras, next_ijk_to_ras, atol=1e-3):
+                return False
+            self.sub_imgs_paths[index] = str(self._dir_path / file_type_to_name(FileType.SUB_IMG, index))
+        else:
+            self.sub_imgs_paths[index] = self.dir_index.get_path(FileType.SUB_IMG, index)
+
+        if self.dir_index.has(FileType.SUB_IMG_SEGMENTATION, index):
+            self.sub_imgs_segmentations_paths[index] = self.dir_index.get_path(FileType.SUB_IMG_SEGMENTATION, index)
+        else:
+            self.sub_imgs_segmentations_paths[index] = self.imgs_segmentations_paths[index + 1]
+        self.synthesized_sub_indices.add(index)
+        return True
+
+    def is_synthesized(self, file_type: FileType, index: int) -> bool:
+        return (
+            file_type == FileType.SUB_IMG
+            and index in self.synthesized_sub_indices
+            and not self.dir_index.has(FileType.SUB_IMG, index)
+        )
+
+    @profiled()
+    def synthesize_sub_img(self, index: int):
+        return self.subtraction_images.get(
+            self.storage.fetch(self.imgs_paths[index]), self.storage.fetch(self.imgs_paths[index + 1])
+        )
+
+    def key_to_path(self) -> dict[tuple[FileType, int], str]:
+        return {
+            (file_type, index): path
+            for file_type, paths in (
+                (FileType.IMG, self.imgs_paths),
+                (FileType.IMG_SEGMENTATION, self.imgs_segmentations_paths),
+                (FileType.SUB_IMG, self.sub_imgs_paths),
+                (FileType.SUB_IMG_SEGMENTATION, self.sub_imgs_segmentations_paths),
+            )
+            for index, path in paths.items()
+        }
+
+    @profiled()
+    def rescan(self, listing: Optional[tuple[dict, dict]] = None) -> DirectoryChanges:
+        """
+        Applies the files added, removed or modified since the directory was last scanned to the path tables, and
+        removes only the nodes and prefetched data of the files that changed, including subtraction images computed
+        from them. Returns the changes. Pass a listing from dir_index.list_files() to apply it instead of scanning.
+        """
+        changes = self.dir_index.rescan(listing)
+        if not changes:
+            return changes
+
+        previous_key_to_path = self.key_to_path()
+        previous_synthesized_sub_indices = self.synthesized_sub_indices
+        self.imgs_paths = {}
+        self.imgs_segmentations_paths = {}
+        self.sub_imgs_paths = {}
+        self.sub_imgs_segmentations_paths = {}
+        self.synthesized_sub_indices = set()
+        self.change_map_grids_match = {}
+        try:
+            self.load_paths(strict=False)
+        except FileNotFoundError as e:
+            logging.warning(e)
+        key_to_path = self.key_to_path()
+
+        stale_keys = {
+            key for key in previous_key_to_path.keys() | key_to_path.keys()
+            if previous_key_to_path.get(key) != key_to_path.get(key)
+            or previous_key_to_path.get(key) in changes.stale_paths
+        }
+        stale_keys |= {
+            (FileType.SUB_IMG, index) for index in previous_synthesized_sub_indices
+            if (FileType.IMG, index) in stale_keys or (FileType.IMG, index + 1) in stale_keys
+        }
+        stale_keys |= {
+            (FileType.CHANGE_MAP, index) for (file_type, index) in previous_key_to_path
+            if file_type == FileType.IMG_SEGMENTATION and (
+                (FileType.IMG_SEGMENTATION, index) in stale_keys or (FileType.IMG_SEGMENTATION, index + 1) in stale_keys
+            )
+        }
+        for key in stale_keys:
+            self.node_cache.remove(key)
+        if self.visible_segmentation_key in stale_keys:
+            self.visible_segmentation_key = None
+        if self.prefetcher is not None:
+            self.prefetcher.discard(
+                changes.stale_paths | {previous_key_to_path[key] for key in stale_keys if key in previous_key_to_path}
+            )
+        logging.info(
+            f"{self._dir_path} changed: {len(changes.added)} added, {len(changes.removed)} removed, "
+            f"{len(changes.modified)} modified, {len(stale_keys)} nodes invalidated"
+        )
+        return changes
 
     def index_has_no_imgs(self, index) -> bool:
-        img_path = Path(self._dir_path) / file_type_to_name(FileType.IMG, index)
-        img_segmentation_path = Path(self._dir_path) / file_type_to_name(FileType.IMG_SEGMENTATION, index)
-        return not img_path.exists() and not img_segmentation_path.exists()
+        return not self.dir_index.has(FileType.IMG, index) and not self.dir_index.has(FileType.IMG_SEGMENTATION, index)
 
     def index_is_valid_for_img(self, index):
         return index in self.imgs_paths and index in self.imgs_segmentations_paths
@@ -84,94 +231,332 @@ class SegmentationDir:
     def index_is_valid_for_sub_img(self, index):
         return index in self.sub_imgs_paths and index in self.sub_imgs_segmentations_paths
 
-    def get_path(self, file_type: FileType, index) -> str:
-        path = Path(self._dir_path) / file_type_to_name(file_type, index)
-        if not Path(path).exists():
-            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path))
-        return str(path)
+    def index_is_valid_for_change_map(self, index) -> bool:
+        """Whether the change map from img_{index}_segmentation to img_{index + 1}_segmentation can be shown."""
+        if self.change_maps is None or not (self.index_is_valid_for_img(index) and self.index_is_valid_for_img(index + 1)):
+            return False
+        paths = (self.imgs_segmentations_paths[index], self.imgs_segmentations_paths[index + 1])
+        if paths not in self.change_map_grids_match:
+            shape, ijk_to_ras = read_volume_info(self.storage.fetch_header(paths[0]))
+            next_shape, next_ijk_to_ras = read_volume_info(self.storage.fetch_header(paths[1]))
+            self.change_map_grids_match[paths] = shape == next_shape and np.allclose(
+                ijk_to_ras, next_ijk_to_ras, atol=1e-3
+            )
+        return self.change_map_grids_match[paths]
+
+    def index_is_valid(self, view: View, index: int) -> bool:
+        if view == View.SUB:
+            return self.index_is_valid_for_sub_img(index)
+        if view == View.CHANGE:
+            return self.index_is_valid_for_change_map(index)
+        return self.index_is_valid_for_img(index)
 
+    def get_path(self, file_type: FileType, index) -> str:
+        if index in self.synthesized_sub_indices:
+            if file_type == FileType.SUB_IMG:
+                return self.sub_imgs_paths[index]
+            if file_type == FileType.SUB_IMG_SEGMENTATION:
+                return self.sub_imgs_segmentations_paths[index]
+        return self.dir_index.get_path(file_type, index)
+
+    @profiled()
     def unload(self):
-        def remove_node(search_pattern):
-            try:
-                node = slicer.util.getNode(search_pattern)
-            except MRMLNodeNotFoundException:
-                return
-            slicer.mrmlScene.RemoveNode(node)
-
-        for i in self.imgs_paths:
-            remove_node(f"{file_type_to_name(FileType.IMG, i)}*")
-        for i in self.imgs_segmentations_paths:
-            remove_node(file_type_to_name(FileType.IMG_SEGMENTATION, i))
-        for i in self.sub_imgs_paths:
-            remove_node(f"{file_type_to_name(FileType.SUB_IMG, i)}*")
-        for i in self.sub_imgs_segmentations_paths:
-            remove_node(file_type_to_name(FileType.SUB_IMG_SEGMENTATION, i))
-
-
-    def load_volume_node_if_not_exists(self, path, name, search_pattern):
-        try:
-            self.set_volume_node_to_visible(slicer.util.getNode(f"{search_pattern}*"))
-        except MRMLNodeNotFoundException:
-            slicer.util.loadVolume(
-                path, 
-                properties={
-                    "name": name, 
-                    "labelmap": False, 
-                    "singleFile": True, 
-                    "show": True
-                }
+        if self.surface_builder is not None:
+            self.surface_builder.reset()
+        if self.progressive_loader is not None:
+            self.progressive_loader.reset()
+        self.node_cache.clear()
+        self.visible_segmentation_key = None
+
+    def node_exists(self, file_type: FileType, index: int) -> bool:
+        return (file_type, index) in self.node_cache
+
+    def take_prefetched(self, path):
+        if self.prefetcher is None:
+            return None
+        return to_dense(self.prefetcher.take(path))
+
+    def decode_file(self, key, path):
+        """
+        Decodes a file of the directory off the main thread, storing its pyramid for progressive loading.
+        Labelmaps are returned as SparseLabelmaps, since they may be held for a while before they are shown.
+        """
+        file_type, index = key
+        labelmap = file_type in (FileType.IMG_SEGMENTATION, FileType.SUB_IMG_SEGMENTATION)
+        if self.is_synthesized(file_type, index):
+            decoded = self.synthesize_sub_img(index)
+        elif labelmap:
+            decoded = read_labelmap(self.storage.fetch(path))
+        elif self.volume_cache is not None:
+            decoded = self.volume_cache.read(self.storage.fetch(path))
+        else:
+            decoded = read_volume(self.storage.fetch(path))
+        if self.progressive_loader is not None:
+            self.progressive_loader.pyramid_cache.save(path, decoded, labelmap)
+        if labelmap:
+            decoded = SparseLabelmap.from_decoded(decoded)
+            self.labelmap_compression.add(decoded)
+        return decoded
+
+    def frame_indices(self) -> list[int]:
+        """Indices of the timepoints img_{index} that can be shown, in order."""
+        return sorted(index for index in self.imgs_paths if self.index_is_valid_for_img(index))
+
+    @profiled()
+    def decode_frame(self, index: int, with_segmentation: bool = True):
+        """
+        Decodes img_{index}, and img_{index}_segmentation if with_segmentation, for playback off the main thread.
+        The image is read into memory, so that showing it does not page in a memory mapped cache file.
+        """
+        volume = self.decode_file((FileType.IMG, index), self.get_path(FileType.IMG, index))
+        volume = DecodedVolume(np.array(volume.array), volume.ijk_to_ras, volume.segments)
+        labelmap = None
+        if with_segmentation:
+            labelmap = self.decode_file(
+                (FileType.IMG_SEGMENTATION, index), self.get_path(FileType.IMG_SEGMENTATION, index)
             )
-
-    def load_segmentation_node_if_not_exists(self, path, name, search_pattern):
-        self.setSegmentationNodesToInvisible()
-        try:
-            seg_node = slicer.util.getNode(f"{search_pattern}")
-        except MRMLNodeNotFoundException:
-            seg_node = slicer.util.loadSegmentation(path, properties={"name": name})
-            seg_node.CreateClosedSurfaceRepresentation()
+        return volume, labelmap
+
+    def load_preview_node(self, key, path, name, create_node, apply_full_resolution):
+        """
+        With progressive loading, creates a node from the cached downsampled preview of path, and has
+        apply_full_resolution(node, decoded) called once the full resolution is decoded. A prefetch of path that is
+        still running is taken over rather than repeated. Returns None if the full resolution should be loaded
+        straight away instead: without a cached preview, or when it was already prefetched.
+        """
+        if self.progressive_loader is None:
+            return None
+        if self.prefetcher is not None and self.prefetcher.is_ready(path):
+            return None
+        preview = self.progressive_loader.load_preview(path)
+        if preview is None:
+            return None
+
+        future = self.prefetcher.take_future(path) if self.prefetcher is not None else None
+        if future is None:
+            future = self.progressive_loader.submit(functools.partial(self.decode_file, key, path))
+        with PROFILER.span("create_preview_node", name=name):
+            node = create_node(preview, name)
+        PROFILER.count("preview_loads")
+        self.progressive_loader.request(node, future, apply_full_resolution)
+        return node
+
+    def apply_full_resolution_segmentation(self, seg_node, decoded, path):
+        replace_segmentation_labelmap(seg_node, to_dense(decoded))
+        # Only built from the full resolution, since surfaces are cached by source file.
+        self.create_closed_surface(seg_node, path)
+
+    @profiled()
+    def get_volume_node(self, path, name, key):
+        """The volume node of key, created from the quickest source available if it is not loaded yet."""
+        volume_node = self.node_cache.get(key)
+        if volume_node is not None:
+            PROFILER.count("node_cache_hits")
+            return volume_node
+        PROFILER.count("node_cache_misses")
+
+        volume_node = self.load_preview_node(key, path, name, create_volume_node, replace_volume_image)
+        if volume_node is not None:
+            self.node_cache.put(key, volume_node)
+            return volume_node
+
+        decoded = self.take_prefetched(path)
+        if decoded is not None:
+            PROFILER.count("prefetch_hits")
+        if decoded is None and self.is_synthesized(*key):
+            decoded = self.synthesize_sub_img(key[1])
+        if decoded is None and self.volume_cache is not None:
+            with PROFILER.span("VolumeCache.read", path=path):
+                decoded = self.volume_cache.read(self.storage.fetch(path))
+        if decoded is not None:
+            with PROFILER.span("create_volume_node", name=name):
+                volume_node = create_volume_node(decoded, name)
         else:
-            seg_node.SetDisplayVisibility(1)
+            with PROFILER.span("slicer.util.loadVolume", path=path):
+                volume_node = slicer.util.loadVolume(
+                    self.storage.fetch(path), 
+                    properties={
+                        "name": name, 
+                        "labelmap": False, 
+                        "singleFile": True, 
+                        "show": False
+                    }
+                )
+        self.node_cache.put(key, volume_node)
+        return volume_node
+
+    @profiled()
+    def load_volume_node_if_not_exists(self, path, name, key):
+        self.set_volume_node_to_visible(self.get_volume_node(path, name, key))
+
+    @profiled()
+    def get_segmentation_node(self, path, name, key):
+        """The segmentation node of key, created from the quickest source available if it is not loaded yet."""
+        seg_node = self.node_cache.get(key)
+        if seg_node is not None:
+            PROFILER.count("node_cache_hits")
+            return seg_node
+        PROFILER.count("node_cache_misses")
+
+        seg_node = self.load_preview_node(
+            key, path, name, create_segmentation_node,
+            functools.partial(self.apply_full_resolution_segmentation, path=path)
+        )
+        if seg_node is None:
+            decoded = self.take_prefetched(path)
+            if decoded is not None:
+                PROFILER.count("prefetch_hits")
+                with PROFILER.span("create_segmentation_node", name=name):
+                    seg_node = create_segmentation_node(decoded, name)
+            else:
+                with PROFILER.span("slicer.util.loadSegmentation", path=path):
+                    seg_node = slicer.util.loadSegmentation(self.storage.fetch(path), properties={"name": name})
+            self.create_closed_surface(seg_node, path)
+        self.node_cache.put(key, seg_node)
+        return seg_node
+
+    @profiled()
+    def load_segmentation_node_if_not_exists(self, path, name, key):
+        self.hide_visible_segmentation_node(key)
+        seg_node = self.get_segmentation_node(path, name, key)
+        seg_node.SetDisplayVisibility(1)
+        self.visible_segmentation_key = key
             
-        lm = slicer.app.layoutManager()
-        lm.threeDWidget(0).threeDController().resetFocalPoint()
-        
+        with PROFILER.span("resetFocalPoint"):
+            lm = slicer.app.layoutManager()
+            lm.threeDWidget(0).threeDController().resetFocalPoint()
+
+    @profiled()
+    def load_change_map_node_if_not_exists(self, index: int):
+        key = (FileType.CHANGE_MAP, index)
+        self.hide_visible_segmentation_node(key)
+        self.get_change_map_node(index).SetDisplayVisibility(1)
+        self.visible_segmentation_key = key
+
+    @profiled()
+    def get_change_map(self, index: int) -> ChangeMap:
+        """The change map from img_{index}_segmentation to img_{index + 1}_segmentation, computed once per pair."""
+        return self.change_maps.get(
+            self.storage.fetch(self.imgs_segmentations_paths[index]),
+            self.storage.fetch(self.imgs_segmentations_paths[index + 1])
+        )
 
+    def get_change_summary(self, index: int) -> ChangeSummary:
+        """New, resolved and persistent lesion voxels and volumes from img_{index} to img_{index + 1}."""
+        return self.change_maps.get_summary(
+            self.storage.fetch(self.imgs_segmentations_paths[index]),
+            self.storage.fetch(self.imgs_segmentations_paths[index + 1])
+        )
 
+    def change_summaries(self) -> dict[int, ChangeSummary]:
+        return {
+            index: self.get_change_summary(index)
+            for index in sorted(self.imgs_segmentations_paths)
+            if self.index_is_valid_for_change_map(index)
+        }
+
+    @profiled()
+    def get_change_map_node(self, index: int):
+        key = (FileType.CHANGE_MAP, index)
+        seg_node = self.node_cache.get(key)
+        if seg_node is not None:
+            PROFILER.count("node_cache_hits")
+            return seg_node
+        PROFILER.count("node_cache_misses")
+        decoded = self.get_change_map(index).labelmap.to_decoded()
+        with PROFILER.span("create_segmentation_node", name=file_type_to_name(FileType.CHANGE_MAP, index)):
+            # Shown in the slice views only: change maps have no source file to cache their surfaces by.
+            seg_node = create_segmentation_node(decoded, file_type_to_name(FileType.CHANGE_MAP, index))
+        self.node_cache.put(key, seg_node)
+        return seg_node
+
+    @profiled()
+    def create_closed_surface(self, seg_node, path):
+        if self.surface_builder is None:
+            with PROFILER.span("CreateClosedSurfaceRepresentation"):
+                seg_node.CreateClosedSurfaceRepresentation()
+            return
+        content_id = self.storage.content_id(path)
+        if content_id is None:
+            # Surfaces are keyed by the content of the file, which has to be all there when it is hashed.
+            path = self.storage.fetch(path)
+        self.surface_builder.request(seg_node, path, content_id)
+
+    @profiled()
     def set_volume_node_to_visible(self, volume_node):
         appLogic = slicer.app.applicationLogic()
         selectionNode = appLogic.GetSelectionNode()
         selectionNode.SetActiveVolumeID(volume_node.GetID())
         appLogic.PropagateVolumeSelection()
 
-    def setSegmentationNodesToInvisible(self):
-        # Sets the visibility of the segmentation nodes to 0. It does not set the visibility of each segment to 0
-        for i in range(slicer.mrmlScene.GetNumberOfNodesByClass('vtkMRMLSegmentationNode')):
-            slicer.mrmlScene.GetNthNodeByClass(i, 'vtkMRMLSegmentationNode').SetDisplayVisibility(0)
-
-    def load_index(self, view: View, index: int):
-
-        volume_filetype, segmentation_filetype = view_to_filetypes(view)
-
-        volume_file_path = self.get_path(volume_filetype, index)
-        volume_name = file_type_to_name(volume_filetype, index)
+    @profiled()
+    def hide_visible_segmentation_node(self, next_key=None):
+        # Sets the visibility of the segmentation node to 0. It does not set the visibility of each segment to 0
+        if self.visible_segmentation_key is None or self.visible_segmentation_key == next_key:
+            return
+        seg_node = self.node_cache.peek(self.visible_segmentation_key)
+        if seg_node is not None:
+            seg_node.SetDisplayVisibility(0)
+        self.visible_segmentation_key = None
+
+    @profiled()
+    def load_index(self, view: View, index: int, is_cancelled=None) -> bool:
+        """
+        Shows the image and segmentation of a timepoint. is_cancelled is checked between loading the two, and if it
+        returns True, loading stops and False is returned.
+        """
+        volume_key, segmentation_key = view_to_keys(view, index)
+
+        volume_file_path = self.get_path(*volume_key)
+        volume_name = file_type_to_name(*volume_key)
 
         self.load_volume_node_if_not_exists(
             volume_file_path,
             volume_name,
-            volume_name + "*"
+            volume_key
         )
+        if is_cancelled is not None and is_cancelled():
+            return False
 
-        segmentation_file_path = self.get_path(segmentation_filetype, index)
-        segmentation_name = file_type_to_name(segmentation_filetype, index)
+        if view == View.CHANGE:
+            self.load_change_map_node_if_not_exists(index)
+        else:
+            self.load_segmentation_node_if_not_exists(
+                self.get_path(*segmentation_key),
+                file_type_to_name(*segmentation_key),
+                segmentation_key,
+            )
 
-        self.load_segmentation_node_if_not_exists(
-            segmentation_file_path,
-            segmentation_name,
-            segmentation_name,
-        )
+        self.node_cache.evict(protected_keys=(volume_key, segmentation_key))
 
         self.view = view
         self.index = index
+        return True
+
+    @profiled()
+    def load_indices(self, indices: list[int]) -> list[tuple]:
+        """
+        (volume node, segmentation node) of the timepoints img_{index}, e.g. to show them side by side. The files
+        that are not loaded yet are decoded concurrently on the prefetcher's worker pool, and their nodes are
+        created as the decodes finish. Nodes are not made visible.
+        """
+        keys = [(file_type, index) for index in indices for file_type in (FileType.IMG, FileType.IMG_SEGMENTATION)]
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch(self, [key for key in keys if not self.node_exists(*key)])
+
+        nodes = []
+        for index in indices:
+            nodes.append((
+                self.get_volume_node(
+                    self.get_path(FileType.IMG, index), file_type_to_name(FileType.IMG, index), (FileType.IMG, index)
+                ),
+                self.get_segmentation_node(
+                    self.get_path(FileType.IMG_SEGMENTATION, index),
+                    file_type_to_name(FileType.IMG_SEGMENTATION, index),
+                    (FileType.IMG_SEGMENTATION, index)
+                ),
+            ))
+        return nodes
 
     @property
     def dir_path(self):
@@ -180,5 +565,11 @@ class SegmentationDir:
     @dir_path.setter
     def dir_path(self, dir_path):
         self._dir_path = Path(dir_path)
+        self.dir_index = DirectoryIndex(self._dir_path, storage=self.storage)
+
+    @property
+    def location(self) -> str:
+        """Where the directory is stored, e.g. its URL, which is its dir_path unless it is not on a local filesystem."""
+        return self.storage.location(self.dir_path)
 
     
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+import numpy as np
+from packages.loading.decode import DecodedVolume, read_volume, read_volume_info
+from packages.loading.nifti_stream import iter_nifti_slabs
+from packages.profiling.profiler import profiled
+from packages.utils.utils import MEBIBYTE
+
+
+class SubtractionImages:
+    """
+    Subtraction images img_{k + 1} - img_{k}, computed on demand for patient folders without img_sub_{k} files.
+    Both volumes are streamed through in slabs of slab_slices k-slices, so apart from the result only a few
+    slabs are held in memory. With a cache_dir, the result is written slab by slab straight into a memory
+    mapped file there, and reused until either source file changes. The least recently used results there are
+    removed once the cache grows past max_bytes. The most recent results are also kept in memory.
+    Safe to use from several threads.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        volume_cache=None,
+        slab_slices: int = 16,
+        max_in_memory: int = 4,
+        max_bytes: int = 10 * 1024 * MEBIBYTE
+    ) -> None:
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.volume_cache = volume_cache
+        self.max_bytes = max_bytes
+        self.slab_slices = slab_slices
+        self.max_in_memory = max_in_memory
+        self.key_to_decoded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_key(self, img_path: str, next_img_path: str) -> str:
+        sha256 = hashlib.sha256()
+        for path in (img_path, next_img_path):
+            stat = os.stat(path)
+            sha256.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|".encode())
+        return sha256.hexdigest()
+
+    def get(self, img_path: str, next_img_path: str) -> DecodedVolume:
+        key = self.get_key(img_path, next_img_path)
+        with self.lock:
+            if key in self.key_to_decoded:
+                self.key_to_decoded.move_to_end(key)
+                return self.key_to_decoded[key]
+
+        decoded = self.load(key)
+        if decoded is None:
+            decoded = self.compute(img_path, next_img_path, key)
+
+        with self.lock:
+            self.key_to_decoded[key] = decoded
+            while len(self.key_to_decoded) > self.max_in_memory:
+                self.key_to_decoded.popitem(last=False)
+        return decoded
+
+    def iter_slabs(self, path: str):
+        if self.volume_cache is not None:
+            decoded = self.volume_cache.load(path)
+            if decoded is not None:
+                for k_start in range(0, decoded.array.shape[0], self.slab_slices):
+                    yield k_start, decoded.array[k_start:k_start + self.slab_slices].astype(np.float32)
+                return
+        try:
+            yield from iter_nifti_slabs(path, self.slab_slices)
+            return
+        except ValueError as e:
+            logging.debug(f"Cannot stream {path}, decoding it whole: {e}")
+        array = read_volume(path).array
+        for k_start in range(0, array.shape[0], self.slab_slices):
+            yield k_start, array[k_start:k_start + self.slab_slices].astype(np.float32)
+
+    @profiled()
+    def compute(self, img_path: str, next_img_path: str, key: str) -> DecodedVolume:
+        shape, ijk_to_ras = read_volume_info(img_path)
+        next_shape, next_ijk_to_ras = read_volume_info(next_img_path)
+        if shape != next_shape or not np.allclose(ijk_to_ras, next_ijk_to_ras, atol=1e-3):
+            raise ValueError(f"Cannot subtract {img_path} from {next_img_path}: the images are on different grids")
+
+        temp_raw_path = None
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_raw_path = self.cache_dir / f"{key}.raw.{os.getpid()}.{threading.get_ident()}.tmp"
+            difference = np.memmap(temp_raw_path, dtype=np.float32, mode="w+", shape=shape)
+        else:
+            difference = np.empty(shape, dtype=np.float32)
+
+        for (k_start, slab), (_, next_slab) in zip(self.iter_slabs(img_path), self.iter_slabs(next_img_path)):
+            np.subtract(next_slab, slab, out=difference[k_start:k_start + len(slab)])
+
+        if temp_raw_path is None:
+            return DecodedVolume(difference, next_ijk_to_ras)
+
+        difference.flush()
+        del difference
+        raw_path = self.cache_dir / f"{key}.raw"
+        os.replace(temp_raw_path, raw_path)
+        temp_header_path = self.cache_dir / f"{key}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_header_path, "w") as f:
+            json.dump({"shape": list(shape), "ijk_to_ras": next_ijk_to_ras.tolist()}, f)
+        os.replace(temp_header_path, self.cache_dir / f"{key}.json")
+        decoded = self.load(key)
+        self.evict()
+        return decoded
+
+    def load(self, key: str) -> Optional[DecodedVolume]:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}.json") as f:
+                header = json.load(f)
+            array = np.memmap(self.cache_dir / f"{key}.raw", dtype=np.float32, mode="c", shape=tuple(header["shape"]))
+            # Marks the entry as recently used for eviction.
+            os.utime(self.cache_dir / f"{key}.raw")
+        except (OSError, KeyError, ValueError):
+            return None
+        return DecodedVolume(array, np.array(header["ijk_to_ras"]))
+
+    def usage_bytes(self) -> int:
+        return sum(raw_path.stat().st_size for raw_path in self.cache_dir.glob("*.raw"))
+
+    def evict(self) -> None:
+        with self.lock:
+            entries = []
+            for raw_path in self.cache_dir.glob("*.raw"):
+                try:
+                    stat = raw_path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, raw_path))
+            usage_bytes = sum(size for _, size, _ in entries)
+            for _, size, raw_path in sorted(entries):
+                if usage_bytes <= self.max_bytes:
+                    break
+                try:
+                    # Results still memory mapped keep their data until they are closed.
+                    os.remove(raw_path.with_suffix(".json"))
+                    os.remove(raw_path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # E.g. on Windows, where memory mapped files cannot be removed.
+                    logging.debug(f"Could not evict {raw_path}: {e}")
+                    continue
+                usage_bytes -= size
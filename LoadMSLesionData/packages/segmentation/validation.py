@@ -0,0 +1,192 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from dataclasses import dataclass, field
+from enum import Enum, auto
+import logging
+import time
+import numpy as np
+from packages.loading.decode import read_volume_info
+from packages.segmentation.file_types import FileType, file_type_to_name
+
+
+class IssueKind(Enum):
+    INVALID_DIRECTORY = auto()
+    UNREADABLE_HEADER = auto()
+    SHAPE_MISMATCH = auto()
+    SPACING_MISMATCH = auto()
+    ORIENTATION_MISMATCH = auto()
+    ORIGIN_MISMATCH = auto()
+
+
+@dataclass
+class FileHeader:
+    # Array shape in (k, j, i) order, as returned by read_volume_info.
+    shape: tuple
+    ijk_to_ras: np.ndarray
+
+    @property
+    def spacing(self) -> np.ndarray:
+        return np.linalg.norm(self.ijk_to_ras[:3, :3], axis=0)
+
+    @property
+    def directions(self) -> np.ndarray:
+        return self.ijk_to_ras[:3, :3] / self.spacing
+
+    @property
+    def origin(self) -> np.ndarray:
+        return self.ijk_to_ras[:3, 3]
+
+
+@dataclass
+class ValidationIssue:
+    kind: IssueKind
+    message: str
+    # (FileType, index) of the files involved; empty for INVALID_DIRECTORY.
+    keys: tuple = ()
+
+
+@dataclass
+class ValidationReport:
+    dir_path: str
+    headers: dict = field(default_factory=dict)
+    issues: list[ValidationIssue] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.issues
+
+    def summary(self) -> str:
+        if self.is_valid:
+            return f"{self.dir_path}: {len(self.headers)} headers consistent"
+        lines = [f"{self.dir_path}: {len(self.issues)} issues"]
+        lines += [f"  {issue.kind.name}: {issue.message}" for issue in self.issues]
+        return "\n".join(lines)
+
+
+def key_name(key) -> str:
+    return file_type_to_name(*key)
+
+
+def compare_headers(first_key, first: FileHeader, second_key, second: FileHeader, atol: float = 1e-3):
+    """Issues that keep the voxels of two files from lining up, e.g. an image and its segmentation."""
+    keys = (first_key, second_key)
+    names = f"{key_name(first_key)} and {key_name(second_key)}"
+    if tuple(first.shape) != tuple(second.shape):
+        return [ValidationIssue(IssueKind.SHAPE_MISMATCH, f"{names} have shapes {first.shape} and {second.shape}", keys)]
+    issues = []
+    if not np.allclose(first.spacing, second.spacing, atol=atol):
+        issues.append(ValidationIssue(
+            IssueKind.SPACING_MISMATCH,
+            f"{names} have spacings {np.round(first.spacing, 4).tolist()} and {np.round(second.spacing, 4).tolist()}",
+            keys
+        ))
+    if not np.allclose(first.directions, second.directions, atol=atol):
+        issues.append(ValidationIssue(IssueKind.ORIENTATION_MISMATCH, f"{names} have different orientations", keys))
+    if not np.allclose(first.origin, second.origin, atol=atol):
+        issues.append(ValidationIssue(
+            IssueKind.ORIGIN_MISMATCH,
+            f"{names} have origins {np.round(first.origin, 3).tolist()} and {np.round(second.origin, 3).tolist()}",
+            keys
+        ))
+    return issues
+
+
+def read_header(path: str, storage=None):
+    """The FileHeader of path, fetching only its header if it is in storage, or the exception raised reading it."""
+    try:
+        if storage is not None:
+            path = storage.fetch_header(path)
+        return FileHeader(*read_volume_info(path))
+    except Exception as e:
+        return e
+
+
+def header_keys_to_paths(segmentation_dir) -> dict:
+    """The files of segmentation_dir, by (FileType, index), leaving out sub images that are computed."""
+    return {
+        key: path for key, path in segmentation_dir.key_to_path().items() if not segmentation_dir.is_synthesized(*key)
+    }
+
+
+def build_report(segmentation_dir, path_to_header: dict) -> ValidationReport:
+    report = ValidationReport(segmentation_dir.dir_path)
+    for key, path in header_keys_to_paths(segmentation_dir).items():
+        header = path_to_header[path]
+        if isinstance(header, Exception):
+            report.issues.append(ValidationIssue(
+                IssueKind.UNREADABLE_HEADER, f"Cannot read the header of {path}: {header}", (key,)
+            ))
+            continue
+        report.headers[key] = header
+
+    pairs = [
+        ((FileType.IMG, index), (FileType.IMG_SEGMENTATION, index)) for index in segmentation_dir.imgs_paths
+    ] + [
+        ((FileType.SUB_IMG, index), (FileType.SUB_IMG_SEGMENTATION, index)) for index in segmentation_dir.sub_imgs_paths
+    ] + [
+        ((FileType.IMG, index), (FileType.IMG, index + 1))
+        for index in segmentation_dir.imgs_paths if index + 1 in segmentation_dir.imgs_paths
+    ]
+    for first_key, second_key in pairs:
+        if first_key in report.headers and second_key in report.headers:
+            report.issues += compare_headers(
+                first_key, report.headers[first_key], second_key, report.headers[second_key]
+            )
+    return report
+
+
+def validate_headers(segmentation_dir, max_workers: int = 8) -> ValidationReport:
+    """
+    Checks that every image matches its segmentation, and every timepoint the previous one, in shape, spacing,
+    orientation and origin, reading only the headers of the files, on max_workers threads.
+    """
+    start = time.perf_counter()
+    paths = sorted(set(header_keys_to_paths(segmentation_dir).values()))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataValidation") as executor:
+        path_to_header = dict(zip(
+            paths, executor.map(functools.partial(read_header, storage=segmentation_dir.storage), paths)
+        ))
+    report = build_report(segmentation_dir, path_to_header)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def validate_cohort(dir_paths: list[str], max_workers: int = 16) -> list[ValidationReport]:
+    """
+    validate_headers for many patient folders. Reading headers is I/O bound, so the headers of all folders are
+    read on one pool of max_workers threads rather than one folder at a time.
+    """
+    # Imported here, since packages.segmentation.segmentation imports this module.
+    from packages.segmentation.segmentation import InvalidSegmentationDirError, SegmentationDir
+
+    start = time.perf_counter()
+    dir_path_to_segmentation_dir = {}
+    reports = {}
+    for dir_path in dir_paths:
+        try:
+            dir_path_to_segmentation_dir[dir_path] = SegmentationDir(dir_path)
+        except InvalidSegmentationDirError as e:
+            reports[dir_path] = ValidationReport(
+                str(dir_path), issues=[ValidationIssue(IssueKind.INVALID_DIRECTORY, str(e))]
+            )
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataValidation") as executor:
+        dir_path_to_futures = {
+            dir_path: {
+                path: executor.submit(read_header, path, segmentation_dir.storage)
+                for path in header_keys_to_paths(segmentation_dir).values()
+            }
+            for dir_path, segmentation_dir in dir_path_to_segmentation_dir.items()
+        }
+        for dir_path, segmentation_dir in dir_path_to_segmentation_dir.items():
+            path_to_header = {path: future.result() for path, future in dir_path_to_futures[dir_path].items()}
+            reports[dir_path] = build_report(segmentation_dir, path_to_header)
+
+    reports = [reports[dir_path] for dir_path in dir_paths]
+    invalid = sum(not report.is_valid for report in reports)
+    logging.info(
+        f"Validated the headers of {len(reports)} patient folders in {time.perf_counter() - start:.1f} s, "
+        f"{invalid} with issues"
+    )
+    return reports
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Optional
+import numpy as np
+import SimpleITK as sitk
+from packages.loading.decode import DecodedVolume, read_labelmap
+from packages.statistics.spatial_index import ijk_boxes_to_ras
+from packages.utils.utils import file_sha256
+
+# Bump when the way statistics are computed changes, so that cached results are recomputed.
+STATISTICS_VERSION = 2
+MM3_PER_ML = 1000.0
+
+
+@dataclass
+class Lesion:
+    label: int
+    voxel_count: int
+    volume_ml: float
+    centroid_ras: tuple[float, float, float]
+    # Inclusive bounding box of the lesion, in (i, j, k) voxel coordinates.
+    bbox_min_ijk: tuple[int, int, int]
+    bbox_max_ijk: tuple[int, int, int]
+    # RAS axis-aligned bounds of the voxels in the bounding box, comparable between timepoints on different grids.
+    bbox_min_ras: tuple[float, float, float]
+    bbox_max_ras: tuple[float, float, float]
+
+
+@dataclass
+class LesionStatistics:
+    lesions: list[Lesion] = field(default_factory=list)
+
+    @property
+    def lesion_count(self) -> int:
+        return len(self.lesions)
+
+    @property
+    def total_volume_ml(self) -> float:
+        return sum(lesion.volume_ml for lesion in self.lesions)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, statistics: dict) -> "LesionStatistics":
+        return cls([
+            Lesion(
+                label=lesion["label"],
+                voxel_count=lesion["voxel_count"],
+                volume_ml=lesion["volume_ml"],
+                centroid_ras=tuple(lesion["centroid_ras"]),
+                bbox_min_ijk=tuple(lesion["bbox_min_ijk"]),
+                bbox_max_ijk=tuple(lesion["bbox_max_ijk"]),
+                bbox_min_ras=tuple(lesion["bbox_min_ras"]),
+                bbox_max_ras=tuple(lesion["bbox_max_ras"]),
+            )
+            for lesion in statistics["lesions"]
+        ])
+
+
+def label_connected_components(mask: np.ndarray, fully_connected: bool = True) -> tuple[np.ndarray, int]:
+    """3D connected component labeling of a boolean mask. Labels are 1..n, ordered by first voxel in memory order."""
+    labels_image = sitk.ConnectedComponent(sitk.GetImageFromArray(mask.astype(np.uint8)), fully_connected)
+    labels = sitk.GetArrayViewFromImage(labels_image).astype(np.int32)
+    return labels, int(labels.max(initial=0))
+
+
+def compute_lesion_statistics(decoded: DecodedVolume, fully_connected: bool = True) -> LesionStatistics:
+    """Every connected component of non-background voxels is a lesion, whichever segment it belongs to."""
+    labels, n_lesions = label_connected_components(decoded.array > 0, fully_connected)
+    if n_lesions == 0:
+        return LesionStatistics()
+
+    kji = np.nonzero(labels)
+    lesion_labels = labels[kji]
+    voxel_counts = np.bincount(lesion_labels, minlength=n_lesions + 1)[1:]
+
+    # Per-lesion centroid and bounding box, reduced over the voxels of each lesion after sorting them by label.
+    order = np.argsort(lesion_labels, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(voxel_counts)[:-1]))
+    ijk = np.stack(kji[::-1], axis=1)[order]
+    centroids_ijk = np.add.reduceat(ijk, starts, axis=0) / voxel_counts[:, None]
+    bbox_min_ijk = np.minimum.reduceat(ijk, starts, axis=0)
+    bbox_max_ijk = np.maximum.reduceat(ijk, starts, axis=0)
+
+    centroids_ras = centroids_ijk @ decoded.ijk_to_ras[:3, :3].T + decoded.ijk_to_ras[:3, 3]
+    bbox_min_ras, bbox_max_ras = ijk_boxes_to_ras(bbox_min_ijk, bbox_max_ijk, decoded.ijk_to_ras)
+    voxel_volume_ml = abs(np.linalg.det(decoded.ijk_to_ras[:3, :3])) / MM3_PER_ML
+    volumes_ml = voxel_counts * voxel_volume_ml
+
+    return LesionStatistics([
+        Lesion(
+            label=label,
+            voxel_count=int(voxel_counts[label - 1]),
+            volume_ml=float(volumes_ml[label - 1]),
+            centroid_ras=tuple(float(x) for x in centroids_ras[label - 1]),
+            bbox_min_ijk=tuple(int(x) for x in bbox_min_ijk[label - 1]),
+            bbox_max_ijk=tuple(int(x) for x in bbox_max_ijk[label - 1]),
+            bbox_min_ras=tuple(float(x) for x in bbox_min_ras[label - 1]),
+            bbox_max_ras=tuple(float(x) for x in bbox_max_ras[label - 1]),
+        )
+        for label in range(1, n_lesions + 1)
+    ])
+
+
+class LesionStatisticsEngine:
+    """
+    Lesion statistics of segmentation files, cached in memory and optionally on disk as JSON, keyed by the
+    SHA-256 of the file content, or of its storage's content_id for files that are not local. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, fully_connected: bool = True) -> None:
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.fully_connected = fully_connected
+        self.key_to_statistics = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, path: str, content_id: Optional[str] = None) -> str:
+        content_hash = hashlib.sha256(content_id.encode()).hexdigest() if content_id is not None else file_sha256(path)
+        return f"{content_hash}_v{STATISTICS_VERSION}_{'full' if self.fully_connected else 'face'}"
+
+    def get_path_key(self, path: str, storage=None) -> tuple[str, str]:
+        """path, fetched through storage if its content is needed for the key, and its key."""
+        content_id = storage.content_id(path) if storage is not None else None
+        if content_id is None and storage is not None:
+            path = storage.fetch(path)
+        return path, self.get_key(path, content_id)
+
+    def get(self, path: str, storage=None) -> LesionStatistics:
+        """Statistics of the file at path, fetched through storage if given only when they were not cached."""
+        path, key = self.get_path_key(path, storage)
+        with self.lock:
+            statistics = self.key_to_statistics.get(key)
+        if statistics is not None:
+            return statistics
+
+        statistics = self.load(key)
+        if statistics is None:
+            if storage is not None:
+                path = storage.fetch(path)
+            statistics = compute_lesion_statistics(read_labelmap(path), self.fully_connected)
+            self.save(key, statistics)
+        with self.lock:
+            self.key_to_statistics[key] = statistics
+        return statistics
+
+    def get_cached(self, path: str, storage=None) -> Optional[LesionStatistics]:
+        """The statistics of path if they were computed before, in memory or on disk, without computing them."""
+        _, key = self.get_path_key(path, storage)
+        with self.lock:
+            statistics = self.key_to_statistics.get(key)
+        if statistics is not None:
+            return statistics
+        statistics = self.load(key)
+        if statistics is not None:
+            with self.lock:
+                self.key_to_statistics[key] = statistics
+        return statistics
+
+    def get_for_segmentation_dir(self, segmentation_dir, max_workers: Optional[int] = None) -> dict[int, LesionStatistics]:
+        """Statistics of every img_{i}_segmentation in segmentation_dir, by timepoint index."""
+        indices = sorted(segmentation_dir.imgs_segmentations_paths)
+        paths = [segmentation_dir.imgs_segmentations_paths[index] for index in indices]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataStatistics") as executor:
+            return dict(zip(indices, executor.map(lambda path: self.get(path, segmentation_dir.storage), paths)))
+
+    def load(self, key: str) -> Optional[LesionStatistics]:
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}.json") as f:
+                return LesionStatistics.from_dict(json.load(f))
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def save(self, key: str, statistics: LesionStatistics) -> None:
+        if self.cache_dir is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.cache_dir / f"{key}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(statistics.to_dict(), f)
+            os.replace(temp_path, self.cache_dir / f"{key}.json")
+        except OSError as e:
+            logging.warning(f"Could not cache lesion statistics: {e}")
@@ -0,0 +1,133 @@
+from dataclasses import dataclass, field
+from enum import Enum, auto
+import os
+from typing import Optional
+import numpy as np
+from packages.statistics.lesion_statistics import LesionStatistics, LesionStatisticsEngine
+from packages.statistics.spatial_index import BoxIndex
+
+
+class LesionStatus(Enum):
+    NEW = auto()
+    ENLARGING = auto()
+    SHRINKING = auto()
+    STABLE = auto()
+    RESOLVED = auto()
+
+
+@dataclass
+class LesionChange:
+    status: LesionStatus
+    # Timepoint the lesion is seen at: img_{index}, or img_{index - 1} for resolved lesions.
+    index: int
+    label: int
+    volume_ml: float
+    centroid_ras: tuple[float, float, float]
+    previous_labels: list[int] = field(default_factory=list)
+    previous_volume_ml: float = 0.0
+
+
+def lesion_boxes(statistics: LesionStatistics, tolerance_mm: float) -> tuple[np.ndarray, np.ndarray]:
+    mins = np.array([lesion.bbox_min_ras for lesion in statistics.lesions], dtype=float).reshape(-1, 3)
+    maxs = np.array([lesion.bbox_max_ras for lesion in statistics.lesions], dtype=float).reshape(-1, 3)
+    return mins - tolerance_mm, maxs + tolerance_mm
+
+
+def classify_change(volume_ml: float, previous_volume_ml: float, relative_threshold: float, absolute_threshold_ml: float) -> LesionStatus:
+    delta_ml = volume_ml - previous_volume_ml
+    if abs(delta_ml) <= max(absolute_threshold_ml, relative_threshold * previous_volume_ml):
+        return LesionStatus.STABLE
+    return LesionStatus.ENLARGING if delta_ml > 0 else LesionStatus.SHRINKING
+
+
+def match_lesions(
+    previous: LesionStatistics,
+    current: LesionStatistics,
+    index: int,
+    tolerance_mm: float = 1.0,
+    relative_threshold: float = 0.2,
+    absolute_threshold_ml: float = 0.005,
+) -> list[LesionChange]:
+    """
+    Matches the lesions of img_{index - 1} and img_{index} by the overlap of their RAS bounding boxes, grown by
+    tolerance_mm to allow for registration error. A lesion that merged from several earlier lesions is compared
+    with their total volume.
+    """
+    previous_index = BoxIndex(*lesion_boxes(previous, tolerance_mm))
+    current_mins, current_maxs = lesion_boxes(current, tolerance_mm)
+
+    changes = []
+    matched_previous = set()
+    for position, lesion in enumerate(current.lesions):
+        predecessors = [previous.lesions[p] for p in previous_index.query(current_mins[position], current_maxs[position])]
+        if not predecessors:
+            changes.append(LesionChange(LesionStatus.NEW, index, lesion.label, lesion.volume_ml, lesion.centroid_ras))
+            continue
+        previous_volume_ml = sum(predecessor.volume_ml for predecessor in predecessors)
+        matched_previous.update(predecessor.label for predecessor in predecessors)
+        changes.append(LesionChange(
+            classify_change(lesion.volume_ml, previous_volume_ml, relative_threshold, absolute_threshold_ml),
+            index,
+            lesion.label,
+            lesion.volume_ml,
+            lesion.centroid_ras,
+            previous_labels=sorted(predecessor.label for predecessor in predecessors),
+            previous_volume_ml=previous_volume_ml,
+        ))
+
+    for lesion in previous.lesions:
+        if lesion.label not in matched_previous:
+            changes.append(LesionChange(
+                LesionStatus.RESOLVED, index - 1, lesion.label, 0.0, lesion.centroid_ras,
+                previous_labels=[lesion.label], previous_volume_ml=lesion.volume_ml,
+            ))
+    return changes
+
+
+class LesionTracker:
+    """
+    Lesion changes between every pair of consecutive timepoints of a SegmentationDir, computed from (cached)
+    lesion statistics, so that no segmentation is read again once its statistics are known.
+    Results are cached per directory until one of its segmentation files changes.
+    """
+
+    def __init__(self, statistics_engine: LesionStatisticsEngine, tolerance_mm: float = 1.0) -> None:
+        self.statistics_engine = statistics_engine
+        self.tolerance_mm = tolerance_mm
+        self.key_to_changes = {}
+
+    def get_key(self, segmentation_dir) -> tuple:
+        files = []
+        for index, path in sorted(segmentation_dir.imgs_segmentations_paths.items()):
+            stat = os.stat(path)
+            files.append((index, path, stat.st_size, stat.st_mtime_ns))
+        return segmentation_dir.dir_path, self.tolerance_mm, tuple(files)
+
+    def track(self, segmentation_dir) -> dict[int, list[LesionChange]]:
+        """Changes from img_{index - 1} to img_{index}, by index."""
+        key = self.get_key(segmentation_dir)
+        if key in self.key_to_changes:
+            return self.key_to_changes[key]
+
+        index_to_statistics = self.statistics_engine.get_for_segmentation_dir(segmentation_dir)
+        indices = sorted(index_to_statistics)
+        index_to_changes = {
+            index: match_lesions(index_to_statistics[previous_index], index_to_statistics[index], index, self.tolerance_mm)
+            for previous_index, index in zip(indices, indices[1:])
+        }
+        self.key_to_changes[key] = index_to_changes
+        return index_to_changes
+
+    def find_next(self, segmentation_dir, status: LesionStatus, after: Optional[tuple[int, int]] = None) -> Optional[LesionChange]:
+        """First change with status after the (index, label) position `after`, wrapping around to the start."""
+        changes = sorted(
+            (change for changes in self.track(segmentation_dir).values() for change in changes if change.status == status),
+            key=lambda change: (change.index, change.label),
+        )
+        if not changes:
+            return None
+        if after is not None:
+            for change in changes:
+                if (change.index, change.label) > after:
+                    return change
+        return changes[0]
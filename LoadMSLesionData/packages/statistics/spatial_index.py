@@ -0,0 +1,35 @@
+import numpy as np
+
+
+class BoxIndex:
+    """
+    Axis-aligned boxes, sorted by their lower bound on the first axis, that can be queried for the boxes
+    intersecting a given box. A query only looks at the boxes starting before the query box ends,
+    and filters those in one vectorized pass.
+    """
+
+    def __init__(self, mins: np.ndarray, maxs: np.ndarray) -> None:
+        mins = np.asarray(mins, dtype=float).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=float).reshape(-1, 3)
+        self.order = np.argsort(mins[:, 0], kind="stable")
+        self.mins = mins[self.order]
+        self.maxs = maxs[self.order]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def query(self, query_min, query_max) -> np.ndarray:
+        """Positions (in the order the boxes were given) of the boxes intersecting [query_min, query_max]."""
+        end = np.searchsorted(self.mins[:, 0], query_max[0], side="right")
+        intersects = np.all(self.maxs[:end] >= query_min, axis=1) & np.all(self.mins[:end] <= query_max, axis=1)
+        return self.order[:end][intersects]
+
+
+def ijk_boxes_to_ras(bbox_mins_ijk: np.ndarray, bbox_maxs_ijk: np.ndarray, ijk_to_ras: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """RAS axis-aligned bounds of inclusive voxel bounding boxes, including the full extent of the edge voxels."""
+    bbox_mins_ijk = np.asarray(bbox_mins_ijk, dtype=float).reshape(-1, 3) - 0.5
+    bbox_maxs_ijk = np.asarray(bbox_maxs_ijk, dtype=float).reshape(-1, 3) + 0.5
+    corner_selectors = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)], dtype=bool)
+    corners_ijk = np.where(corner_selectors[None, :, :], bbox_maxs_ijk[:, None, :], bbox_mins_ijk[:, None, :])
+    corners_ras = corners_ijk @ ijk_to_ras[:3, :3].T + ijk_to_ras[:3, 3]
+    return corners_ras.min(axis=1), corners_ras.max(axis=1)
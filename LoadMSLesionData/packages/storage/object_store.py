@@ -0,0 +1,427 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import errno
+import hashlib
+import http.client
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import quote, urlencode, urlsplit
+from xml.etree import ElementTree
+from packages.storage.storage import OBJECT_STORE_SCHEMES, StorageEntry
+from packages.utils.utils import KIBIBYTE, MEBIBYTE
+
+# read_volume_info needs only the first few KiB of .nii.gz and .nrrd files, so headers are read from the first block.
+DEFAULT_BLOCK_SIZE = 64 * KIBIBYTE
+# Missing blocks are fetched in ranged requests of at most this many bytes, spread over the worker threads.
+MAX_RANGE_BYTES = 8 * MEBIBYTE
+
+
+class ObjectStoreError(OSError):
+    pass
+
+
+def parse_object_store_url(url: str) -> tuple[str, str, str]:
+    """(endpoint, bucket, key) of a path-style object URL, e.g. https://host:9000/bucket/cohort/patient_1."""
+    parts = urlsplit(url)
+    bucket, _, key = parts.path.strip("/").partition("/")
+    if parts.scheme not in OBJECT_STORE_SCHEMES or not parts.netloc or not bucket:
+        raise ValueError(f"Not an object store URL of the form http(s)://host/bucket/key: {url}")
+    return f"{parts.scheme}://{parts.netloc}", bucket, key
+
+
+def parse_last_modified(text: str) -> int:
+    """Nanoseconds since the epoch of an ISO 8601 LastModified time, e.g. 2024-05-01T12:00:00.000Z."""
+    modified = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    return int(round(modified.timestamp() * 1e6)) * 1000
+
+
+def parse_http_date(text: str) -> int:
+    """Nanoseconds since the epoch of an HTTP date, e.g. a Last-Modified header."""
+    return int(round(parsedate_to_datetime(text).timestamp() * 1e6)) * 1000
+
+
+def find_children(element, name: str) -> list:
+    # Listings are namespaced by S3, and not necessarily by other stores.
+    return [child for child in element if child.tag.rsplit("}", 1)[-1] == name]
+
+
+def child_text(element, name: str, default: str = "") -> str:
+    children = find_children(element, name)
+    return children[0].text or default if children else default
+
+
+@dataclass
+class CachedObject:
+    key: str
+    size: int
+    mtime_ns: int
+    etag: str = ""
+    # Indices of the blocks of block_size bytes that were fetched into the local copy.
+    blocks: set = field(default_factory=set)
+    last_used: float = 0.0
+
+
+class ObjectStoreStorage:
+    """
+    Patient folders in an S3-compatible object store, or any HTTP server that answers ListObjectsV2 listings and
+    ranged GETs. Each object is mirrored under cache_dir by a sparse local file of the same size and modification
+    time, so that SegmentationDir, the caches, SimpleITK and Slicer read it as a local path, and its content is
+    fetched in blocks of block_size bytes when it is first needed: only the first block for a header, all of it
+    before decoding. A directory is listed with one request per 1000 files. Missing blocks are fetched with ranged
+    GETs, concurrently on max_workers threads that each keep their connection open. Fetched blocks are kept across
+    sessions, and the least recently used objects are dropped from the cache once it holds more than max_bytes.
+    Requests are not signed, so the bucket must allow anonymous reads, or headers must carry whatever credentials
+    a gateway in front of it expects. Safe to use from several threads.
+    """
+
+    is_local = False
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        cache_dir: str,
+        max_bytes: int = 10 * 1024 * MEBIBYTE,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_workers: int = 8,
+        headers: Optional[dict] = None,
+        timeout: float = 30.0,
+    ) -> None:
+        parts = urlsplit(endpoint)
+        self.endpoint = f"{parts.scheme}://{parts.netloc}"
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.bucket = bucket
+        self.cache_dir = Path(cache_dir)
+        self.mirror_root = self.cache_dir / "objects" / self.netloc.replace(":", "_") / bucket
+        self.state_dir = self.cache_dir / "state"
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.max_workers = max_workers
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.path_to_object: dict[str, CachedObject] = {}
+        # Held while the blocks of a path are fetched or dropped. Reentrant, since fetching may list the object first.
+        self.path_to_lock: dict[str, threading.RLock] = {}
+        self.local = threading.local()
+        self.open_connections = []
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LoadMSLesionDataStorage")
+        self.requests = 0
+        self.bytes_received = 0
+        self.connections_opened = 0
+        self.load_state()
+
+    def local_dir(self, url: str) -> str:
+        """The local path that SegmentationDir reads the folder at url from."""
+        endpoint, bucket, key = parse_object_store_url(url)
+        if (endpoint, bucket) != (self.endpoint, self.bucket):
+            raise ValueError(f"{url} is not in {self.endpoint}/{self.bucket}")
+        return str(self.mirror_path(key.strip("/")))
+
+    def mirror_path(self, key: str) -> Path:
+        return self.mirror_root.joinpath(*key.split("/")) if key else self.mirror_root
+
+    def get_key(self, path: str) -> str:
+        key = Path(path).relative_to(self.mirror_root).as_posix()
+        return "" if key == "." else key
+
+    def location(self, path: str) -> str:
+        return f"{self.endpoint}/{self.bucket}/{self.get_key(path)}"
+
+    def content_id(self, path: str) -> Optional[str]:
+        # Local copies may be partly fetched, or evicted to zeros, so their content cannot identify the object.
+        with self.lock:
+            cached = self.path_to_object.get(str(path))
+        if cached is None or not cached.etag:
+            return None
+        return f"{self.location(path)}|{cached.etag}"
+
+    def get_path_lock(self, path: str) -> threading.RLock:
+        with self.lock:
+            return self.path_to_lock.setdefault(path, threading.RLock())
+
+    def get_connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            connection = connection_class(self.netloc, timeout=self.timeout)
+            self.local.connection = connection
+            with self.lock:
+                self.connections_opened += 1
+                self.open_connections.append(connection)
+        return connection
+
+    def close_connection(self) -> None:
+        connection = self.local.connection
+        connection.close()
+        self.local.connection = None
+        with self.lock:
+            if connection in self.open_connections:
+                self.open_connections.remove(connection)
+
+    def request(self, method: str, target: str, headers: Optional[dict] = None) -> tuple[int, object, bytes]:
+        """Sends a request on this thread's connection, reconnecting once if the server closed it meanwhile."""
+        for attempt in range(2):
+            connection = self.get_connection()
+            try:
+                connection.request(method, target, headers={**self.headers, **(headers or {})})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                self.close_connection()
+                if attempt == 1:
+                    raise ObjectStoreError(f"{method} {self.endpoint}{target} failed: {e}") from e
+                continue
+            with self.lock:
+                self.requests += 1
+                self.bytes_received += len(body)
+            if response.will_close:
+                self.close_connection()
+            return response.status, response, body
+
+    def object_target(self, key: str) -> str:
+        return "/" + quote(f"{self.bucket}/{key}")
+
+    def list_dir(self, dir_path: str, accept: Optional[Callable[[str], bool]] = None) -> list[StorageEntry]:
+        """The objects directly under dir_path whose names are accepted, listed in pages of up to 1000."""
+        key = self.get_key(dir_path)
+        prefix = f"{key}/" if key else ""
+        entries = []
+        name_to_etag = {}
+        continuation_token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix, "delimiter": "/"}
+            if continuation_token is not None:
+                query["continuation-token"] = continuation_token
+            status, _, body = self.request("GET", f"/{quote(self.bucket)}?{urlencode(query)}")
+            if status == 404:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), self.location(dir_path))
+            if status != 200:
+                raise ObjectStoreError(f"Listing {self.location(dir_path)} failed with HTTP {status}")
+            listing = ElementTree.fromstring(body)
+            for contents in find_children(listing, "Contents"):
+                name = child_text(contents, "Key")[len(prefix):]
+                if not name or "/" in name or (accept is not None and not accept(name)):
+                    continue
+                entries.append(StorageEntry(
+                    name, int(child_text(contents, "Size", "0")), parse_last_modified(child_text(contents, "LastModified"))
+                ))
+                name_to_etag[name] = child_text(contents, "ETag").strip('"')
+            continuation_token = child_text(listing, "NextContinuationToken") or None
+            if child_text(listing, "IsTruncated") != "true" or continuation_token is None:
+                break
+
+        for entry in entries:
+            self.update_object(
+                str(self.mirror_path(prefix + entry.name)), entry.size, entry.mtime_ns, name_to_etag[entry.name]
+            )
+        return entries
+
+    def head(self, path: str) -> CachedObject:
+        key = self.get_key(path)
+        status, response, _ = self.request("HEAD", self.object_target(key))
+        if status == 404:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), self.location(path))
+        if status != 200:
+            raise ObjectStoreError(f"HEAD {self.location(path)} failed with HTTP {status}")
+        return self.update_object(
+            path,
+            int(response.getheader("Content-Length", "0")),
+            parse_http_date(response.getheader("Last-Modified", "")),
+            (response.getheader("ETag") or "").strip('"')
+        )
+
+    def update_object(self, path: str, size: int, mtime_ns: int, etag: str) -> CachedObject:
+        """
+        Records the size, modification time and ETag of an object as listed, and creates its sparse local copy.
+        Blocks fetched before are dropped if the object changed since.
+        """
+        with self.get_path_lock(path):
+            with self.lock:
+                cached = self.path_to_object.get(path)
+            if cached is not None and (cached.size, cached.mtime_ns, cached.etag) == (size, mtime_ns, etag):
+                if os.path.exists(path):
+                    return cached
+            cached = CachedObject(self.get_key(path), size, mtime_ns, etag)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.truncate(size)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+            with self.lock:
+                self.path_to_object[path] = cached
+            self.save_state(cached)
+            return cached
+
+    def get_ranges(self, blocks: list[int]) -> list[tuple[int, int]]:
+        """(first, stop) block ranges covering blocks, split so that a large fetch is spread over the workers."""
+        max_blocks = max(1, min(
+            MAX_RANGE_BYTES // self.block_size, math.ceil(len(blocks) / self.max_workers)
+        ))
+        ranges = []
+        for block in blocks:
+            if ranges and ranges[-1][1] == block and ranges[-1][1] - ranges[-1][0] < max_blocks:
+                ranges[-1] = (ranges[-1][0], block + 1)
+            else:
+                ranges.append((block, block + 1))
+        return ranges
+
+    def fetch_range(self, cached: CachedObject, path: str, first: int, stop: int) -> None:
+        start = first * self.block_size
+        end = min(stop * self.block_size, cached.size)
+        status, _, body = self.request("GET", self.object_target(cached.key), {"Range": f"bytes={start}-{end - 1}"})
+        if status == 200:
+            # The server ignored the range and sent the whole object.
+            body = body[start:end]
+        elif status != 206:
+            raise ObjectStoreError(f"GET {self.location(path)} failed with HTTP {status}")
+        if len(body) != end - start:
+            raise ObjectStoreError(f"GET {self.location(path)} returned {len(body)} bytes instead of {end - start}")
+        with open(path, "r+b") as f:
+            f.seek(start)
+            f.write(body)
+
+    def fetch_blocks(self, path: str, end: Optional[int] = None) -> str:
+        """Fetches the missing blocks of the first end bytes of path, or of all of it, and returns path."""
+        path = str(path)
+        with self.get_path_lock(path):
+            with self.lock:
+                cached = self.path_to_object.get(path)
+            if cached is None or not os.path.exists(path):
+                cached = self.head(path)
+            end = cached.size if end is None else min(end, cached.size)
+            missing = [block for block in range(math.ceil(end / self.block_size)) if block not in cached.blocks]
+            if missing:
+                futures = [
+                    self.executor.submit(self.fetch_range, cached, path, first, stop)
+                    for first, stop in self.get_ranges(missing)
+                ]
+                try:
+                    for future in futures:
+                        future.result()
+                finally:
+                    # Writing the blocks changed the modification time, which the caches key local files by.
+                    os.utime(path, ns=(cached.mtime_ns, cached.mtime_ns))
+                with self.lock:
+                    cached.blocks.update(missing)
+            cached.last_used = time.time()
+            if missing:
+                self.save_state(cached)
+        self.evict(keep=path)
+        return path
+
+    def fetch(self, path: str) -> str:
+        return self.fetch_blocks(path)
+
+    def fetch_header(self, path: str) -> str:
+        return self.fetch_blocks(path, self.block_size)
+
+    def cached_bytes(self) -> int:
+        with self.lock:
+            return sum(
+                min(len(cached.blocks) * self.block_size, cached.size) for cached in self.path_to_object.values()
+            )
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Drops the blocks of the least recently used objects, other than keep, until at most max_bytes are cached."""
+        excess = self.cached_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        with self.lock:
+            candidates = sorted(
+                (cached.last_used, path) for path, cached in self.path_to_object.items() if path != keep and cached.blocks
+            )
+        for _, path in candidates:
+            if excess <= 0:
+                break
+            lock = self.get_path_lock(path)
+            if not lock.acquire(blocking=False):
+                # Being fetched, so not the least recently used anymore.
+                continue
+            try:
+                cached = self.path_to_object[path]
+                nbytes = min(len(cached.blocks) * self.block_size, cached.size)
+                # Truncating frees the blocks but keeps the sparse local copy, with its size and modification time.
+                with open(path, "r+b") as f:
+                    f.truncate(0)
+                    f.truncate(cached.size)
+                os.utime(path, ns=(cached.mtime_ns, cached.mtime_ns))
+                with self.lock:
+                    cached.blocks.clear()
+                self.save_state(cached)
+                excess -= nbytes
+            except OSError as e:
+                logging.warning(f"Could not drop {path} from the object store cache: {e}")
+            finally:
+                lock.release()
+
+    def get_state_path(self, key: str) -> Path:
+        return self.state_dir / f"{hashlib.sha256(f'{self.netloc}/{self.bucket}/{key}'.encode()).hexdigest()}.json"
+
+    def save_state(self, cached: CachedObject) -> None:
+        state = {
+            "netloc": self.netloc,
+            "bucket": self.bucket,
+            "key": cached.key,
+            "size": cached.size,
+            "mtime_ns": cached.mtime_ns,
+            "etag": cached.etag,
+            "blocks": sorted(cached.blocks),
+            "last_used": cached.last_used,
+        }
+        state_path = self.get_state_path(cached.key)
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            temp_path = state_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(temp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_path, state_path)
+        except OSError as e:
+            logging.warning(f"Could not save the object store cache state of {cached.key}: {e}")
+
+    def load_state(self) -> None:
+        """Picks up the blocks fetched in earlier sessions, whose local copies are still there."""
+        if not self.state_dir.is_dir():
+            return
+        for state_path in self.state_dir.glob("*.json"):
+            try:
+                with open(state_path) as f:
+                    state = json.load(f)
+                if (state["netloc"], state["bucket"]) != (self.netloc, self.bucket):
+                    continue
+                path = self.mirror_path(state["key"])
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime_ns) != (state["size"], state["mtime_ns"]):
+                    continue
+                self.path_to_object[str(path)] = CachedObject(
+                    state["key"], state["size"], state["mtime_ns"], state["etag"], set(state["blocks"]),
+                    state["last_used"]
+                )
+            except (OSError, KeyError, ValueError):
+                continue
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {
+                "requests": self.requests,
+                "bytes_received": self.bytes_received,
+                "connections_opened": self.connections_opened,
+            }
+        stats["cached_bytes"] = self.cached_bytes()
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            connections, self.open_connections = self.open_connections, []
+        for connection in connections:
+            connection.close()
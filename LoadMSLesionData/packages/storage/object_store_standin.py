@@ -0,0 +1,154 @@
+"""
+Minimal stand-in for an S3-compatible object store, serving a local directory over HTTP, so that
+ObjectStoreStorage can be tested and benchmarked without one. Each subdirectory of root_dir is a bucket. Only what
+ObjectStoreStorage uses is answered: ListObjectsV2 listings, HEAD, and GETs with a single byte range. Connections
+are kept alive, and the requests, connections and bytes served are counted.
+"""
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+from pathlib import Path
+import re
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+class StandInObjectStoreHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.standin.count(connections=1)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def send_body(self, status: int, body: bytes, headers: dict, send_body: bool = True) -> None:
+        # Counted before responding, so that the counts are up to date once the client has the response.
+        self.server.standin.count(requests=1, bytes_sent=len(body) if send_body else 0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.handle_object_request(send_body=True)
+
+    def do_HEAD(self) -> None:
+        self.handle_object_request(send_body=False)
+
+    def handle_object_request(self, send_body: bool) -> None:
+        parts = urlsplit(self.path)
+        bucket, _, key = unquote(parts.path).strip("/").partition("/")
+        bucket_dir = self.server.standin.root_dir / bucket
+        if not bucket or not bucket_dir.is_dir():
+            self.send_body(404, b"", {}, send_body)
+            return
+        if not key:
+            self.send_body(200, self.server.standin.list_objects(bucket_dir, parse_qs(parts.query)), {
+                "Content-Type": "application/xml"
+            }, send_body)
+            return
+
+        path = bucket_dir.joinpath(*key.split("/"))
+        if not path.is_file():
+            self.send_body(404, b"", {}, send_body)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        stat = os.stat(path)
+        headers = {
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+            "ETag": f'"{stat.st_size}-{stat.st_mtime_ns}"',
+            "Accept-Ranges": "bytes",
+        }
+        match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        if match is None:
+            self.send_body(200, data, headers, send_body)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        self.send_body(206, data[start:end + 1], headers, send_body)
+
+
+class ObjectStoreStandIn:
+    def __init__(self, root_dir: str, page_size: int = 1000) -> None:
+        self.root_dir = Path(root_dir)
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.bytes_sent = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, requests: int = 0, connections: int = 0, bytes_sent: int = 0) -> None:
+        with self.lock:
+            self.requests += requests
+            self.connections += connections
+            self.bytes_sent += bytes_sent
+
+    def list_objects(self, bucket_dir: Path, query: dict) -> bytes:
+        """A ListObjectsV2 page of the files under bucket_dir, with prefix, delimiter and continuation-token."""
+        prefix = query.get("prefix", [""])[0]
+        delimiter = query.get("delimiter", [""])[0]
+        start_after = query.get("continuation-token", [""])[0]
+        keys = sorted(
+            path.relative_to(bucket_dir).as_posix() for path in bucket_dir.rglob("*") if path.is_file()
+        )
+        keys = [
+            key for key in keys
+            if key.startswith(prefix) and key > start_after
+            and not (delimiter and delimiter in key[len(prefix):])
+        ]
+        page, truncated = keys[:self.page_size], len(keys) > self.page_size
+        contents = []
+        for key in page:
+            stat = os.stat(bucket_dir.joinpath(*key.split("/")))
+            modified = datetime.fromtimestamp(stat.st_mtime_ns / 1e9, timezone.utc).isoformat(timespec="microseconds")
+            contents.append(
+                f"<Contents><Key>{escape(key)}</Key><LastModified>{modified.replace('+00:00', 'Z')}</LastModified>"
+                f"<ETag>&quot;{stat.st_size}-{stat.st_mtime_ns}&quot;</ETag><Size>{stat.st_size}</Size></Contents>"
+            )
+        next_token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket_dir.name)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{next_token}{''.join(contents)}"
+            "</ListBucketResult>"
+        ).encode()
+
+    def start(self) -> str:
+        """Starts serving on a free local port, and returns the endpoint URL."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInObjectStoreHandler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.endpoint
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self) -> "ObjectStoreStandIn":
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.stop()
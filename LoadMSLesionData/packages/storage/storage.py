@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+import os
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+OBJECT_STORE_SCHEMES = ("http", "https")
+
+
+@dataclass
+class StorageEntry:
+    name: str
+    size: int
+    mtime_ns: int
+
+
+def is_object_store_url(location: str) -> bool:
+    return urlsplit(str(location)).scheme in OBJECT_STORE_SCHEMES
+
+
+def is_directory_location(location: str) -> bool:
+    """Whether location can be opened as a patient folder: a local directory, or a folder URL in an object store."""
+    return os.path.isdir(location) or is_object_store_url(location)
+
+
+class LocalStorage:
+    """
+    Files on a local or mounted filesystem, read in place. The storage of a SegmentationDir lists its directory, and
+    makes sure files are readable before they are decoded: the paths of the directory are always local paths, which
+    for other storages are the paths of local copies, filled in by fetch() and fetch_header().
+    """
+
+    is_local = True
+
+    def list_dir(self, dir_path: str, accept: Optional[Callable[[str], bool]] = None) -> list[StorageEntry]:
+        """The files of dir_path whose names are accepted, with their size and modification time."""
+        entries = []
+        with os.scandir(dir_path) as dir_entries:
+            for dir_entry in dir_entries:
+                if accept is not None and not accept(dir_entry.name):
+                    continue
+                try:
+                    stat = dir_entry.stat()
+                except FileNotFoundError:
+                    # Removed since it was listed.
+                    continue
+                entries.append(StorageEntry(dir_entry.name, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def fetch(self, path: str) -> str:
+        """Makes the whole file at path readable, and returns path."""
+        return path
+
+    def fetch_header(self, path: str) -> str:
+        """Makes at least the header of the file at path readable, e.g. for read_volume_info, and returns path."""
+        return path
+
+    def location(self, path: str) -> str:
+        """Where path is stored, e.g. its URL, as shown to the user."""
+        return str(path)
+
+    def content_id(self, path: str) -> Optional[str]:
+        """
+        Identifies the content of the file at path without reading it, e.g. for cache keys, or None if only its
+        content can. Local files are hashed instead, since copies of a file share its content.
+        """
+        return None
+
+    def stats(self) -> dict:
+        return {}
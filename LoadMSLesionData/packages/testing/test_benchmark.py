@@ -0,0 +1,43 @@
+import inspect
+import logging
+from pathlib import Path
+import numpy as np
+from packages.benchmark.benchmarks import compare_results
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.loading.decode import read_labelmap, read_volume
+from packages.segmentation.segmentation import SegmentationDir
+from packages.testing.utils import *
+
+
+class BenchmarkTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_synthetic_patient(self):
+        config = SyntheticPatientConfig(shape=(16, 32, 32), spacing=(4.0, 4.0, 4.0), timepoints=3, lesion_density=20.0)
+        patient_dir = make_synthetic_patient(Path(self.test_dir_path) / "synthetic_patient", config)
+
+        segmentation_dir = SegmentationDir(str(patient_dir))
+        assert sorted(segmentation_dir.imgs_paths) == [0, 1, 2]
+        assert sorted(segmentation_dir.sub_imgs_paths) == [0, 1]
+
+        image = read_volume(segmentation_dir.imgs_paths[0])
+        labelmap = read_labelmap(segmentation_dir.imgs_segmentations_paths[0])
+        assert image.array.shape == labelmap.array.shape == config.shape
+        assert np.allclose(image.spacing, config.spacing)
+        assert labelmap.array.any()
+        # Lesions are hyperintense.
+        assert image.array[labelmap.array > 0].mean() > image.array[labelmap.array == 0].mean()
+
+    def test_compare_results(self):
+        baseline = {"timings": {"next": {"median_ms": 10.0}, "prev": {"median_ms": 10.0}}, "memory": {"peak_rss_bytes": 100}}
+        current = {"timings": {"next": {"median_ms": 10.5}, "prev": {"median_ms": 20.0}}, "memory": {"peak_rss_bytes": 100}}
+        regressions = compare_results(baseline, current, tolerance=0.1)
+        assert [metric for metric, *_ in regressions] == ["prev.median_ms"]
@@ -0,0 +1,118 @@
+import inspect
+import logging
+import os
+from pathlib import Path
+from packages.batch.cohort_catalog import CohortCatalog
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.segmentation.segmentation import SegmentationDir
+from packages.statistics.lesion_statistics import LesionStatisticsEngine
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class CatalogTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def make_cohort(self, root_dir: Path) -> None:
+        make_synthetic_patient(root_dir / "patient_a", SyntheticPatientConfig(shape=(8, 16, 16), timepoints=3))
+        make_synthetic_patient(root_dir / "patient_b", SyntheticPatientConfig(shape=(8, 16, 16), timepoints=2, seed=1))
+        (root_dir / "not_a_patient").mkdir()
+
+    def test_refresh_and_search(self):
+        with TempDir(Path(self.test_dir_path) / "test_refresh_and_search") as temp_dir_path:
+            root_dir = Path(temp_dir_path) / "cohort"
+            self.make_cohort(root_dir)
+            catalog = CohortCatalog(Path(temp_dir_path) / "catalog.sqlite")
+            refresh = catalog.refresh(str(root_dir), max_workers=4)
+            assert (refresh.added, refresh.updated, refresh.removed, refresh.unchanged) == (3, 0, 0, 0)
+
+            entries = catalog.search(str(root_dir))
+            assert [entry.name for entry in entries] == ["not_a_patient", "patient_a", "patient_b"]
+            assert [entry.valid for entry in entries] == [False, True, True]
+            assert [entry.timepoints for entry in entries] == [0, 3, 2]
+
+            entries = catalog.search(str(root_dir), text="patient_", order_by="timepoints", descending=True)
+            assert [entry.name for entry in entries] == ["patient_a", "patient_b"]
+            assert catalog.search(str(root_dir), text="%") == []
+            try:
+                catalog.search(str(root_dir), order_by="name; DROP TABLE patients")
+            except ValueError:
+                pass
+            else:
+                raise TestFailedError("Sorting by an unknown column did not raise")
+            catalog.close()
+
+    def test_incremental_refresh(self):
+        with TempDir(Path(self.test_dir_path) / "test_incremental_refresh") as temp_dir_path:
+            root_dir = Path(temp_dir_path) / "cohort"
+            self.make_cohort(root_dir)
+            catalog = CohortCatalog(Path(temp_dir_path) / "catalog.sqlite")
+            catalog.refresh(str(root_dir))
+            refresh = catalog.refresh(str(root_dir))
+            assert (refresh.added, refresh.updated, refresh.removed, refresh.unchanged) == (0, 0, 0, 3)
+
+            # Rewriting a file changes its size or modification time, which makes its folder be rescanned.
+            path = root_dir / "patient_b" / "img_1.nii.gz"
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            os.rename(root_dir / "not_a_patient", root_dir / "renamed")
+            refresh = catalog.refresh(str(root_dir))
+            assert (refresh.added, refresh.updated, refresh.removed, refresh.unchanged) == (1, 1, 1, 1)
+            catalog.close()
+
+            # The catalog is kept on disk across sessions.
+            catalog = CohortCatalog(Path(temp_dir_path) / "catalog.sqlite")
+            assert len(catalog.search(str(root_dir))) == 3
+            catalog.close()
+
+    def test_directory_index(self):
+        with TempDir(Path(self.test_dir_path) / "test_directory_index") as temp_dir_path:
+            root_dir = Path(temp_dir_path) / "cohort"
+            self.make_cohort(root_dir)
+            patient_dir = str(root_dir / "patient_a")
+            catalog = CohortCatalog(Path(temp_dir_path) / "catalog.sqlite")
+            assert catalog.directory_index(patient_dir) is None
+            catalog.refresh(str(root_dir))
+
+            dir_index = catalog.directory_index(patient_dir)
+            segmentation_dir = SegmentationDir(patient_dir, dir_index=dir_index)
+            assert segmentation_dir.dir_index is dir_index
+            assert segmentation_dir.imgs_paths == SegmentationDir(patient_dir).imgs_paths
+            assert dir_index.stats == SegmentationDir(patient_dir).dir_index.stats
+
+            # A stored index is not used once files were added or removed since.
+            os.remove(Path(patient_dir) / "img_sub_1.nii.gz")
+            assert catalog.directory_index(patient_dir) is None
+            catalog.close()
+
+    def test_lesion_summary(self):
+        with TempDir(Path(self.test_dir_path) / "test_lesion_summary") as temp_dir_path:
+            root_dir = Path(temp_dir_path) / "cohort"
+            self.make_cohort(root_dir)
+            engine = LesionStatisticsEngine(cache_dir=str(Path(temp_dir_path) / "statistics"))
+            catalog = CohortCatalog(Path(temp_dir_path) / "catalog.sqlite", statistics_engine=engine)
+            catalog.refresh(str(root_dir))
+            # Statistics are only read from the cache, never computed while refreshing.
+            assert catalog.get(str(root_dir / "patient_a")).lesion_count is None
+
+            segmentation_dir = SegmentationDir(str(root_dir / "patient_a"))
+            statistics = engine.get(segmentation_dir.imgs_segmentations_paths[2])
+            stat = os.stat(root_dir / "patient_a")
+            os.utime(root_dir / "patient_a", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            catalog.refresh(str(root_dir))
+            entry = catalog.get(str(root_dir / "patient_a"))
+            assert entry.lesion_count == statistics.lesion_count
+            assert abs(entry.lesion_volume_ml - statistics.total_volume_ml) < 1e-9
+
+            catalog.set_lesion_summary(str(root_dir / "patient_b"), 7, 1.5)
+            entries = catalog.search(str(root_dir), order_by="lesion_count", descending=True)
+            assert [entry.name for entry in entries] == ["patient_b", "patient_a", "not_a_patient"]
+            catalog.close()
@@ -0,0 +1,110 @@
+import inspect
+import logging
+from pathlib import Path
+import numpy as np
+import SimpleITK as sitk
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.loading.decode import DecodedVolume, read_labelmap
+from packages.segmentation.change_map import (
+    CHANGE_NEW, CHANGE_PERSISTENT, CHANGE_RESOLVED, ChangeMaps, compute_change_map
+)
+from packages.segmentation.segmentation import SegmentationDir
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class ChangeMapTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_compute_change_map(self):
+        ijk_to_ras = np.diag([2.0, 1.0, 1.0, 1.0])
+        array = np.zeros((6, 7, 9), dtype=np.uint8)
+        next_array = np.zeros((6, 7, 9), dtype=np.uint8)
+        array[1, 2, 3:6] = 1
+        next_array[1, 2, 4:8] = 2
+        next_array[4, 5, 1] = 1
+
+        change_map = compute_change_map(DecodedVolume(array, ijk_to_ras), DecodedVolume(next_array, ijk_to_ras))
+        summary = change_map.summary
+        assert (summary.new_voxels, summary.resolved_voxels, summary.persistent_voxels) == (3, 1, 2)
+        assert summary.delta_voxels == 2
+        assert np.isclose(summary.delta_ml, 2 * 2.0 / 1000)
+
+        # Only the bounding box of the lesions of both segmentations is kept.
+        assert change_map.labelmap.bbox_min == (1, 2, 1) and change_map.labelmap.bbox_max == (5, 6, 8)
+        expected = np.zeros_like(array)
+        expected[1, 2, 3] = CHANGE_RESOLVED
+        expected[1, 2, 4:6] = CHANGE_PERSISTENT
+        expected[1, 2, 6:8] = CHANGE_NEW
+        expected[4, 5, 1] = CHANGE_NEW
+        assert np.array_equal(change_map.labelmap.to_decoded().array, expected)
+
+    def test_no_lesions(self):
+        array = np.zeros((4, 4, 4), dtype=np.uint8)
+        change_map = compute_change_map(DecodedVolume(array, np.eye(4)), DecodedVolume(array, np.eye(4)))
+        assert change_map.summary.new_voxels == change_map.summary.resolved_voxels == 0
+        assert not change_map.labelmap.to_decoded().array.any()
+
+    def test_different_grids(self):
+        array = np.zeros((4, 4, 4), dtype=np.uint8)
+        try:
+            compute_change_map(DecodedVolume(array, np.eye(4)), DecodedVolume(array, np.diag([2.0, 1.0, 1.0, 1.0])))
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected a ValueError"
+
+    def make_patient(self, dir_path) -> Path:
+        return make_synthetic_patient(
+            dir_path, SyntheticPatientConfig(shape=(16, 32, 32), timepoints=3, new_lesion_density=20.0)
+        )
+
+    def test_cached(self):
+        with TempDir(Path(self.test_dir_path) / "test_cached") as temp_dir_path:
+            patient_dir = self.make_patient(Path(temp_dir_path) / "patient")
+            paths = (str(patient_dir / "img_0_segmentation.nrrd"), str(patient_dir / "img_1_segmentation.nrrd"))
+            cache_dir = Path(temp_dir_path) / "change_maps"
+            change_map = ChangeMaps(cache_dir=str(cache_dir)).get(*paths)
+            expected = compute_change_map(read_labelmap(paths[0]), read_labelmap(paths[1]))
+            assert change_map.summary == expected.summary
+            assert change_map.summary.new_voxels > 0
+
+            # A new instance reads both the summary and the masks from disk instead of computing them.
+            change_maps = ChangeMaps(cache_dir=str(cache_dir))
+            change_maps.compute = None
+            assert change_maps.get_summary(*paths) == expected.summary
+            assert np.array_equal(
+                change_maps.get(*paths).labelmap.to_decoded().array, expected.labelmap.to_decoded().array
+            )
+
+            # Changing either segmentation invalidates its change maps.
+            image = sitk.ReadImage(paths[1])
+            sitk.WriteImage(image * 0, paths[1], useCompression=True)
+            summary = ChangeMaps(cache_dir=str(cache_dir)).get_summary(*paths)
+            assert summary.new_voxels == summary.persistent_voxels == 0
+            assert summary.resolved_voxels == expected.summary.resolved_voxels + expected.summary.persistent_voxels
+
+    def test_segmentation_dir(self):
+        with TempDir(Path(self.test_dir_path) / "test_segmentation_dir") as temp_dir_path:
+            patient_dir = self.make_patient(temp_dir_path)
+            image = sitk.ReadImage(str(patient_dir / "img_2_segmentation.nrrd"))
+            image.SetSpacing((2.0, 2.0, 2.0))
+            sitk.WriteImage(image, str(patient_dir / "img_2_segmentation.nrrd"))
+
+            segmentation_dir = SegmentationDir(patient_dir, change_maps=ChangeMaps())
+            assert segmentation_dir.index_is_valid_for_change_map(0)
+            # The segmentations of img_1 and img_2 are on different grids.
+            assert not segmentation_dir.index_is_valid_for_change_map(1)
+            assert not segmentation_dir.index_is_valid_for_change_map(2)
+            summaries = segmentation_dir.change_summaries()
+            assert list(summaries) == [0]
+            assert summaries[0] == segmentation_dir.get_change_map(0).summary
+            assert not SegmentationDir(patient_dir).index_is_valid_for_change_map(0)
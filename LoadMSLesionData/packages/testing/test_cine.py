@@ -0,0 +1,94 @@
+from concurrent.futures import wait
+import inspect
+import logging
+import threading
+from packages.loading.cine import CinePlayer
+from packages.testing.utils import *
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.time = 0.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class CinePlayerTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def tick_when_decoded(self, player: CinePlayer) -> None:
+        wait(list(player.position_to_future.values()))
+        player.on_tick()
+
+    def test_loops_and_decodes_once(self):
+        decoded, shown = [], []
+        decode_lock = threading.Lock()
+
+        def decode_frame(index):
+            with decode_lock:
+                decoded.append(index)
+            return f"frame {index}"
+
+        player = CinePlayer([0, 1, 2], decode_frame, lambda index, frame: shown.append((index, frame)), buffer_size=4)
+        player.start(1)
+        for _ in range(5):
+            self.tick_when_decoded(player)
+        player.shutdown()
+        assert [index for index, _ in shown] == [1, 2, 0, 1, 2]
+        assert shown[0][1] == "frame 1"
+        # The whole series fits in the buffer, so it is decoded only once.
+        assert sorted(decoded) == [0, 1, 2]
+
+    def test_bounded_buffer(self):
+        shown = []
+        player = CinePlayer(list(range(10)), lambda index: index, lambda index, frame: shown.append(index), buffer_size=3)
+        player.start()
+        for _ in range(12):
+            assert len(player.position_to_future) <= 3
+            self.tick_when_decoded(player)
+        player.shutdown()
+        assert shown == list(range(10)) + [0, 1]
+
+    def test_dropped_frames(self):
+        clock = FakeClock()
+        decoding = threading.Event()
+        shown = []
+
+        def decode_frame(index):
+            decoding.wait()
+            return index
+
+        player = CinePlayer([0, 1], decode_frame, lambda index, frame: shown.append(index), fps=10, clock=clock)
+        player.start()
+        for _ in range(5):
+            clock.time += 0.1
+            player.on_tick()
+        # Decoding could not keep up, so the frames were held rather than skipped.
+        assert shown == []
+        stats = player.stats()
+        assert stats.frames_shown == 0 and stats.frames_dropped == 5
+
+        decoding.set()
+        clock.time += 0.1
+        self.tick_when_decoded(player)
+        stats = player.stats()
+        assert shown == [0]
+        assert stats.frames_shown == 1 and stats.frames_dropped == 5
+        assert abs(stats.achieved_fps - 1 / 0.6) < 1e-6
+        player.shutdown()
+
+    def test_invalid_fps(self):
+        try:
+            CinePlayer([0], lambda index: index, lambda index, frame: None, fps=0)
+        except ValueError:
+            return
+        raise TestFailedError()
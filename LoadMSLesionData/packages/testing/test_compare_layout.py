@@ -0,0 +1,36 @@
+import inspect
+import logging
+import xml.etree.ElementTree as ET
+import numpy as np
+from packages.loading.compare_layout import compare_layout_description, compare_view_name, grids_match
+from packages.testing.utils import *
+
+
+class CompareLayoutTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_layout_description(self):
+        layout = ET.fromstring(compare_layout_description(3))
+        views = layout.findall("./item/view")
+        assert layout.get("type") == "horizontal"
+        assert [view.get("singletontag") for view in views] == [compare_view_name(position) for position in range(3)]
+        # One view group, so that the views can be linked.
+        groups = {view.find("./property[@name='viewgroup']").text for view in views}
+        assert len(groups) == 1
+
+    def test_grids_match(self):
+        ijk_to_ras = np.diag([0.5, 0.5, 3.0, 1.0])
+        shifted = ijk_to_ras.copy()
+        shifted[:3, 3] = [0, 0, 1.5]
+        assert grids_match([((64, 64, 20), ijk_to_ras)])
+        assert grids_match([((64, 64, 20), ijk_to_ras), ((64, 64, 20), ijk_to_ras + 1e-5)])
+        assert not grids_match([((64, 64, 20), ijk_to_ras), ((64, 64, 21), ijk_to_ras)])
+        assert not grids_match([((64, 64, 20), ijk_to_ras), ((64, 64, 20), shifted)])
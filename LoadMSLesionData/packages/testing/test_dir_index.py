@@ -0,0 +1,112 @@
+import inspect
+import logging
+from pathlib import Path
+from packages.segmentation.dir_index import DirectoryIndex
+from packages.segmentation.file_types import FileType, file_type_to_name
+from packages.segmentation.segmentation import SegmentationDir
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class DirectoryIndexTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def create_files(self, dir_path, names) -> None:
+        [open(Path(dir_path) / name, "w").close() for name in names]
+
+    def test_missing_dir(self):
+        try:
+            DirectoryIndex(Path(self.test_dir_path) / "test_missing_dir")
+        except FileNotFoundError:
+            return
+        raise TestFailedError()
+
+    def test_parse_name(self):
+        assert DirectoryIndex.parse_name("img_0.nii.gz") == (FileType.IMG, 0)
+        assert DirectoryIndex.parse_name("img_12_segmentation.nrrd") == (FileType.IMG_SEGMENTATION, 12)
+        assert DirectoryIndex.parse_name("img_sub_3.nii.gz") == (FileType.SUB_IMG, 3)
+        assert DirectoryIndex.parse_name("img_sub_3_segmentation.nrrd") == (FileType.SUB_IMG_SEGMENTATION, 3)
+        assert DirectoryIndex.parse_name("img_01.nii.gz") is None
+        assert DirectoryIndex.parse_name("img_1.nii") is None
+        assert DirectoryIndex.parse_name("notes.txt") is None
+
+    def test_paths(self):
+        with TempDir(Path(self.test_dir_path) / "test_paths") as temp_dir_path:
+            self.create_files(temp_dir_path, ["img_0.nii.gz", "img_0_segmentation.nrrd", "img_1.nii.gz", "notes.txt"])
+            dir_index = DirectoryIndex(temp_dir_path)
+            assert dir_index.get_path(FileType.IMG, 1) == str(Path(temp_dir_path) / file_type_to_name(FileType.IMG, 1))
+            assert dir_index.indices(FileType.IMG) == [0, 1]
+            assert dir_index.indices(FileType.SUB_IMG) == []
+            try:
+                dir_index.get_path(FileType.IMG_SEGMENTATION, 1)
+            except FileNotFoundError:
+                return
+            raise TestFailedError()
+
+    def test_gaps_and_orphans(self):
+        with TempDir(Path(self.test_dir_path) / "test_gaps_and_orphans") as temp_dir_path:
+            self.create_files(temp_dir_path, [
+                "img_0.nii.gz", "img_0_segmentation.nrrd",
+                "img_2.nii.gz", "img_2_segmentation.nrrd",
+                "img_3.nii.gz",
+                "img_sub_2.nii.gz",
+                "img_sub_5.nii.gz",
+                "img_sub_6_segmentation.nrrd",
+            ])
+            dir_index = DirectoryIndex(temp_dir_path)
+            assert dir_index.gaps(FileType.IMG) == [1]
+            assert dir_index.gaps(FileType.SUB_IMG) == [0, 1, 3, 4]
+            assert dir_index.orphans() == [
+                (FileType.IMG, 3),
+                (FileType.SUB_IMG, 5),
+                (FileType.SUB_IMG_SEGMENTATION, 6),
+            ]
+
+    def test_rescan(self):
+        with TempDir(Path(self.test_dir_path) / "test_rescan") as temp_dir_path:
+            self.create_files(temp_dir_path, ["img_0.nii.gz", "img_0_segmentation.nrrd", "img_1.nii.gz"])
+            dir_index = DirectoryIndex(temp_dir_path)
+            assert not dir_index.rescan()
+
+            self.create_files(temp_dir_path, ["img_1_segmentation.nrrd"])
+            (Path(temp_dir_path) / "img_1.nii.gz").unlink()
+            with open(Path(temp_dir_path) / "img_0.nii.gz", "w") as f:
+                f.write("rewritten")
+            changes = dir_index.rescan()
+            assert changes.added == [(FileType.IMG_SEGMENTATION, 1)]
+            assert changes.removed == [(FileType.IMG, 1)]
+            assert changes.modified == [(FileType.IMG, 0)]
+            assert changes.stale_paths == {
+                str(Path(temp_dir_path) / "img_1.nii.gz"), str(Path(temp_dir_path) / "img_0.nii.gz")
+            }
+
+            # A listing made on another thread, e.g. of an object store, is only applied by rescan.
+            self.create_files(temp_dir_path, ["img_1.nii.gz"])
+            listing = dir_index.list_files()
+            assert not dir_index.has(FileType.IMG, 1)
+            assert dir_index.rescan(listing).added == [(FileType.IMG, 1)]
+            assert dir_index.has(FileType.IMG, 1)
+
+    def test_segmentation_dir_rescan(self):
+        with TempDir(Path(self.test_dir_path) / "test_segmentation_dir_rescan") as temp_dir_path:
+            self.create_files(temp_dir_path, ["img_0.nii.gz", "img_0_segmentation.nrrd"])
+            segmentation_dir = SegmentationDir(temp_dir_path)
+            assert not segmentation_dir.index_is_valid_for_img(1)
+
+            # A timepoint that is still being written is left out rather than making the directory invalid.
+            self.create_files(temp_dir_path, ["img_1.nii.gz"])
+            assert segmentation_dir.rescan()
+            assert not segmentation_dir.index_is_valid_for_img(1)
+
+            self.create_files(temp_dir_path, ["img_1_segmentation.nrrd", "img_sub_0.nii.gz", "img_sub_0_segmentation.nrrd"])
+            assert segmentation_dir.rescan()
+            assert segmentation_dir.index_is_valid_for_img(1)
+            assert segmentation_dir.index_is_valid_for_sub_img(0)
@@ -0,0 +1,83 @@
+import inspect
+import json
+import logging
+from pathlib import Path
+import numpy as np
+import SimpleITK as sitk
+from packages.batch.export import CohortExport, ExportConfig, export_patient, extract_slice, get_slice_axes
+from packages.batch.prewarm import CacheDirs, find_patient_dirs
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.segmentation.file_types import View
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class ExportTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_slice_axes(self):
+        # An LPS-ordered volume as written by most scanners: i goes to the left, j to posterior, k to superior.
+        ijk_to_ras = np.diag([-1.0, -1.0, 2.0, 1.0])
+        array = np.arange(4 * 5 * 6).reshape(4, 5, 6)
+        slice_axis, column, row = get_slice_axes(ijk_to_ras, "axial")
+        assert slice_axis == 0
+        # Left is on the right of the image, and anterior at the top.
+        assert column == (2, False) and row == (1, False)
+        slice_axis, column, row = get_slice_axes(ijk_to_ras, "coronal")
+        coronal = extract_slice(array, np.array([1.0, 1.0, 2.0]), slice_axis, 0.0, column, row)
+        # k slices are twice as thick, so each is shown as two rows, superior at the top.
+        assert coronal.shape == (8, 6)
+        assert np.array_equal(coronal[0], array[3, 0]) and np.array_equal(coronal[1], array[3, 0])
+
+    def test_export_patient(self):
+        with TempDir(Path(self.test_dir_path) / "test_export_patient") as temp_dir_path:
+            patient_dir = Path(temp_dir_path) / "patient_a"
+            make_synthetic_patient(patient_dir, SyntheticPatientConfig(shape=(16, 32, 32), timepoints=3))
+            out_dir = Path(temp_dir_path) / "export"
+            config = ExportConfig(orientations=("axial", "sagittal"), slice_positions=(0.25, 0.5), camera_directions=())
+            result = export_patient(str(patient_dir), str(out_dir), CacheDirs(), config)
+            assert result.error is None, result.error
+
+            assert [(frame.view, frame.index) for frame in result.frames] == [
+                (View.STANDARD.name, 0), (View.STANDARD.name, 1), (View.STANDARD.name, 2),
+                (View.SUB.name, 0), (View.SUB.name, 1)
+            ]
+            for frame in result.frames:
+                assert len(frame.images) == 4
+                for image in frame.images:
+                    assert sitk.ReadImage(str(out_dir / image)).GetNumberOfComponentsPerPixel() == 3
+            assert "img_1_axial_50.png" in result.frames[1].images
+            # Changes are counted from the previous timepoint.
+            assert not result.frames[0].changes
+            assert sum(result.frames[1].changes.values()) > 0
+
+            with open(out_dir / "report.json") as f:
+                report = json.load(f)
+            assert len(report["frames"]) == 5
+            assert "img_sub_1_sagittal_25.png" in (out_dir / "report.html").read_text()
+
+    def test_not_a_patient_folder(self):
+        with TempDir(Path(self.test_dir_path) / "test_not_a_patient_folder") as temp_dir_path:
+            root_dir = Path(temp_dir_path) / "cohort"
+            make_synthetic_patient(root_dir / "patient_a", SyntheticPatientConfig(shape=(8, 16, 16), timepoints=2))
+            (root_dir / "notes").mkdir()
+            out_dir = Path(temp_dir_path) / "export"
+            config = ExportConfig(orientations=("axial",), slice_positions=(0.5,), camera_directions=())
+
+            # As done by the worker processes of export_cohort, for every subfolder of the cohort.
+            report = CohortExport([
+                export_patient(dir_path, str(out_dir / Path(dir_path).name), CacheDirs(), config)
+                for dir_path in find_patient_dirs(str(root_dir))
+            ])
+            assert [Path(result.dir_path).name for result in report.failures] == ["notes"]
+            assert report.failures[0].error.startswith("InvalidSegmentationDirError")
+            assert report.results[1].error is None and len(report.results[1].frames) == 3
+            assert report.summary().startswith("Exported 1/2 patients")
@@ -0,0 +1,55 @@
+import inspect
+import logging
+import numpy as np
+from packages.loading.decode import DecodedVolume
+from packages.statistics.lesion_statistics import compute_lesion_statistics, LesionStatistics
+from packages.testing.utils import *
+
+
+class LesionStatisticsTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_empty_segmentation(self):
+        statistics = compute_lesion_statistics(DecodedVolume(np.zeros((4, 5, 6), dtype=np.uint8), np.eye(4)))
+        assert statistics.lesion_count == 0
+        assert statistics.total_volume_ml == 0
+
+    def test_lesions(self):
+        labelmap = np.zeros((10, 20, 30), dtype=np.uint8)
+        labelmap[1:3, 2:4, 5:9] = 1
+        # A second segment counts as lesion voxels too.
+        labelmap[7, 15, 20] = 2
+        ijk_to_ras = np.diag([0.5, 1.0, 2.0, 1.0])
+        ijk_to_ras[:3, 3] = [10, 0, 0]
+
+        statistics = compute_lesion_statistics(DecodedVolume(labelmap, ijk_to_ras))
+        assert statistics.lesion_count == 2
+        lesions = sorted(statistics.lesions, key=lambda lesion: lesion.voxel_count)
+        assert lesions[0].voxel_count == 1
+        assert np.allclose(lesions[0].centroid_ras, (20.0, 15.0, 14.0))
+        assert lesions[1].voxel_count == 16
+        assert np.isclose(lesions[1].volume_ml, 16 * 0.5 * 1.0 * 2.0 / 1000)
+        assert np.allclose(lesions[1].centroid_ras, (13.25, 2.5, 3.0))
+        assert lesions[1].bbox_min_ijk == (5, 2, 1)
+        assert lesions[1].bbox_max_ijk == (8, 3, 2)
+
+    def test_diagonal_connectivity(self):
+        labelmap = np.zeros((3, 3, 3), dtype=np.uint8)
+        labelmap[0, 0, 0] = 1
+        labelmap[1, 1, 1] = 1
+        assert compute_lesion_statistics(DecodedVolume(labelmap, np.eye(4)), fully_connected=True).lesion_count == 1
+        assert compute_lesion_statistics(DecodedVolume(labelmap, np.eye(4)), fully_connected=False).lesion_count == 2
+
+    def test_serialization(self):
+        labelmap = np.zeros((4, 4, 4), dtype=np.uint8)
+        labelmap[1:3, 1:3, 1:3] = 1
+        statistics = compute_lesion_statistics(DecodedVolume(labelmap, np.eye(4)))
+        assert LesionStatistics.from_dict(statistics.to_dict()) == statistics
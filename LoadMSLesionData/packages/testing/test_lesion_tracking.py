@@ -0,0 +1,62 @@
+import inspect
+import logging
+import numpy as np
+from packages.loading.decode import DecodedVolume
+from packages.statistics.lesion_statistics import compute_lesion_statistics
+from packages.statistics.lesion_tracking import LesionStatus, match_lesions
+from packages.statistics.spatial_index import BoxIndex
+from packages.testing.utils import *
+
+
+class LesionTrackingTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_box_index(self):
+        box_index = BoxIndex(
+            mins=[[0, 0, 0], [10, 10, 10], [5, 0, 0]],
+            maxs=[[2, 2, 2], [12, 12, 12], [6, 1, 1]],
+        )
+        assert sorted(box_index.query(np.array([1, 1, 1]), np.array([5, 5, 5]))) == [0, 2]
+        assert list(box_index.query(np.array([11, 11, 11]), np.array([20, 20, 20]))) == [1]
+        assert len(box_index.query(np.array([3, 3, 3]), np.array([4, 4, 4]))) == 0
+
+    def test_match_lesions(self):
+        previous = np.zeros((20, 20, 20), dtype=np.uint8)
+        current = np.zeros((20, 20, 20), dtype=np.uint8)
+        # Stable lesion.
+        previous[2:4, 2:4, 2:4] = 1
+        current[2:4, 2:4, 2:4] = 1
+        # Enlarging lesion.
+        previous[10, 10, 10] = 1
+        current[9:12, 9:12, 9:12] = 1
+        # Resolved lesion.
+        previous[2, 16, 16] = 1
+        # New lesion.
+        current[16, 2, 16] = 1
+
+        changes = match_lesions(
+            compute_lesion_statistics(DecodedVolume(previous, np.eye(4))),
+            compute_lesion_statistics(DecodedVolume(current, np.eye(4))),
+            index=1,
+            tolerance_mm=0.0,
+        )
+        status_to_count = {status: 0 for status in LesionStatus}
+        for change in changes:
+            status_to_count[change.status] += 1
+        assert status_to_count == {
+            LesionStatus.NEW: 1,
+            LesionStatus.ENLARGING: 1,
+            LesionStatus.SHRINKING: 0,
+            LesionStatus.STABLE: 1,
+            LesionStatus.RESOLVED: 1,
+        }
+        resolved = next(change for change in changes if change.status == LesionStatus.RESOLVED)
+        assert resolved.index == 0
@@ -0,0 +1,99 @@
+import inspect
+import logging
+from pathlib import Path
+import slicer
+import vtk
+from packages.cache.surface_cache import (
+    DetailLevel, SurfaceCache, build_detail_levels, closed_surface_name, count_triangles, decimate_surface
+)
+from packages.loading.level_of_detail import LevelOfDetail
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+DETAIL_LEVELS = (DetailLevel(0.75, 10), DetailLevel(0.95, 20))
+
+
+def make_sphere(resolution: int):
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(resolution)
+    sphere.SetPhiResolution(resolution)
+    sphere.Update()
+    return sphere.GetOutput()
+
+
+class LevelOfDetailTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_decimate_surface(self):
+        surface = make_sphere(64)
+        surfaces = build_detail_levels(surface, DETAIL_LEVELS)
+        triangles = [count_triangles(level_surface) for level_surface in surfaces]
+        assert surfaces[0] is surface
+        assert triangles[0] > triangles[1] > triangles[2] > 0, triangles
+        assert triangles[1] <= 0.3 * triangles[0], triangles
+        assert surfaces[2].GetPointData().GetNormals() is not None
+
+    def test_small_surface_kept(self):
+        surface = make_sphere(4)
+        assert count_triangles(surface) < 64
+        assert decimate_surface(surface, DetailLevel(0.95)) is surface
+
+    def test_surface_cache_levels(self):
+        with TempDir(Path(self.test_dir_path) / "test_surface_cache_levels") as temp_dir_path:
+            surface_cache = SurfaceCache(temp_dir_path)
+            surfaces = build_detail_levels(make_sphere(32), DETAIL_LEVELS)
+            surface_cache.save("key", {1: surfaces})
+            loaded = surface_cache.load("key")
+            assert list(loaded) == [1]
+            assert [count_triangles(surface) for surface in loaded[1]] == [
+                count_triangles(surface) for surface in surfaces
+            ]
+
+    def add_segmentation_node(self, surfaces: list):
+        seg_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
+        seg_node.CreateDefaultDisplayNodes()
+        segment_id = seg_node.GetSegmentation().AddEmptySegment("lesion")
+        seg_node.GetSegmentation().GetSegment(segment_id).AddRepresentation(closed_surface_name(), surfaces[0])
+        return seg_node, segment_id
+
+    def shown_triangles(self, seg_node, segment_id) -> int:
+        segment = seg_node.GetSegmentation().GetSegment(segment_id)
+        return count_triangles(segment.GetRepresentation(closed_surface_name()))
+
+    def test_level_switching(self):
+        surfaces = build_detail_levels(make_sphere(64), DETAIL_LEVELS)
+        triangles = [count_triangles(surface) for surface in surfaces]
+        # Two visible surfaces only fit in the budget at the second level.
+        level_of_detail = LevelOfDetail(DETAIL_LEVELS, interactive_triangle_budget=2 * triangles[1])
+        nodes = []
+        try:
+            for visible in (True, True, False):
+                seg_node, segment_id = self.add_segmentation_node(surfaces)
+                seg_node.SetDisplayVisibility(visible)
+                level_of_detail.add(seg_node, {segment_id: surfaces})
+                nodes.append((seg_node, segment_id))
+
+            level_of_detail.on_interaction_started()
+            assert [self.shown_triangles(*node) for node in nodes] == [triangles[1], triangles[1], triangles[0]]
+            level_of_detail.restore_full_detail()
+            assert [self.shown_triangles(*node) for node in nodes] == [triangles[0]] * 3
+
+            report = level_of_detail.report()
+            assert [level_report.triangles for level_report in report] == [3 * count for count in triangles]
+            assert report[0].memory_bytes > report[2].memory_bytes > 0
+
+            # Surfaces of nodes removed from the scene are forgotten.
+            slicer.mrmlScene.RemoveNode(nodes.pop()[0])
+            assert level_of_detail.report()[0].triangles == 2 * triangles[0]
+        finally:
+            level_of_detail.shutdown()
+            for seg_node, _ in nodes:
+                slicer.mrmlScene.RemoveNode(seg_node)
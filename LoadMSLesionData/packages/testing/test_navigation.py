@@ -0,0 +1,71 @@
+import inspect
+import logging
+from packages.loading.navigation import NavigationScheduler
+from packages.testing.utils import *
+
+
+class NavigationSchedulerTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_coalesces_requests(self):
+        target = {"index": 0}
+        loaded = []
+        scheduler = NavigationScheduler(lambda: loaded.append(target["index"]))
+        for index in range(1, 11):
+            target["index"] = index
+            scheduler.request()
+        scheduler.flush()
+        assert loaded == [10]
+        assert scheduler.requests == 10 and scheduler.runs == 1
+
+    def test_request_while_loading(self):
+        loaded = []
+
+        def load():
+            loaded.append(len(loaded))
+            if len(loaded) == 1:
+                # E.g. load changing the parameter node itself.
+                scheduler.request()
+                assert scheduler.is_superseded()
+
+        scheduler = NavigationScheduler(load)
+        scheduler.request()
+        scheduler.flush()
+        assert loaded == [0, 1]
+        assert not scheduler.pending
+
+    def test_cancel(self):
+        loaded = []
+        scheduler = NavigationScheduler(lambda: loaded.append(True))
+        scheduler.request()
+        scheduler.cancel()
+        scheduler.flush()
+        assert loaded == []
+
+    def test_cancel_while_loading(self):
+        running = []
+        superseded = []
+
+        def load():
+            # E.g. the scene being closed from the events handled by is_superseded().
+            scheduler.cancel()
+            superseded.append(scheduler.is_superseded())
+
+        scheduler = NavigationScheduler(load, on_running_changed=running.append)
+        scheduler.request()
+        scheduler.flush()
+        assert superseded == [True]
+        assert running == [True, False]
+        # A later load is not cancelled.
+        scheduler.load = lambda: superseded.append(scheduler.is_superseded())
+        scheduler.request()
+        scheduler.flush()
+        assert superseded == [True, False]
@@ -0,0 +1,111 @@
+import inspect
+import logging
+import numpy as np
+import slicer
+from packages.cache.node_cache import NodeCache, node_nbytes
+from packages.segmentation.file_types import FileType
+from packages.testing.utils import *
+
+
+class NodeCacheTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_node_removed_from_scene(self):
+        node_cache = NodeCache()
+        try:
+            node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+            key = (FileType.IMG, 0)
+            node_cache.put(key, node)
+            assert node_cache.peek(key) is node
+
+            slicer.mrmlScene.RemoveNode(node)
+            assert key not in node_cache.key_to_node_id
+            assert node_cache.node_id_to_key == {}
+        finally:
+            node_cache.clear()
+            node_cache.close()
+
+    def test_replace_node(self):
+        node_cache = NodeCache()
+        try:
+            key = (FileType.IMG, 0)
+            first_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+            second_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+            node_cache.put(key, first_node)
+            node_cache.put(key, second_node)
+            # Removing the node that was replaced leaves the key alone.
+            slicer.mrmlScene.RemoveNode(first_node)
+            assert node_cache.peek(key) is second_node
+        finally:
+            node_cache.clear()
+            node_cache.close()
+
+    def add_volume_nodes(self, node_cache: NodeCache, count: int) -> list:
+        nodes = []
+        for index in range(count):
+            node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+            slicer.util.updateVolumeFromArray(node, np.zeros((10, 100, 100), dtype=np.uint8))
+            node_cache.put((FileType.IMG, index), node)
+            nodes.append(node)
+        return nodes
+
+    def test_evicts_least_recently_viewed(self):
+        node_cache = NodeCache()
+        try:
+            nodes = self.add_volume_nodes(node_cache, 3)
+            nbytes = node_nbytes(nodes[0])
+            assert nbytes > 0
+            node_cache.budget_bytes = 2 * nbytes + nbytes // 2
+            # img_0 is viewed again, so img_1 is now the least recently viewed.
+            assert node_cache.get((FileType.IMG, 0)) is nodes[0]
+
+            node_cache.evict()
+            assert list(node_cache.key_to_node_id) == [(FileType.IMG, 2), (FileType.IMG, 0)]
+            assert slicer.mrmlScene.GetNodeByID(nodes[1].GetID()) is None
+            assert node_cache.usage_bytes() <= node_cache.budget_bytes
+        finally:
+            node_cache.clear()
+            node_cache.close()
+
+    def test_protected_keys(self):
+        node_cache = NodeCache()
+        try:
+            nodes = self.add_volume_nodes(node_cache, 3)
+            nbytes = node_nbytes(nodes[0])
+            # Even over budget, the nodes that are shown are kept.
+            node_cache.budget_bytes = nbytes // 2
+            protected_keys = {(FileType.IMG, 0), (FileType.IMG, 2)}
+            node_cache.evict(protected_keys)
+            assert set(node_cache.key_to_node_id) == protected_keys
+            assert node_cache.usage_bytes() == 2 * nbytes
+        finally:
+            node_cache.clear()
+            node_cache.close()
+
+    def test_stats(self):
+        node_cache = NodeCache()
+        try:
+            nodes = self.add_volume_nodes(node_cache, 2)
+            node_cache.get((FileType.IMG, 0))
+            node_cache.get((FileType.IMG, 1))
+            node_cache.get((FileType.IMG, 2))
+            # Peeking is not a view of the node.
+            node_cache.peek((FileType.IMG, 0))
+            assert node_cache.stats() == {
+                "usage_bytes": 2 * node_nbytes(nodes[0]),
+                "budget_bytes": node_cache.budget_bytes,
+                "nodes": 2,
+                "hits": 2,
+                "misses": 1,
+            }
+        finally:
+            node_cache.clear()
+            node_cache.close()
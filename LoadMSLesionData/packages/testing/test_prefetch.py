@@ -0,0 +1,141 @@
+import inspect
+import logging
+import threading
+import numpy as np
+from packages.loading.decode import DecodedVolume
+from packages.loading.prefetch import Prefetcher
+from packages.segmentation.file_types import FileType, View
+from packages.testing.utils import *
+
+
+class FakeSegmentationDir:
+    """The parts of SegmentationDir used by Prefetcher, with decodes that wait until released."""
+
+    def __init__(self, timepoints: int, sub_indices=(), loaded=()) -> None:
+        self.timepoints = timepoints
+        self.sub_indices = set(sub_indices)
+        self.loaded = set(loaded)
+        self.release = threading.Event()
+        self.started = []
+
+    def index_is_valid_for_img(self, index: int) -> bool:
+        return 0 <= index < self.timepoints
+
+    def index_is_valid_for_sub_img(self, index: int) -> bool:
+        return index in self.sub_indices
+
+    def node_exists(self, file_type: FileType, index: int) -> bool:
+        return (file_type, index) in self.loaded
+
+    def get_path(self, file_type: FileType, index: int) -> str:
+        return f"{file_type.name}_{index}"
+
+    def decode_file(self, key: tuple[FileType, int], path: str) -> DecodedVolume:
+        self.started.append(path)
+        assert self.release.wait(timeout=10)
+        if key[0] == FileType.SUB_IMG:
+            raise OSError("Unreadable")
+        return DecodedVolume(np.full((2, 2, 2), key[1]), np.eye(4))
+
+
+class PrefetchTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_targets(self):
+        segmentation_dir = FakeSegmentationDir(5, sub_indices=(0, 1, 2), loaded=[(FileType.IMG, 3)])
+        prefetcher = Prefetcher(radius=2)
+        try:
+            assert prefetcher.get_targets(segmentation_dir, View.STANDARD, 2) == [
+                (FileType.IMG_SEGMENTATION, 3), (FileType.IMG, 1), (FileType.IMG_SEGMENTATION, 1),
+                (FileType.IMG, 4), (FileType.IMG_SEGMENTATION, 4), (FileType.IMG, 0), (FileType.IMG_SEGMENTATION, 0),
+                (FileType.SUB_IMG, 1), (FileType.SUB_IMG_SEGMENTATION, 1),
+            ]
+            # No subtraction image before the first timepoint, and none past the last one.
+            assert prefetcher.get_targets(segmentation_dir, View.STANDARD, 0) == [
+                (FileType.IMG, 1), (FileType.IMG_SEGMENTATION, 1), (FileType.IMG, 2), (FileType.IMG_SEGMENTATION, 2),
+            ]
+            # The subtraction and change views return to the standard view of index + 1, so it comes first.
+            assert prefetcher.get_targets(segmentation_dir, View.SUB, 0) == [
+                (FileType.IMG, 1), (FileType.IMG_SEGMENTATION, 1), (FileType.IMG, 2), (FileType.IMG_SEGMENTATION, 2),
+                (FileType.IMG, 0), (FileType.IMG_SEGMENTATION, 0), (FileType.IMG_SEGMENTATION, 3),
+            ]
+            # img_4 is shown under the change map from img_3 to img_4.
+            assert prefetcher.get_targets(segmentation_dir, View.CHANGE, 3) == [
+                (FileType.IMG_SEGMENTATION, 4), (FileType.IMG_SEGMENTATION, 3), (FileType.IMG, 2),
+                (FileType.IMG_SEGMENTATION, 2),
+            ]
+        finally:
+            prefetcher.shutdown()
+
+    def test_stale_work_cancelled(self):
+        segmentation_dir = FakeSegmentationDir(10)
+        prefetcher = Prefetcher(radius=1, max_workers=1)
+        try:
+            prefetcher.prefetch_around(segmentation_dir, View.STANDARD, 1)
+            assert set(prefetcher.path_to_future) == {
+                "IMG_0", "IMG_SEGMENTATION_0", "IMG_2", "IMG_SEGMENTATION_2"
+            }
+            futures = dict(prefetcher.path_to_future)
+
+            # After jumping away, the decodes that did not start are cancelled, and the one running is dropped.
+            prefetcher.prefetch_around(segmentation_dir, View.STANDARD, 7)
+            assert set(prefetcher.path_to_future) == {
+                "IMG_6", "IMG_SEGMENTATION_6", "IMG_8", "IMG_SEGMENTATION_8"
+            }
+            assert all(future.cancelled() for path, future in futures.items() if path != "IMG_2")
+            segmentation_dir.release.set()
+            prefetcher.path_to_future["IMG_8"].result()
+            assert prefetcher.take("IMG_8").array[0, 0, 0] == 8
+            assert "IMG_0" not in segmentation_dir.started
+        finally:
+            prefetcher.shutdown()
+
+    def test_take(self):
+        segmentation_dir = FakeSegmentationDir(3, sub_indices=(0, 1))
+        prefetcher = Prefetcher(radius=1, max_workers=1)
+        try:
+            prefetcher.prefetch(segmentation_dir, [
+                (FileType.IMG, 0), (FileType.SUB_IMG, 0), (FileType.IMG, 2), (FileType.SUB_IMG, 1)
+            ])
+            assert not prefetcher.is_ready("IMG_0")
+            prefetcher.discard(["IMG_2"])
+            # Decodes that did not start are cancelled when taken, as loading directly is as fast.
+            assert prefetcher.take("SUB_IMG_0") is None
+            assert prefetcher.take("IMG_2") is None
+
+            segmentation_dir.release.set()
+            prefetcher.path_to_future["IMG_0"].result()
+            assert prefetcher.is_ready("IMG_0")
+            assert prefetcher.take("IMG_0").array[0, 0, 0] == 0
+            # Taken only once, and never requested.
+            assert prefetcher.take("IMG_0") is None and prefetcher.take("IMG_1") is None
+            # Failed decodes fall back to a synchronous load.
+            prefetcher.path_to_future["SUB_IMG_1"].exception()
+            assert prefetcher.take("SUB_IMG_1") is None
+            assert "IMG_2" not in segmentation_dir.started and "SUB_IMG_0" not in segmentation_dir.started
+        finally:
+            prefetcher.shutdown()
+
+    def test_reset(self):
+        segmentation_dir = FakeSegmentationDir(5)
+        prefetcher = Prefetcher(radius=2, max_workers=1)
+        try:
+            prefetcher.prefetch_around(segmentation_dir, View.STANDARD, 2)
+            futures = list(prefetcher.path_to_future.values())
+            # E.g. when another directory is loaded.
+            prefetcher.reset()
+            assert prefetcher.path_to_future == {}
+            # Only the decode already running, if any, is not cancelled.
+            assert sum(future.cancelled() for future in futures) >= len(futures) - 1
+            segmentation_dir.release.set()
+            assert prefetcher.take("IMG_3") is None
+        finally:
+            prefetcher.shutdown()
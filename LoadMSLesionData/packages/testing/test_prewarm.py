@@ -0,0 +1,114 @@
+import inspect
+import logging
+import multiprocessing.spawn
+import os
+from pathlib import Path
+from packages.batch.prewarm import CacheDirs, CohortReport, PatientResult, find_patient_dirs, prewarm_patient, run_patients
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.cache.pyramid_cache import PyramidCache
+from packages.cache.volume_cache import VolumeCache
+from packages.segmentation.segmentation import SegmentationDir
+from packages.segmentation.subtraction import SubtractionImages
+from packages.statistics.lesion_statistics import LesionStatisticsEngine
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+def prewarm_or_crash(dir_path: str) -> PatientResult:
+    """Run in a worker process: exits it without a result for "crash", as a crash in native code would."""
+    if dir_path == "crash":
+        os._exit(1)
+    if dir_path == "raise":
+        raise ValueError("Unexpected")
+    return PatientResult(dir_path, timepoints=1)
+
+
+class PrewarmTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def get_cache_dirs(self, dir_path: Path) -> CacheDirs:
+        # Surfaces are left out, since building them needs Slicer's segmentation converters.
+        return CacheDirs(
+            volumes=str(dir_path / "volumes"),
+            statistics=str(dir_path / "statistics"),
+            pyramids=str(dir_path / "pyramids"),
+            subtractions=str(dir_path / "subtractions"),
+        )
+
+    def test_prewarm_patient(self):
+        with TempDir(Path(self.test_dir_path) / "test_prewarm_patient") as temp_dir_path:
+            root_dir = Path(temp_dir_path) / "cohort"
+            patient_dir = make_synthetic_patient(
+                root_dir / "patient_a", SyntheticPatientConfig(shape=(8, 32, 32), timepoints=3)
+            )
+            (root_dir / "notes").mkdir()
+            cache_dirs = self.get_cache_dirs(Path(temp_dir_path) / "cache")
+
+            # As done by the worker processes of prewarm_cohort, for every subfolder of the cohort.
+            report = CohortReport([prewarm_patient(dir_path, cache_dirs) for dir_path in find_patient_dirs(root_dir)])
+            report.seconds = 1.0
+            assert [Path(result.dir_path).name for result in report.failures] == ["notes"]
+            assert report.failures[0].error.startswith("InvalidSegmentationDirError")
+            result = report.results[1]
+            assert result.error is None and result.timepoints == 3
+            assert result.bytes_read == sum(
+                os.path.getsize(path) for path in patient_dir.iterdir() if path.name.endswith((".nii.gz", ".nrrd"))
+            )
+            assert report.bytes_per_second == result.bytes_read
+            assert report.summary().startswith("Prewarmed 1/2 patients")
+
+            segmentation_dir = SegmentationDir(patient_dir)
+            volume_cache = VolumeCache(cache_dirs.volumes)
+            pyramid_cache = PyramidCache(cache_dirs.pyramids)
+            statistics_engine = LesionStatisticsEngine(cache_dirs.statistics)
+            for path in list(segmentation_dir.imgs_paths.values()) + list(segmentation_dir.sub_imgs_paths.values()):
+                assert volume_cache.load(path) is not None
+                assert pyramid_cache.has(path)
+            for path in segmentation_dir.imgs_segmentations_paths.values():
+                assert pyramid_cache.has(path)
+                assert statistics_engine.get_cached(path) is not None
+
+    def test_synthesized_subtraction_images(self):
+        with TempDir(Path(self.test_dir_path) / "test_synthesized_subtraction_images") as temp_dir_path:
+            patient_dir = make_synthetic_patient(
+                Path(temp_dir_path) / "patient",
+                SyntheticPatientConfig(shape=(8, 32, 32), timepoints=3, with_sub_imgs=False)
+            )
+            cache_dirs = self.get_cache_dirs(Path(temp_dir_path) / "cache")
+            result = prewarm_patient(str(patient_dir), cache_dirs)
+            assert result.error is None, result.error
+
+            # Compare is ready for every pair of consecutive timepoints without computing anything.
+            subtraction_images = SubtractionImages(cache_dir=cache_dirs.subtractions)
+            subtraction_images.compute = None
+            segmentation_dir = SegmentationDir(patient_dir, subtraction_images=subtraction_images)
+            assert sorted(segmentation_dir.sub_imgs_paths) == [0, 1]
+            for index in segmentation_dir.sub_imgs_paths:
+                assert segmentation_dir.synthesize_sub_img(index).array.shape == (8, 32, 32)
+
+    def test_failed_workers(self):
+        executable = multiprocessing.spawn.get_executable()
+        results = []
+        run_patients(
+            prewarm_or_crash,
+            [("patient_a",), ("raise",), ("crash",)],
+            lambda job, error: PatientResult(job[0], error=error),
+            lambda done, total, result: results.append((done, total, result)),
+            max_workers=1,
+            initializer=None,
+        )
+        # Every patient is reported, including those after the pool broke.
+        assert [(done, total) for done, total, _ in results] == [(1, 3), (2, 3), (3, 3)]
+        dir_path_to_result = {result.dir_path: result for _, _, result in results}
+        assert dir_path_to_result["patient_a"].error is None
+        assert dir_path_to_result["raise"].error == "ValueError: Unexpected"
+        assert dir_path_to_result["crash"].error.startswith("BrokenProcessPool")
+        assert multiprocessing.spawn.get_executable() == executable
@@ -0,0 +1,51 @@
+import inspect
+import json
+import logging
+import os
+import threading
+from packages.profiling.profiler import Profiler
+from packages.testing.utils import *
+
+
+class ProfilerTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.span("outer"):
+            profiler.count("counter")
+        assert profiler.summary() == {}
+        assert profiler.chrome_trace()["traceEvents"] == []
+
+    def test_nested_spans(self):
+        profiler = Profiler(enabled=True)
+        with profiler.span("outer"):
+            for _ in range(3):
+                with profiler.span("inner", index=1):
+                    profiler.count("counter")
+        thread = threading.Thread(target=lambda: profiler.span("worker").__enter__().__exit__(None, None, None))
+        thread.start()
+        thread.join()
+
+        summary = profiler.summary()
+        assert summary["outer"].count == 1
+        assert summary["inner"].count == 3
+        assert summary["worker"].count == 1
+        assert summary["outer"].self_ns == summary["outer"].total_ns - summary["inner"].total_ns
+        assert "counter" in profiler.format_summary()
+
+        trace_path = os.path.join(self.test_dir_path, "trace.json")
+        profiler.export_chrome_trace(trace_path)
+        with open(trace_path) as f:
+            trace_events = json.load(f)["traceEvents"]
+        assert sorted(event["name"] for event in trace_events if event["ph"] == "X") == ["inner"] * 3 + ["outer", "worker"]
+        assert [event["args"]["value"] for event in trace_events if event["ph"] == "C"] == [1, 2, 3]
+        assert len({event["tid"] for event in trace_events if event["ph"] == "X"}) == 2
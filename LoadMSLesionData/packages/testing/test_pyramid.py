@@ -0,0 +1,57 @@
+import inspect
+import logging
+import os
+import numpy as np
+from packages.cache.pyramid_cache import PyramidCache, block_reduce, build_pyramid
+from packages.loading.decode import DecodedVolume, SegmentInfo
+from packages.testing.utils import *
+
+
+class PyramidTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_block_reduce(self):
+        array = np.arange(4 * 4 * 6, dtype=np.float32).reshape(4, 4, 6)
+        reduced = block_reduce(array, (2, 2, 2), labelmap=False)
+        assert reduced.shape == (2, 2, 3)
+        assert np.isclose(reduced[1, 0, 2], array[2:4, 0:2, 4:6].mean())
+
+        labelmap = np.zeros((5, 5, 5), dtype=np.uint8)
+        labelmap[4, 4, 4] = 3
+        reduced = block_reduce(labelmap, (2, 2, 2), labelmap=True)
+        assert reduced.shape == (3, 3, 3)
+        assert reduced[2, 2, 2] == 3 and reduced.sum() == 3
+
+    def test_pyramid_geometry(self):
+        ijk_to_ras = np.diag([0.5, 1.0, 2.0, 1.0])
+        ijk_to_ras[:3, 3] = [10, 20, 30]
+        levels = build_pyramid(DecodedVolume(np.zeros((8, 8, 8), dtype=np.int16), ijk_to_ras), labelmap=False)
+        assert levels[4].array.shape == (2, 2, 2)
+        assert np.allclose(levels[4].spacing, (2.0, 4.0, 8.0))
+        # Voxel (0, 0, 0) of the level is at the centre of the first 4x4x4 block.
+        assert np.allclose(levels[4].ijk_to_ras[:3, 3], [10 + 0.5 * 1.5, 20 + 1.0 * 1.5, 30 + 2.0 * 1.5])
+
+    def test_pyramid_cache(self):
+        source_path = os.path.join(self.test_dir_path, "img_0_segmentation.nrrd")
+        with open(source_path, "w") as f:
+            f.write("source")
+        pyramid_cache = PyramidCache(os.path.join(self.test_dir_path, "pyramids"))
+        labelmap = np.zeros((8, 8, 8), dtype=np.uint8)
+        labelmap[1, 1, 1] = 1
+        pyramid_cache.save(source_path, DecodedVolume(labelmap, np.eye(4), [SegmentInfo(1, "Lesion", (1.0, 0.0, 0.0))]), labelmap=True)
+
+        preview = pyramid_cache.load(source_path, 4)
+        assert preview.array.shape == (2, 2, 2) and preview.array[0, 0, 0] == 1
+        assert preview.segments[0].name == "Lesion"
+
+        with open(source_path, "w") as f:
+            f.write("rewritten")
+        assert pyramid_cache.load(source_path, 4) is None
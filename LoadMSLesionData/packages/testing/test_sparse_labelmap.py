@@ -0,0 +1,56 @@
+import inspect
+import logging
+import numpy as np
+from packages.loading.decode import DecodedVolume, SegmentInfo
+from packages.loading.sparse_labelmap import CompressionStats, SparseLabelmap, to_dense
+from packages.testing.utils import *
+
+
+class SparseLabelmapTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_round_trip(self):
+        array = np.zeros((40, 64, 64), dtype=np.uint8)
+        array[10:14, 20:25, 30:33] = 1
+        array[12, 40, 41] = 2
+        array[30:32, 5:7, 50:60] = 1
+        segments = [SegmentInfo(1, "Lesion", (1.0, 0.0, 0.0))]
+        decoded = DecodedVolume(array, np.diag([1.0, 1.0, 3.0, 1.0]), segments)
+
+        sparse_labelmap = SparseLabelmap.from_decoded(decoded)
+        assert sparse_labelmap.bbox_min == (10, 5, 30)
+        assert sparse_labelmap.bbox_max == (32, 41, 60)
+        assert list(sparse_labelmap.label_values) == [1, 2]
+        assert sparse_labelmap.nbytes * 10 < sparse_labelmap.dense_nbytes
+
+        expanded = to_dense(sparse_labelmap)
+        assert expanded.array.dtype == array.dtype
+        assert np.array_equal(expanded.array, array)
+        assert np.array_equal(expanded.ijk_to_ras, decoded.ijk_to_ras)
+        assert expanded.segments == segments
+        assert to_dense(decoded) is decoded
+
+    def test_empty(self):
+        array = np.zeros((4, 5, 6), dtype=np.int16)
+        sparse_labelmap = SparseLabelmap.from_decoded(DecodedVolume(array, np.eye(4)))
+        assert sparse_labelmap.crop_shape == (0, 0, 0)
+        assert np.array_equal(sparse_labelmap.to_decoded().array, array)
+
+    def test_compression_stats(self):
+        stats = CompressionStats()
+        assert stats.ratio is None
+        array = np.zeros((16, 16, 16), dtype=np.uint8)
+        array[:8] = 1
+        sparse_labelmap = SparseLabelmap.from_decoded(DecodedVolume(array, np.eye(4)))
+        stats.add(sparse_labelmap)
+        assert stats.dense_bytes == 16 ** 3
+        assert stats.compact_bytes == sparse_labelmap.nbytes
+        assert np.isclose(stats.ratio, 16 ** 3 / sparse_labelmap.nbytes)
@@ -0,0 +1,83 @@
+import importlib.util
+import inspect
+import logging
+from pathlib import Path
+import sys
+import time
+from packages.testing.utils import *
+
+# LoadMSLesionData.py is imported at every Slicer startup, so it may only load these modules of the package.
+# Anything else must be imported where it is first used.
+STARTUP_MODULES = {
+    "packages",
+    "packages.utils",
+    "packages.utils.context_managers",
+    "packages.utils.utils",
+    "packages.segmentation",
+    "packages.segmentation.file_types",
+    "packages.loading",
+    "packages.loading.navigation",
+    "packages.profiling",
+    "packages.profiling.profiler",
+}
+STARTUP_BUDGET_SECONDS = 0.25
+MODULE_PATH = Path(__file__).parent.parent.parent / "LoadMSLesionData.py"
+
+
+def is_package_module(name: str) -> bool:
+    return name == "packages" or name.startswith("packages.")
+
+
+def import_fresh(after_import=None) -> tuple[float, set[str]]:
+    """
+    Imports LoadMSLesionData.py as Slicer does at startup, with no module of the package loaded yet, and calls
+    after_import(module) if given. Returns the import time and the modules of the package loaded by then.
+    sys.modules is restored afterwards.
+    """
+    saved_modules = {name: module for name, module in sys.modules.items() if is_package_module(name)}
+    for name in saved_modules:
+        del sys.modules[name]
+    try:
+        spec = importlib.util.spec_from_file_location("LoadMSLesionDataStartupCheck", MODULE_PATH)
+        module = importlib.util.module_from_spec(spec)
+        start = time.perf_counter()
+        spec.loader.exec_module(module)
+        seconds = time.perf_counter() - start
+        if after_import is not None:
+            after_import(module)
+        loaded = {name for name in sys.modules if is_package_module(name)}
+    finally:
+        for name in [name for name in sys.modules if is_package_module(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved_modules)
+    return seconds, loaded
+
+
+class StartupTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_startup_modules(self):
+        _, loaded = import_fresh()
+        assert loaded <= STARTUP_MODULES, f"Loaded at startup: {sorted(loaded - STARTUP_MODULES)}"
+
+    def test_startup_budget(self):
+        # The best of a few imports, so that a busy machine does not fail the test.
+        seconds = min(import_fresh()[0] for _ in range(3))
+        logging.info(f"LoadMSLesionData.py imports in {seconds * 1000:.1f} ms")
+        assert seconds < STARTUP_BUDGET_SECONDS, f"Importing took {seconds:.3f} s"
+
+    def test_logic_is_lazy(self):
+        def create_logic(module):
+            logic = module.LoadMSLesionDataLogic()
+            assert not logic.initialized
+
+        _, loaded = import_fresh(create_logic)
+        assert loaded <= STARTUP_MODULES, f"Loaded by the logic: {sorted(loaded - STARTUP_MODULES)}"
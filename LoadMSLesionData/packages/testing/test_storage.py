@@ -0,0 +1,193 @@
+import inspect
+import logging
+import os
+from pathlib import Path
+import numpy as np
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.loading.decode import read_labelmap, read_volume
+from packages.segmentation.file_types import FileType
+from packages.segmentation.segmentation import SegmentationDir
+from packages.statistics.lesion_statistics import LesionStatisticsEngine
+from packages.storage.object_store import ObjectStoreStorage, parse_object_store_url
+from packages.storage.object_store_standin import ObjectStoreStandIn
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+from packages.utils.utils import KIBIBYTE
+
+
+class StorageTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def make_bucket(self, temp_dir_path) -> Path:
+        """A bucket "cohort" holding one patient folder, served from temp_dir_path/store."""
+        patient_dir = Path(temp_dir_path) / "store" / "cohort" / "patients" / "patient_a"
+        make_synthetic_patient(patient_dir, SyntheticPatientConfig(shape=(16, 32, 32), timepoints=3))
+        return patient_dir
+
+    def open_storage(self, standin: ObjectStoreStandIn, temp_dir_path, **kwargs) -> ObjectStoreStorage:
+        return ObjectStoreStorage(
+            standin.endpoint, "cohort", Path(temp_dir_path) / "cache", block_size=4 * KIBIBYTE, max_workers=4, **kwargs
+        )
+
+    def test_parse_url(self):
+        assert parse_object_store_url("https://host:9000/bucket/a/b/") == ("https://host:9000", "bucket", "a/b")
+        try:
+            parse_object_store_url("https://host")
+        except ValueError:
+            pass
+        else:
+            raise TestFailedError("A URL without a bucket was accepted")
+
+    def test_listing_and_headers(self):
+        with TempDir(Path(self.test_dir_path) / "test_listing_and_headers") as temp_dir_path:
+            patient_dir = self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store") as standin:
+                storage = self.open_storage(standin, temp_dir_path)
+                url = f"{standin.endpoint}/cohort/patients/patient_a"
+                segmentation_dir = SegmentationDir(storage.local_dir(url), storage=storage)
+                assert standin.requests == 1, "The directory was not listed in one request"
+                assert segmentation_dir.location == url
+                assert sorted(segmentation_dir.imgs_paths) == [0, 1, 2]
+                local_dir = SegmentationDir(str(patient_dir))
+                assert sorted(
+                    (Path(path).name, size) for path, (size, _) in segmentation_dir.dir_index.stats.items()
+                ) == sorted((Path(path).name, size) for path, (size, _) in local_dir.dir_index.stats.items())
+
+                report = segmentation_dir.validate_headers()
+                assert report.is_valid, report.summary()
+                total_bytes = sum(size for size, _ in local_dir.dir_index.stats.values())
+                # Only the first block of each file is read for its header.
+                assert standin.bytes_sent < total_bytes / 2
+                assert standin.connections <= 5
+                storage.shutdown()
+
+    def test_fetch_and_cache(self):
+        with TempDir(Path(self.test_dir_path) / "test_fetch_and_cache") as temp_dir_path:
+            patient_dir = self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store") as standin:
+                storage = self.open_storage(standin, temp_dir_path)
+                url = f"{standin.endpoint}/cohort/patients/patient_a"
+                segmentation_dir = SegmentationDir(storage.local_dir(url), storage=storage)
+                path = segmentation_dir.get_path(FileType.IMG, 1)
+                decoded = segmentation_dir.decode_file((FileType.IMG, 1), path)
+                assert np.array_equal(decoded.array, read_volume(str(patient_dir / "img_1.nii.gz")).array)
+                assert os.stat(path).st_mtime_ns == segmentation_dir.dir_index.stats[path][1]
+                labelmap = read_labelmap(storage.fetch(segmentation_dir.get_path(FileType.IMG_SEGMENTATION, 1)))
+                assert np.array_equal(labelmap.array, read_labelmap(str(patient_dir / "img_1_segmentation.nrrd")).array)
+
+                requests = standin.requests
+                storage.fetch(path)
+                assert standin.requests == requests, "Cached blocks were fetched again"
+                storage.shutdown()
+
+                # Fetched blocks are kept across sessions, so only the listing is requested again.
+                storage = self.open_storage(standin, temp_dir_path)
+                segmentation_dir = SegmentationDir(storage.local_dir(url), storage=storage)
+                storage.fetch(segmentation_dir.get_path(FileType.IMG, 1))
+                assert standin.requests == requests + 1
+                storage.shutdown()
+
+    def test_changed_object(self):
+        with TempDir(Path(self.test_dir_path) / "test_changed_object") as temp_dir_path:
+            patient_dir = self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store") as standin:
+                storage = self.open_storage(standin, temp_dir_path)
+                url = f"{standin.endpoint}/cohort/patients/patient_a"
+                segmentation_dir = SegmentationDir(storage.local_dir(url), storage=storage)
+                path = storage.fetch(segmentation_dir.get_path(FileType.IMG, 0))
+
+                os.replace(patient_dir / "img_2.nii.gz", patient_dir / "img_0.nii.gz")
+                changes = segmentation_dir.rescan()
+                assert (FileType.IMG, 0) in changes.modified
+                assert (FileType.IMG, 2) in changes.removed
+                storage.fetch(path)
+                assert np.array_equal(read_volume(path).array, read_volume(str(patient_dir / "img_0.nii.gz")).array)
+                storage.shutdown()
+
+    def test_paged_listing(self):
+        with TempDir(Path(self.test_dir_path) / "test_paged_listing") as temp_dir_path:
+            self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store", page_size=4) as standin:
+                storage = self.open_storage(standin, temp_dir_path)
+                segmentation_dir = SegmentationDir(
+                    storage.local_dir(f"{standin.endpoint}/cohort/patients/patient_a"), storage=storage
+                )
+                assert len(segmentation_dir.dir_index.all_paths()) == 10
+                assert standin.requests == 3
+                storage.shutdown()
+
+    def test_eviction(self):
+        with TempDir(Path(self.test_dir_path) / "test_eviction") as temp_dir_path:
+            self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store") as standin:
+                storage = self.open_storage(standin, temp_dir_path, max_bytes=1)
+                segmentation_dir = SegmentationDir(
+                    storage.local_dir(f"{standin.endpoint}/cohort/patients/patient_a"), storage=storage
+                )
+                first_path = storage.fetch(segmentation_dir.get_path(FileType.IMG, 0))
+                second_path = storage.fetch(segmentation_dir.get_path(FileType.IMG, 1))
+                # Only the object fetched last is kept over the budget.
+                assert storage.cached_bytes() == os.path.getsize(second_path)
+                assert not storage.path_to_object[first_path].blocks
+                assert os.path.getsize(first_path) == segmentation_dir.dir_index.stats[first_path][0]
+                storage.shutdown()
+
+    def test_content_id(self):
+        with TempDir(Path(self.test_dir_path) / "test_content_id") as temp_dir_path:
+            patient_dir = self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store") as standin:
+                storage = self.open_storage(standin, temp_dir_path, max_bytes=1)
+                segmentation_dir = SegmentationDir(
+                    storage.local_dir(f"{standin.endpoint}/cohort/patients/patient_a"), storage=storage
+                )
+                path = segmentation_dir.get_path(FileType.IMG_SEGMENTATION, 0)
+                content_id = storage.content_id(path)
+                assert content_id.startswith(f"{standin.endpoint}/cohort/patients/patient_a/img_0_segmentation")
+                # Known from the listing, and kept when the local copy is evicted to zeros.
+                storage.fetch(path)
+                storage.fetch(segmentation_dir.get_path(FileType.IMG_SEGMENTATION, 1))
+                assert not storage.path_to_object[path].blocks
+                assert storage.content_id(path) == content_id
+                assert storage.content_id(segmentation_dir.get_path(FileType.IMG_SEGMENTATION, 1)) != content_id
+
+                source_path = patient_dir / "img_0_segmentation.nrrd"
+                os.utime(source_path, ns=(0, os.stat(source_path).st_mtime_ns + 10**9))
+                segmentation_dir.rescan()
+                assert storage.content_id(path) != content_id
+                storage.shutdown()
+
+    def test_statistics(self):
+        with TempDir(Path(self.test_dir_path) / "test_storage_statistics") as temp_dir_path:
+            patient_dir = self.make_bucket(temp_dir_path)
+            with ObjectStoreStandIn(Path(temp_dir_path) / "store") as standin:
+                storage = self.open_storage(standin, temp_dir_path)
+                segmentation_dir = SegmentationDir(
+                    storage.local_dir(f"{standin.endpoint}/cohort/patients/patient_a"), storage=storage
+                )
+                cache_dir = str(Path(temp_dir_path) / "statistics")
+                index_to_statistics = LesionStatisticsEngine(cache_dir).get_for_segmentation_dir(segmentation_dir)
+                expected = LesionStatisticsEngine().get(str(patient_dir / "img_2_segmentation.nrrd"))
+                assert index_to_statistics[2].lesion_count == expected.lesion_count
+
+                storage.shutdown()
+
+                # Cached statistics are found by the ETag of the objects, without fetching them to a new local cache.
+                storage = self.open_storage(standin, Path(temp_dir_path) / "other")
+                segmentation_dir = SegmentationDir(
+                    storage.local_dir(f"{standin.endpoint}/cohort/patients/patient_a"), storage=storage
+                )
+                requests = standin.requests
+                statistics_engine = LesionStatisticsEngine(cache_dir)
+                assert statistics_engine.get_for_segmentation_dir(segmentation_dir)[2] == index_to_statistics[2]
+                path = segmentation_dir.imgs_segmentations_paths[0]
+                assert statistics_engine.get_cached(path, storage) == index_to_statistics[0]
+                assert standin.requests == requests, "Segmentations were fetched for cached statistics"
+                storage.shutdown()
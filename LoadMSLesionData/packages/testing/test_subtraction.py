@@ -0,0 +1,78 @@
+import inspect
+import logging
+import os
+import numpy as np
+import SimpleITK as sitk
+from packages.loading.nifti_stream import iter_nifti_slabs
+from packages.segmentation.subtraction import SubtractionImages
+from packages.testing.utils import *
+
+
+class SubtractionImagesTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def write_image(self, array: np.ndarray, name: str) -> str:
+        image = sitk.GetImageFromArray(array)
+        image.SetSpacing((0.5, 1.0, 2.0))
+        image.SetOrigin((1.0, 2.0, 3.0))
+        path = os.path.join(self.test_dir_path, name)
+        sitk.WriteImage(image, path)
+        return path
+
+    def test_stream_slabs(self):
+        array = np.arange(5 * 3 * 4, dtype=np.int16).reshape(5, 3, 4)
+        path = self.write_image(array, "stream.nii.gz")
+        slabs = list(iter_nifti_slabs(path, slab_slices=2))
+        assert [k_start for k_start, _ in slabs] == [0, 2, 4]
+        assert np.array_equal(np.concatenate([slab for _, slab in slabs]), array)
+
+    def test_subtraction(self):
+        rng = np.random.default_rng(0)
+        img = rng.integers(0, 1000, (7, 6, 5)).astype(np.int16)
+        next_img = rng.integers(0, 1000, (7, 6, 5)).astype(np.int16)
+        img_path = self.write_image(img, "img_0.nii.gz")
+        next_img_path = self.write_image(next_img, "img_1.nii.gz")
+        cache_dir = os.path.join(self.test_dir_path, "subtractions")
+
+        decoded = SubtractionImages(cache_dir=cache_dir, slab_slices=3).get(img_path, next_img_path)
+        assert np.array_equal(decoded.array, next_img.astype(np.float32) - img)
+        assert np.allclose(decoded.spacing, (0.5, 1.0, 2.0))
+
+        # A new instance reads the result back from the disk cache.
+        cached = SubtractionImages(cache_dir=cache_dir).load(SubtractionImages().get_key(img_path, next_img_path))
+        assert cached is not None
+        assert np.array_equal(cached.array, decoded.array)
+
+    def test_different_grids(self):
+        img_path = self.write_image(np.zeros((4, 4, 4), dtype=np.int16), "img_0.nii.gz")
+        next_img_path = self.write_image(np.zeros((4, 4, 5), dtype=np.int16), "img_1.nii.gz")
+        try:
+            SubtractionImages().get(img_path, next_img_path)
+        except ValueError:
+            pass
+        else:
+            assert False, "Subtracting images on different grids should fail"
+
+    def test_eviction(self):
+        rng = np.random.default_rng(1)
+        img_paths = [
+            self.write_image(rng.integers(0, 1000, (4, 4, 4)).astype(np.int16), f"evict_img_{index}.nii.gz")
+            for index in range(3)
+        ]
+        cache_dir = os.path.join(self.test_dir_path, "evicted_subtractions")
+        result_bytes = 4 * 4 * 4 * np.dtype(np.float32).itemsize
+        subtraction_images = SubtractionImages(cache_dir=cache_dir, max_in_memory=0, max_bytes=result_bytes)
+        first_key = subtraction_images.get_key(img_paths[0], img_paths[1])
+        subtraction_images.get(img_paths[0], img_paths[1])
+        subtraction_images.get(img_paths[1], img_paths[2])
+        assert subtraction_images.usage_bytes() <= result_bytes
+        assert subtraction_images.load(first_key) is None
+        assert subtraction_images.load(subtraction_images.get_key(img_paths[1], img_paths[2])) is not None
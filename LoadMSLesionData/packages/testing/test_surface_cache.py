@@ -0,0 +1,61 @@
+import inspect
+import logging
+from pathlib import Path
+import vtk
+from packages.cache.surface_cache import SurfaceCache, count_triangles
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class SurfaceCacheTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def test_key(self):
+        with TempDir(Path(self.test_dir_path) / "test_surface_cache_key") as temp_dir_path:
+            surface_cache = SurfaceCache(str(Path(temp_dir_path) / "cache"))
+            source_path = Path(temp_dir_path) / "img_0_segmentation.nrrd"
+            source_path.write_bytes(b"labelmap")
+            key = surface_cache.get_key(str(source_path), "Decimation factor=0.0")
+            assert surface_cache.get_key(str(source_path), "Decimation factor=0.0") == key
+            # Other conversion parameters give other surfaces.
+            assert surface_cache.get_key(str(source_path), "Decimation factor=0.5") != key
+
+            # Keyed by content: a copy shares the entry, and a rewritten file does not.
+            copy_path = Path(temp_dir_path) / "copy.nrrd"
+            copy_path.write_bytes(b"labelmap")
+            assert surface_cache.get_key(str(copy_path), "Decimation factor=0.0") == key
+            source_path.write_bytes(b"labelmaq")
+            assert surface_cache.get_key(str(source_path), "Decimation factor=0.0") != key
+
+            # Files in an object store are keyed by their identity there, not by the content of their local copy.
+            content_id = "https://host/bucket/img_0_segmentation.nrrd|etag"
+            key = surface_cache.get_key(str(source_path), "Decimation factor=0.0", content_id=content_id)
+            source_path.write_bytes(bytes(8))
+            assert surface_cache.get_key(str(source_path), "Decimation factor=0.0", content_id=content_id) == key
+            assert surface_cache.get_key(str(copy_path), "Decimation factor=0.0", content_id=content_id + "2") != key
+
+    def test_round_trip(self):
+        with TempDir(Path(self.test_dir_path) / "test_surface_cache_round_trip") as temp_dir_path:
+            surface_cache = SurfaceCache(str(Path(temp_dir_path) / "cache"))
+            assert surface_cache.load("key") is None
+
+            sphere = vtk.vtkSphereSource()
+            sphere.SetThetaResolution(16)
+            sphere.SetPhiResolution(16)
+            sphere.Update()
+            surface = sphere.GetOutput()
+            surface_cache.save("key", {1: [surface], 3: [surface]})
+
+            loaded = surface_cache.load("key")
+            assert sorted(loaded) == [1, 3]
+            assert count_triangles(loaded[3][0]) == count_triangles(surface)
+            assert loaded[3][0].GetNumberOfPoints() == surface.GetNumberOfPoints()
+            assert SurfaceCache(str(Path(temp_dir_path) / "cache")).load("other key") is None
@@ -0,0 +1,61 @@
+import inspect
+import logging
+from pathlib import Path
+import SimpleITK as sitk
+from packages.benchmark.synthetic import SyntheticPatientConfig, make_synthetic_patient
+from packages.segmentation.file_types import FileType
+from packages.segmentation.segmentation import SegmentationDir
+from packages.segmentation.validation import IssueKind, validate_cohort
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class ValidationTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def make_patient(self, dir_path) -> Path:
+        return make_synthetic_patient(dir_path, SyntheticPatientConfig(shape=(8, 16, 16), timepoints=3))
+
+    def test_consistent(self):
+        with TempDir(Path(self.test_dir_path) / "test_consistent") as temp_dir_path:
+            report = SegmentationDir(self.make_patient(temp_dir_path)).validate_headers()
+            assert report.is_valid, report.summary()
+            assert len(report.headers) == 10
+            assert report.headers[(FileType.IMG, 0)].shape == (8, 16, 16)
+
+    def test_mismatches(self):
+        with TempDir(Path(self.test_dir_path) / "test_mismatches") as temp_dir_path:
+            patient_dir = self.make_patient(temp_dir_path)
+            image = sitk.ReadImage(str(patient_dir / "img_1_segmentation.nrrd"))
+            image.SetSpacing((2.0, 2.0, 2.0))
+            sitk.WriteImage(image, str(patient_dir / "img_1_segmentation.nrrd"))
+            image = sitk.ReadImage(str(patient_dir / "img_2.nii.gz"))
+            sitk.WriteImage(image[:, :, :4], str(patient_dir / "img_2.nii.gz"))
+            open(patient_dir / "img_sub_0.nii.gz", "w").close()
+
+            report = SegmentationDir(patient_dir).validate_headers()
+            kind_to_keys = {}
+            for issue in report.issues:
+                kind_to_keys.setdefault(issue.kind, []).append(issue.keys)
+            assert kind_to_keys[IssueKind.SPACING_MISMATCH] == [((FileType.IMG, 1), (FileType.IMG_SEGMENTATION, 1))]
+            assert sorted(kind_to_keys[IssueKind.SHAPE_MISMATCH]) == sorted([
+                ((FileType.IMG, 2), (FileType.IMG_SEGMENTATION, 2)), ((FileType.IMG, 1), (FileType.IMG, 2))
+            ])
+            assert kind_to_keys[IssueKind.UNREADABLE_HEADER] == [((FileType.SUB_IMG, 0),)]
+
+    def test_cohort(self):
+        with TempDir(Path(self.test_dir_path) / "test_cohort") as temp_dir_path:
+            valid_dir = self.make_patient(Path(temp_dir_path) / "valid")
+            invalid_dir = Path(temp_dir_path) / "invalid"
+            invalid_dir.mkdir()
+            reports = validate_cohort([str(valid_dir), str(invalid_dir)], max_workers=4)
+            assert reports[0].is_valid
+            assert [issue.kind for issue in reports[1].issues] == [IssueKind.INVALID_DIRECTORY]
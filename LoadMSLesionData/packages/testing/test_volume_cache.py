@@ -0,0 +1,92 @@
+import inspect
+import logging
+import os
+from pathlib import Path
+import numpy as np
+import SimpleITK as sitk
+from packages.cache.volume_cache import VolumeCache
+from packages.loading.decode import read_volume
+from packages.testing.utils import *
+from packages.utils.context_managers import TempDir
+
+
+class VolumeCacheTest:
+    def __init__(self, test_dir_path: str) -> None:
+        self.test_dir_path = test_dir_path
+
+    def runTest(self):
+        for method_name, method in inspect.getmembers(self, predicate=inspect.ismethod):
+            if not method_name.startswith("test_"):
+                continue
+            method()
+            logging.debug(f"Completed: {method_name}")
+
+    def write_volume(self, path: Path, shape=(4, 5, 6), seed: int = 0) -> Path:
+        array = np.random.default_rng(seed).integers(0, 1000, size=shape).astype(np.int16)
+        image = sitk.GetImageFromArray(array)
+        image.SetSpacing((0.5, 1.5, 3.0))
+        image.SetOrigin((10.0, -20.0, 5.0))
+        image.SetDirection((0.0, 1.0, 0.0, -1.0, 0.0, 0.0, 0.0, 0.0, 1.0))
+        # Uncompressed, so that volumes of the same shape have the same file size.
+        sitk.WriteImage(image, str(path))
+        return path
+
+    def test_round_trip(self):
+        with TempDir(Path(self.test_dir_path) / "test_round_trip") as temp_dir_path:
+            source_path = self.write_volume(Path(temp_dir_path) / "img_0.nii")
+            volume_cache = VolumeCache(str(Path(temp_dir_path) / "cache"))
+            expected = read_volume(source_path)
+            assert volume_cache.load(source_path) is None
+
+            volume_cache.read(source_path)
+            cached = volume_cache.load(source_path)
+            assert isinstance(cached.array, np.memmap)
+            assert cached.array.dtype == expected.array.dtype
+            assert np.array_equal(cached.array, expected.array)
+            # The spacing and direction are both part of the IJK to RAS matrix.
+            assert np.allclose(cached.ijk_to_ras, expected.ijk_to_ras)
+            assert np.allclose(np.linalg.norm(cached.ijk_to_ras[:3, :3], axis=0), (0.5, 1.5, 3.0))
+
+    def test_invalidation(self):
+        with TempDir(Path(self.test_dir_path) / "test_invalidation") as temp_dir_path:
+            source_path = self.write_volume(Path(temp_dir_path) / "img_0.nii")
+            volume_cache = VolumeCache(str(Path(temp_dir_path) / "cache"))
+            volume_cache.read(source_path)
+
+            # Touched without changing its content: the entry is kept.
+            stat = os.stat(source_path)
+            os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert volume_cache.load(source_path) is not None
+
+            # Same size, but different content: the content hash is checked since the mtime changed.
+            self.write_volume(source_path, seed=1)
+            assert os.stat(source_path).st_size == stat.st_size
+            os.utime(source_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+            assert volume_cache.load(source_path) is None
+            assert np.array_equal(volume_cache.read(source_path).array, read_volume(source_path).array)
+
+            # Different size.
+            self.write_volume(source_path, shape=(4, 5, 7))
+            assert volume_cache.load(source_path) is None
+            assert volume_cache.read(source_path).array.shape == (4, 5, 7)
+            assert volume_cache.load(source_path).array.shape == (4, 5, 7)
+
+    def test_eviction(self):
+        with TempDir(Path(self.test_dir_path) / "test_eviction") as temp_dir_path:
+            source_paths = [
+                self.write_volume(Path(temp_dir_path) / f"img_{index}.nii", seed=index) for index in range(3)
+            ]
+            volume_bytes = read_volume(source_paths[0]).array.nbytes
+            volume_cache = VolumeCache(str(Path(temp_dir_path) / "cache"), max_bytes=2 * volume_bytes)
+            for age, source_path in enumerate(source_paths[:2]):
+                volume_cache.read(source_path)
+                # Older entries are used less recently.
+                _, raw_path = volume_cache.get_entry_paths(source_path)
+                mtime = os.stat(raw_path).st_mtime - 100 + age
+                os.utime(raw_path, (mtime, mtime))
+
+            volume_cache.read(source_paths[2])
+            assert volume_cache.usage_bytes() <= volume_cache.max_bytes
+            assert volume_cache.load(source_paths[0]) is None
+            assert volume_cache.load(source_paths[1]) is not None
+            assert volume_cache.load(source_paths[2]) is not None
@@ -0,0 +1,13 @@
+import hashlib
+
+KIBIBYTE = 1024
+MEBIBYTE = 1024 * KIBIBYTE
+HASH_CHUNK_BYTES = MEBIBYTE
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()